@@ -19,47 +19,392 @@ import subprocess
 import shutil
 import os
 import sys
-
-from Bio.Blast import NCBIXML
-from Bio.Blast.Applications import NcbiblastnCommandline
-from Bio.Blast.Applications import NcbitblastnCommandline
-from Bio.Blast.Applications import NcbitblastxCommandline
+import threading
 
 import SeqFindr.util
+import SeqFindr.dbcache
+
+# Columns requested from BLAST in tabular (outfmt 7) mode. The comment lines
+# of outfmt 7 also carry the full query definition line (# Query: ...)
+TABULAR_FIELDS = ['qseqid', 'sseqid', 'length', 'nident', 'qlen', 'gaps',
+                  'evalue', 'stitle']
+TABULAR_OUTFMT = '7 ' + ' '.join(TABULAR_FIELDS)
+
+_BLAST_VERSION = None
+
+# XML BLAST results without any query
+EMPTY_XML = """<?xml version="1.0"?>
+<!DOCTYPE BlastOutput PUBLIC "-//NCBI//NCBI BlastOutput/EN" \
+"http://www.ncbi.nlm.nih.gov/dtd/NCBI_BlastOutput.dtd">
+<BlastOutput>
+  <BlastOutput_program>blastn</BlastOutput_program>
+  <BlastOutput_version>BLASTN none</BlastOutput_version>
+  <BlastOutput_reference>SeqFindr prefilter</BlastOutput_reference>
+  <BlastOutput_db></BlastOutput_db>
+  <BlastOutput_query-ID></BlastOutput_query-ID>
+  <BlastOutput_query-def></BlastOutput_query-def>
+  <BlastOutput_query-len>0</BlastOutput_query-len>
+  <BlastOutput_param>
+    <Parameters>
+      <Parameters_expect>10</Parameters_expect>
+    </Parameters>
+  </BlastOutput_param>
+  <BlastOutput_iterations>
+  </BlastOutput_iterations>
+</BlastOutput>
+"""
+
+
+def blast_version():
+    """
+    The version of the installed BLAST (makeblastdb)
+
+    Only determined once per process.
+
+    :rtype: string
+    """
+    global _BLAST_VERSION
+    if _BLAST_VERSION is None:
+        proc = subprocess.Popen(["makeblastdb", "-version"],
+                                stdout=subprocess.PIPE, close_fds=True)
+        _BLAST_VERSION = proc.communicate()[0].split('\n')[0].strip()
+    return _BLAST_VERSION
+
+
+def feed_fasta(fasta_file, pipe):
+    """
+    Stream a (possibly compressed) FASTA file into a pipe & close it
+
+    A pipe closed early (i.e. makeblastdb failed) is not an error here, the
+    caller sees the failed process.
+
+    :param fasta_file: full path to a fasta file
+    :param pipe: a writable file object i.e. a process stdin
+    """
+    try:
+        with SeqFindr.util.open_fasta(fasta_file) as fin:
+            shutil.copyfileobj(fin, pipe, 1 << 20)
+    except IOError:
+        pass
+    finally:
+        try:
+            pipe.close()
+        except IOError:
+            pass
+
+
+def log_output(pipe, out=None):
+    """
+    Copy the output of a process to STDERR line by line as it is produced
+
+    Output is never held back (or collected in memory) until the process
+    ends, so a process with a lot to say can't fill its pipe & stall.
+
+    :param pipe: a readable file object i.e. a process stdout
+    :param out: the file object to copy to (default = None, sys.stderr)
+    """
+    if out is None:
+        out = sys.stderr
+    for line in iter(pipe.readline, ''):
+        out.write(line)
+    pipe.close()
+
+
+def run_command_line(command, stdin=None):
+    """
+    Run a Biopython command line (i.e. NcbiblastnCommandline) & wait for it
+
+    Like calling the command line object but the process doesn't inherit
+    the open files of SeqFindr. A search started while another thread feeds
+    makeblastdb (see build_BLAST_database()) would otherwise hold the
+    makeblastdb stdin open & makeblastdb would wait for the search to end.
+
+    :param command: the command line object (or string)
+    :param stdin: the text to pass to the process STDIN (default = None)
+
+    :returns: a tuple of the process STDOUT & STDERR
+    """
+    from Bio.Application import ApplicationError
+    proc = subprocess.Popen(str(command), shell=True, close_fds=True,
+                            stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                            stderr=subprocess.PIPE, universal_newlines=True)
+    stdout, stderr = proc.communicate(stdin)
+    if proc.returncode:
+        raise ApplicationError(proc.returncode, str(command), stdout, stderr)
+    return stdout, stderr
 
 
-def make_BLAST_database(fasta_file):
+def build_BLAST_database(fasta_file, db_prefix, db_cache=None):
+    """
+    Run makeblastdb on fasta_file writing the database files to db_prefix
+
+    If a db_cache is given an up to date cached database is linked into
+    place instead & freshly built databases are added to the cache.
+
+    :param fasta_file: full path to a fasta file
+    :param db_prefix: the database path i.e. DBs/strain.fa
+    :param db_cache: a SeqFindr.dbcache.DatabaseCache (default = None)
+
+    :type fasta_file: string
+    :type db_prefix: string
+    :type db_cache: SeqFindr.dbcache.DatabaseCache
+
+    :returns: True if the database came from the cache
+
+    :raises: subprocess.CalledProcessError if makeblastdb fails
+    """
+    key = None
+    if db_cache is not None:
+        key = db_cache.key(fasta_file, blast_version())
+        if db_cache.fetch(key, db_prefix):
+            sys.stderr.write("Using cached database for %s\n" % (fasta_file))
+            return True
+    # Write straight to db_prefix (never next to the input which may be
+    # shared with a concurrent run)
+    if SeqFindr.util.is_compressed(fasta_file):
+        # Decompressed on the fly into makeblastdb (no temporary copy)
+        title = os.path.basename(SeqFindr.util.uncompressed_name(fasta_file))
+        proc = subprocess.Popen(["makeblastdb", "-in", "-", "-title", title,
+                                 "-dbtype", 'nucl', "-out", db_prefix],
+                                stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                close_fds=True)
+        feeder = threading.Thread(target=feed_fasta,
+                                  args=(fasta_file, proc.stdin))
+        feeder.daemon = True
+        feeder.start()
+        log_output(proc.stdout)
+        feeder.join()
+    else:
+        proc = subprocess.Popen(["makeblastdb", "-in", fasta_file, "-dbtype",
+                                 'nucl', "-out", db_prefix],
+                                stdout=subprocess.PIPE, close_fds=True)
+        log_output(proc.stdout)
+    proc.wait()
+    if proc.returncode:
+        # Never leave (or cache) a partial database
+        for ext in SeqFindr.dbcache.DB_EXTS:
+            if os.path.lexists(db_prefix+ext):
+                os.remove(db_prefix+ext)
+        raise subprocess.CalledProcessError(proc.returncode,
+                                            "makeblastdb %s" % (fasta_file))
+    if key is not None:
+        db_cache.store(key, db_prefix)
+    return False
+
+
+def make_BLAST_database(fasta_file, db_cache=None, out_dir=None):
     """
     Given a fasta_file, generate a nucleotide BLAST database
 
-    Database will end up in DB/ of working directory or OUTPUT/DB if an
-    output directory is given in the arguments
+    Database will end up in DBs/ of the output directory. A gzip (or
+    bgzip) compressed fasta_file is streamed into makeblastdb & linked (not
+    decompressed) into DBs/
 
     :param fasta_file: full path to a fasta file
+    :param db_cache: a SeqFindr.dbcache.DatabaseCache. Unchanged genomes
+                     reuse the cached database & the fasta file is linked
+                     rather than copied (default = None)
+    :param out_dir: the SeqFindr output directory (default = None, the
+                    working directory)
     :type fasta_file: string
+    :type db_cache: SeqFindr.dbcache.DatabaseCache
+    :type out_dir: string
 
     :rtype: the strain id **(must be delimited by '_')**
     """
-    proc = subprocess.Popen(["makeblastdb", "-in", fasta_file, "-dbtype",
-                             'nucl'], stdout=subprocess.PIPE)
-    sys.stderr.write(proc.stdout.read())
-    for file_ext in ['.nhr', '.nin', '.nsq']:
-        path = fasta_file + file_ext
-        shutil.move(path, os.path.join('DBs', os.path.basename(path)))
+    name = os.path.basename(SeqFindr.util.uncompressed_name(fasta_file))
+    target = os.path.join(out_dir or '', 'DBs', name)
+    build_BLAST_database(fasta_file, target, db_cache)
     sys.stderr.write(("Getting %s and assocaiated database files to the DBs "
                       "location\n") % (fasta_file))
-    shutil.copy2(fasta_file, os.path.join('DBs', os.path.basename(fasta_file)))
-    return os.path.basename(fasta_file).split('_')[0]
+    if SeqFindr.util.is_compressed(fasta_file):
+        SeqFindr.dbcache.link_file(os.path.abspath(fasta_file),
+                                   target + os.path.splitext(fasta_file)[1])
+    elif db_cache is None:
+        # May be a link left by a cached run
+        if os.path.lexists(target):
+            os.remove(target)
+        shutil.copy2(fasta_file, target)
+    else:
+        SeqFindr.dbcache.link_file(os.path.abspath(fasta_file), target)
+    return SeqFindr.util.get_strain_id(fasta_file)
+
+
+def make_combined_BLAST_database(fasta_files, name='combined',
+                                 db_cache=None, out_dir=None):
+    """
+    Given a set of fasta_files, generate a single nucleotide BLAST database
+
+    Every contig header is tagged with its strain id (derived the same way
+    as make_BLAST_database) so hits can be split back into per strain rows:
+
+    >STRAINID_original header
+
+    The combined FASTA & database files end up in DBs/ of the output
+    directory. Contigs without sequence are left out & the database is not
+    built if no genome has any sequence.
+
+    :param fasta_files: a list of full paths to fasta files
+    :param name: the basename of the combined database
+    :param db_cache: a SeqFindr.dbcache.DatabaseCache (default = None)
+    :param out_dir: the SeqFindr output directory (default = None, the
+                    working directory)
+
+    :type fasta_files: list
+    :type name: string
+    :type db_cache: SeqFindr.dbcache.DatabaseCache
+    :type out_dir: string
+
+    :returns: a tuple of the full path to the combined database, the list
+              of strain ids (same order as fasta_files), a dictionary of
+              strain id to total strain length & the total number of contigs
+    """
+    combined = os.path.join(out_dir or os.getcwd(), 'DBs', name+'.fa')
+    strain_ids, strain_lengths, contigs = [], {}, 0
+    with open(combined, 'w') as fout:
+        for fasta_file in fasta_files:
+            strain_id = SeqFindr.util.get_strain_id(fasta_file)
+            if strain_id in strain_lengths:
+                sys.stderr.write("Strain id %s is not unique. Can't build a "
+                                 "combined database\n" % (strain_id))
+                sys.exit(1)
+            strain_ids.append(strain_id)
+            strain_lengths[strain_id] = 0
+            header = None
+            with SeqFindr.util.open_fasta(fasta_file) as fin:
+                for line in fin:
+                    if line.startswith('>'):
+                        header = line
+                    elif line.strip():
+                        # The header is written with the 1st sequence line
+                        if header is not None:
+                            contigs += 1
+                            fout.write('>%s_%s' % (strain_id, header[1:]))
+                            header = None
+                        strain_lengths[strain_id] += len(line.strip())
+                        fout.write(line)
+    if contigs:
+        build_BLAST_database(combined, combined, db_cache)
+    return combined, strain_ids, strain_lengths, contigs
+
+
+def query_is_protein(query, args):
+    """
+    Determine if the query sequences are protein (tblastn) or nucleotide
+
+    A decision already made for the run (args.protein, see
+    decide_query_type()) is used as is.
+
+    :param query: the fullpath to the vf.mfa
+    :param args: the arguments parsed to argparse (uses args.reftype)
+
+    :type query: string
+    :type args: argparse args (dictionary)
+
+    :rtype: boolean
+    """
+    if getattr(args, 'protein', None) is not None:
+        return args.protein
+    protein = False
+    # File type not specified, determine from the (cached) query database
+    if args.reftype is None:
+        if SeqFindr.util.get_query_database(query).protein:
+            protein = True
+            sys.stderr.write('%s is protein\n' % (query))
+    elif args.reftype == 'prot':
+        protein = True
+        sys.stderr.write('%s is protein\n' % (query))
+    return protein
+
+
+def decide_query_type(args):
+    """
+    Decide once if the queries are protein & carry it through the run
+
+    Sets args.protein so every later query_is_protein() (per genome, in
+    pool workers) skips the detection.
+
+    :param args: the arguments parsed to argparse (uses
+                 args.seqs_of_interest & args.reftype)
+
+    :returns: the updated args
+    """
+    args.protein = None
+    args.protein = query_is_protein(args.seqs_of_interest, args)
+    return args
+
+
+def search_evalue(args, protein):
+    """
+    The expect value cut-off run_BLAST() will search with
+
+    :param args: the arguments parsed to argparse
+    :param protein: whether the queries are protein
+
+    :type args: argparse args (dictionary)
+    :type protein: boolean
+
+    :rtype: float
+    """
+    if args.short and not protein and not args.tblastx:
+        return 1000
+    return args.evalue
+
+
+def results_file(query, database, args, cons_run, out_dir=None):
+    """
+    The BLAST results file of a search (see run_BLAST())
+
+    :param query: the fullpath to the vf.mfa (may be gzip compressed)
+    :param database: the full path of the databse searched
+    :param args: the arguments parsed to argparse
+    :param cons_run: part of a mapping consensus run
+    :param out_dir: the SeqFindr output directory (default = None, the
+                    working directory)
+
+    :returns: full path to BLAST_results/[cons_]DB=<query>ID=<database>
+              _blast.xml (or _blast.tsv)
+    """
+    suffix = "_blast.xml"
+    if args.outfmt == 'tabular':
+        suffix = "_blast.tsv"
+    tmp1 = os.path.splitext(
+        SeqFindr.util.uncompressed_name(query).split('/')[-1])[0]
+    tmp2 = os.path.splitext(database.split('/')[-1])[0]
+    results_dir = os.path.join(out_dir or os.getcwd(), "BLAST_results")
+    if not cons_run:
+        return os.path.join(results_dir, "DB="+tmp1+"ID="+tmp2+suffix)
+    return os.path.join(results_dir, "cons_DB="+tmp1+"ID="+tmp2+suffix)
 
 
-def run_BLAST(query, database, args, cons_run):
+def write_no_hits(outfile):
+    """
+    Write BLAST results without any query (a search that was not needed)
+
+    :param outfile: full path to the results file (see results_file())
+
+    :returns: the path of the results file
+    """
+    partial = outfile + '.tmp'
+    with open(partial, 'w') as fout:
+        if is_tabular(outfile):
+            fout.write("# BLAST processed 0 queries\n")
+        else:
+            fout.write(EMPTY_XML)
+    os.rename(partial, outfile)
+    return outfile
+
+
+def run_BLAST(query, database, args, cons_run, max_target_seqs=1,
+              dbsize=None, out_dir=None):
     """
     Given a mfa of query sequences of interest & a database, search for them.
 
     Important to note:
         * Turns dust filter off,
         * Only a single target sequence (top hit),
-        * Output in XML format as blast.xml.
+        * Output in XML format as blast.xml (or tabular, outfmt 7, as
+          blast.tsv if args.outfmt is 'tabular').
 
     # TODO: Add  evalue filtering ?
     # TODO: add task='blastn' to use blastn scoring ?
@@ -68,116 +413,357 @@ def run_BLAST(query, database, args, cons_run):
 
     .. warning:: tblastx funcationality has not been checked
 
-    :param query: the fullpath to the vf.mfa
+    :param query: the fullpath to the vf.mfa (may be gzip compressed)
     :param database: the full path of the databse to search for the vf in
     :param args: the arguments parsed to argparse
     :param cons_run: part of a mapping consensus run
+    :param max_target_seqs: the number of target sequences to report
+                            (default = 1, the top hit)
+    :param dbsize: override the effective database size (default = None,
+                   use the real size)
+    :param out_dir: the SeqFindr output directory, results are written to
+                    its BLAST_results/ (default = None, the working
+                    directory)
 
     :type query: string
     :type database: string
     :type args: argparse args (dictionary)
     :type cons_run: boolean
+    :type max_target_seqs: int
+    :type dbsize: int
+    :type out_dir: string
 
-    :returns: the path of the blast.xml file
+    :returns: the path of the blast.xml (or blast.tsv) file
     """
-    tmp1 = os.path.splitext(query.split('/')[-1])[0]
-    tmp2 = os.path.splitext(database.split('/')[-1])[0]
-    if not cons_run:
-        outfile = os.path.join("BLAST_results/",
-                               "DB="+tmp1+"ID="+tmp2+"_blast.xml")
-    else:
-        outfile = os.path.join("BLAST_results/",
-                               "cons_DB="+tmp1+"ID="+tmp2+"_blast.xml")
-    protein = False
-    # File type not specified, determine using util.is_protein()
-    if args.reftype is None:
-        if SeqFindr.util.is_protein(query) != -1:
-            protein = True
-            sys.stderr.write('%s is protein' % (query))
-    elif args.reftype == 'prot':
-        protein = True
-        sys.stderr.write('%s is protein\n' % (query))
+    outfmt = 5
+    if args.outfmt == 'tabular':
+        outfmt = TABULAR_OUTFMT
+    outfile = results_file(query, database, args, cons_run, out_dir)
+    # Written to a temporary name (renamed once complete)
+    partial = outfile + '.tmp'
+    from Bio.Blast.Applications import NcbiblastnCommandline
+    from Bio.Blast.Applications import NcbitblastnCommandline
+    from Bio.Blast.Applications import NcbitblastxCommandline
+    protein = query_is_protein(query, args)
+    query_text = None
+    if SeqFindr.util.is_compressed(query):
+        # The (small) queries are decompressed into BLAST's stdin
+        with SeqFindr.util.open_fasta(query) as fin:
+            query_text = fin.read()
+        query = '-'
     run_command = ''
+    extra = {}
+    if dbsize is not None:
+        extra['dbsize'] = dbsize
     if protein:
         sys.stderr.write('Using tblastn\n')
         run_command = NcbitblastnCommandline(query=query, seg='no',
-                    db=database, outfmt=5, num_threads=args.BLAST_THREADS,
-                    max_target_seqs=1, evalue=args.evalue, out=outfile)
+                    db=database, outfmt=outfmt, num_threads=args.BLAST_THREADS,
+                    max_target_seqs=max_target_seqs, evalue=args.evalue,
+                    out=partial, **extra)
     else:
         if args.tblastx:
             sys.stderr.write('Using tblastx\n')
             run_command = NcbitblastxCommandline(query=query, seg='no',
-                        db=database, outfmt=5, num_threads=args.BLAST_THREADS,
-                        max_target_seqs=1, evalue=args.evalue,
-                        out=outfile)
+                        db=database, outfmt=outfmt, num_threads=args.BLAST_THREADS,
+                        max_target_seqs=max_target_seqs,
+                        evalue=args.evalue, out=partial, **extra)
         else:
             sys.stderr.write('Using blastn\n')
             if args.short == False:
                 run_command = NcbiblastnCommandline(query=query, dust='no',
-                            db=database, outfmt=5,
+                            db=database, outfmt=outfmt,
                             num_threads=args.BLAST_THREADS,
-                            max_target_seqs=1, evalue=args.evalue,
-                            out=outfile)
+                            max_target_seqs=max_target_seqs,
+                            evalue=args.evalue, out=partial, **extra)
             else:
                 sys.stderr.write('Optimising for short query sequences\n')
                 run_command = NcbiblastnCommandline(query=query, dust='no',
-                            db=database, outfmt=5, word_size=7,
+                            db=database, outfmt=outfmt, word_size=7,
                             num_threads=args.BLAST_THREADS, evalue=1000,
-                            max_target_seqs=1, out=outfile)
+                            max_target_seqs=max_target_seqs, out=partial,
+                            **extra)
 
     sys.stderr.write(str(run_command)+"\n")
-    run_command()
-    return os.path.join(os.getcwd(), outfile)
+    run_command_line(run_command, query_text)
+    # Only complete results get the final name
+    os.rename(partial, outfile)
+    return outfile
 
 
-def parse_BLAST(blast_results, tol, cov, careful):
+def check_hsp(hit_name, identities, align_length, gaps, query_length, tol,
+              cov, careful, review=None):
+    """
+    Decide if a single HSP is an acceptable hit
+
+    The SeqFindr score is calculated with reference to the alignment length
+    and the alignment length must cover (query_length * cov). HSPs that fall
+    within (tol-careful) of the cutoff are presented for manual inspection
+    or, given a review list, collected for a later decision (see review)
+    and not accepted for now.
+
+    :param hit_name: the query (gene) id
+    :param identities: the number of identical positions in the HSP
+    :param align_length: the HSP alignment length
+    :param gaps: the number of gaps in the HSP
+    :param query_length: the length of the query
+    :param tol: the cutoff threshold
+    :param cov: alignement coverage cut-off
+    :param careful: manually inspect hits within (tol-careful) of tol
+    :param review: collects the (name, score, align_length, query_length,
+                   identities, gaps) of HSPs to inspect instead of asking
+                   (default = None, ask)
+
+    :type hit_name: string
+    :type identities: int
+    :type align_length: int
+    :type gaps: int
+    :type query_length: int
+    :type tol: float
+    :type cov: float
+    :type careful: float
+    :type review: list
+
+    :rtype: boolean
+    """
+    # cutoff is now calculated with reference to the alignment length
+    cutoff = identities/float(align_length)
+    # added condition that the alignment length (hsp.align_length) must be at least equal to the length of the target sequence
+    # added coverage option allowing the alignment length to be shorter than the length of the target sequence (DEFAULT=1)
+    if cutoff >= tol and (query_length * cov) <= align_length:
+        return True
+    # New method for the --careful option
+    # added condition that the alignment length (hsp.align_length) must be at least equal to the length of the target sequence
+    elif cutoff >= tol-careful and (query_length * cov) <= align_length:
+        if review is not None:
+            review.append((hit_name, cutoff, align_length, query_length,
+                           identities, gaps))
+            return False
+        print "Please confirm this hit:"
+        print "Name,SeqFindr score,Len(align),Len(query),Identities,Gaps"
+        print "%s,%f,%i,%i,%i,%i" % (hit_name, cutoff, align_length, query_length, identities, gaps)
+        accept = raw_input("Should this be considered a hit? (y/N)")
+        if accept == '':
+            pass
+        elif accept.lower() == 'n':
+            pass
+        elif accept.lower() == 'y':
+            return True
+        else:
+            print "Input must be y, n or enter."
+            print "Assuming n"
+    return False
+
+
+def is_tabular(blast_results):
+    """
+    Is a BLAST results file tabular (outfmt 7) rather than XML
+
+    :param blast_results: full path to a blast run output file
+
+    :type blast_results: string
+
+    :rtype: boolean
+    """
+    return blast_results.endswith('.tsv')
+
+
+def iter_tabular_hsps(blast_results):
+    """
+    Stream the HSPs of a tabular (outfmt 7) BLAST results file
+
+    Reads a line at a time so memory use is constant regardless of the size
+    of the results. The query definition line is taken from the '# Query:'
+    comment lines.
+
+    :param blast_results: full path to a blast run output file (outfmt 7
+                          with the TABULAR_FIELDS columns)
+
+    :type blast_results: string
+
+    :returns: a generator of (query definition, subject title, identities,
+              align_length, gaps, query_length, evalue) tuples
+    """
+    col = dict((field, idx) for idx, field in enumerate(TABULAR_FIELDS))
+    query = None
+    with open(blast_results) as fin:
+        for line in fin:
+            if line.startswith('#'):
+                if line.startswith('# Query:'):
+                    query = line[len('# Query:'):].strip()
+                continue
+            fields = line.rstrip('\n').split('\t')
+            if len(fields) < len(TABULAR_FIELDS):
+                continue
+            yield (query, fields[col['stitle']], int(fields[col['nident']]),
+                   int(fields[col['length']]), int(fields[col['gaps']]),
+                   int(fields[col['qlen']]), float(fields[col['evalue']]))
+
+
+def parse_tabular_BLAST(blast_results, tol, cov, careful, review=None):
+    """
+    Parse tabular (outfmt 7) BLAST results, storing & returning good hits
+
+    Applies the same rules as parse_BLAST() in constant memory.
+
+    :param blast_results: full path to a blast run output file (outfmt 7)
+    :param tol: the cutoff threshold
+    :param cov: alignement coverage cut-off
+    :param careful: manually inspect hits within (tol-careful) of tol
+    :param review: collects the HSPs to inspect instead of asking (see
+                   check_hsp(), default = None)
+
+    :type blast_results: string
+    :type tol: float
+    :type cov: float
+    :type careful: float
+    :type review: list
+
+    :rtype: list of satifying hit names
+    """
+    hits = []
+    for query, _, identities, align_length, gaps, query_length, _ in \
+            iter_tabular_hsps(blast_results):
+        hit_name = query.split(',')[1].strip()
+        if check_hsp(hit_name, identities, align_length, gaps, query_length,
+                     tol, cov, careful, review):
+            hits.append(hit_name)
+    return hits
+
+
+def parse_BLAST(blast_results, tol, cov, careful, review=None):
     """
     Using NCBIXML parse the BLAST results, storing & returning good hits
 
+    Tabular (.tsv) results are handed to parse_tabular_BLAST().
+
     :param blast_results: full path to a blast run output file (in XML format)
     :param tol: the cutoff threshold (see above for explaination)
     :param cov: alignement coverage cut-off (see above for explaination)
+    :param careful: manually inspect hits within (tol-careful) of tol
+    :param review: collects the HSPs to inspect instead of asking (see
+                   check_hsp(), default = None)
 
     :type blast_results: string
     :type tol: float
     :type cov: float
+    :type careful: float
+    :type review: list
 
 
     :rtype: list of satifying hit names
     """
     if os.path.isfile(os.path.expanduser(blast_results)):
+        if is_tabular(blast_results):
+            return parse_tabular_BLAST(blast_results, tol, cov, careful,
+                                       review)
+        from Bio.Blast import NCBIXML
         hits = []
         for record in NCBIXML.parse(open(blast_results)):
             for align in record.alignments:
                 for hsp in align.hsps:
                     hit_name = record.query.split(',')[1].strip()
-                    # cutoff is now calculated with reference to the alignment length
-                    cutoff = hsp.identities/float(hsp.align_length)
-                    
-                    # added condition that the alignment length (hsp.align_length) must be at least equal to the length of the target sequence
-                    # added coverage option allowing the alignment length to be shorter than the length of the target sequence (DEFAULT=1) 
-                    if cutoff >= tol and (record.query_length * cov) <= hsp.align_length:
-                        hits.append(hit_name.strip())
-
-                    # New method for the --careful option
-                    # added condition that the alignment length (hsp.align_length) must be at least equal to the length of the target sequence
-                    elif cutoff >= tol-careful and (record.query_length * cov) <= hsp.align_length:
-                        print "Please confirm this hit:"
-                        print "Name,SeqFindr score,Len(align),Len(query),Identities,Gaps"
-                        print "%s,%f,%i,%i,%i,%i" % (hit_name, cutoff, hsp.align_length, record.query_length, hsp.identities, hsp.gaps)
-                        accept = raw_input("Should this be considered a hit? (y/N)")
-                        if accept == '':
-                            pass
-                        elif accept.lower() == 'n':
-                            pass
-                        elif accept.lower() == 'y':
-                            hits.append(hit_name.strip())
-                        else:
-                            print "Input must be y, n or enter."
-                            print "Assuming n"
-                    else:
-                        pass
+                    if check_hsp(hit_name, hsp.identities, hsp.align_length,
+                                 hsp.gaps, record.query_length, tol, cov,
+                                 careful, review):
+                        hits.append(hit_name)
     else:
         sys.stderr.write("BLAST results do not exist. Exiting.\n")
         sys.exit(1)
     return hits
+
+
+def iter_combined_hsps(blast_results):
+    """
+    Stream the HSPs of a combined database search
+
+    :param blast_results: full path to a blast run output file (XML or
+                          tabular)
+
+    :type blast_results: string
+
+    :returns: a generator of (query definition, subject index, subject
+              title, identities, align_length, gaps, query_length, evalue)
+              tuples. The subject index increments for every new target of
+              a query
+    """
+    if is_tabular(blast_results):
+        prev, subject = None, -1
+        for query, title, identities, align_length, gaps, query_length, \
+                evalue in iter_tabular_hsps(blast_results):
+            if (query, title) != prev:
+                prev = (query, title)
+                subject += 1
+            yield (query, subject, title, identities, align_length, gaps,
+                   query_length, evalue)
+    else:
+        from Bio.Blast import NCBIXML
+        subject = -1
+        for record in NCBIXML.parse(open(blast_results)):
+            for align in record.alignments:
+                subject += 1
+                for hsp in align.hsps:
+                    yield (record.query, subject, align.hit_def,
+                           hsp.identities, hsp.align_length, hsp.gaps,
+                           record.query_length, hsp.expect)
+
+
+def parse_combined_BLAST(blast_results, tol, cov, careful,
+                         strain_lengths=None, dbsize=None, evalue=None,
+                         review=None):
+    """
+    Parse the BLAST results of a combined database, splitting hits by strain
+
+    Only the top target sequence of each strain is considered (as per the
+    max_target_seqs=1 of a per genome search). If strain_lengths, dbsize &
+    evalue are given the expect value of each HSP is rescaled from dbsize to
+    the length of the strain it hit & must still satisfy evalue.
+
+    :param blast_results: full path to a blast run output file (XML or
+                          tabular)
+    :param tol: the cutoff threshold
+    :param cov: alignement coverage cut-off
+    :param careful: manually inspect hits within (tol-careful) of tol
+    :param strain_lengths: a dictionary of strain id to strain length
+    :param dbsize: the effective database size the search was run with
+    :param evalue: the expect value cut-off of a per genome search
+    :param review: a dictionary collecting the HSPs to inspect (see
+                   check_hsp()) by strain id instead of asking (default =
+                   None)
+
+    :type blast_results: string
+    :type tol: float
+    :type cov: float
+    :type careful: float
+    :type strain_lengths: dictionary
+    :type dbsize: int
+    :type evalue: float
+    :type review: dictionary
+
+    :rtype: dictionary of strain id to a list of satifying hit names
+    """
+    if not os.path.isfile(os.path.expanduser(blast_results)):
+        sys.stderr.write("BLAST results do not exist. Exiting.\n")
+        sys.exit(1)
+    rescale = None not in (strain_lengths, dbsize, evalue)
+    hits = {}
+    # The top target (subject index) of each strain for the current query
+    top, cur_query = {}, None
+    for query, subject, title, identities, align_length, gaps, \
+            query_length, expect in iter_combined_hsps(blast_results):
+        if query != cur_query:
+            top, cur_query = {}, query
+        strain_id = title.split('_')[0]
+        if top.setdefault(strain_id, subject) != subject:
+            continue
+        if rescale and (expect * strain_lengths[strain_id] /
+                        float(dbsize)) > evalue:
+            continue
+        hit_name = query.split(',')[1].strip()
+        strain_review = None
+        if review is not None:
+            strain_review = review.setdefault(strain_id, [])
+        if check_hsp(hit_name, identities, align_length, gaps, query_length,
+                     tol, cov, careful, strain_review):
+            hits.setdefault(strain_id, []).append(hit_name)
+    return hits
@@ -0,0 +1,195 @@
+# Copyright 2013-2014 Mitchell Stanton-Cook Licensed under the
+#     Educational Community License, Version 2.0 (the "License"); you may
+#     not use this file except in compliance with the License. You may
+#     obtain a copy of the License at
+#
+#      http://www.osedu.org/licenses/ECL-2.0
+#
+#     Unless required by applicable law or agreed to in writing,
+#     software distributed under the License is distributed on an "AS IS"
+#     BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+#     or implied. See the License for the specific language governing
+#     permissions and limitations under the License.
+
+"""
+SeqFindr clustering methods
+
+Helpers to scale the hierarchical clustering of the SeqFindr matrix to
+thousands of strains: collapsing identical rows, Hamming distances on packed
+bit vectors & a non-recursive leaf ordering.
+
+scipy is imported by the functions that need it (it is slow to import).
+"""
+
+import numpy as np
+
+from SeqFindr import hitmatrix
+
+# Number of set bits in every byte value
+POPCOUNT = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+
+# Rows converted to floats at a time for euclidean distances
+BLOCK_SIZE = 1024
+
+
+def collapse_rows(matrix):
+    """
+    Collapse identical rows of a matrix
+
+    :param matrix: a numpy matrix
+
+    :type matrix: numpy matrix
+
+    :returns: a tuple of the matrix of unique rows (in order of first
+              occurrence) & a list (one element per unique row) of lists of
+              the original row indices
+    """
+    matrix = np.ascontiguousarray(matrix)
+    groups, first = {}, []
+    for idx in range(matrix.shape[0]):
+        key = matrix[idx].tostring()
+        if key not in groups:
+            groups[key] = []
+            first.append(key)
+        groups[key].append(idx)
+    members = [groups[key] for key in first]
+    return matrix[[group[0] for group in members]], members
+
+
+def pack_states(matrix):
+    """
+    Pack a matrix of a few distinct values (states) into bit planes
+
+    :param matrix: a numpy matrix
+
+    :type matrix: numpy matrix
+
+    :returns: a list (one element per state) of numpy uint8 arrays with a
+              packed indicator row per matrix row
+    """
+    return [np.packbits(matrix == state, axis=1)
+            for state in np.unique(matrix)]
+
+
+def packed_hamming(planes, ncols):
+    """
+    Condensed Hamming distances (proportion of differing cells) via popcount
+
+    A cell differs between two rows if it differs in any of the bit planes.
+
+    :param planes: a list of packed bit planes (see pack_states() or
+                   HitMatrix.planes())
+    :param ncols: the number of cells (columns) per original row
+
+    :type planes: list
+    :type ncols: int
+
+    :returns: a condensed distance matrix (as per scipy pdist)
+    """
+    nrows = planes[0].shape[0]
+    dists = np.empty(nrows * (nrows - 1) // 2, dtype=np.float64)
+    start = 0
+    for idx in range(nrows - 1):
+        diff = planes[0][idx+1:] ^ planes[0][idx]
+        for plane in planes[1:]:
+            diff |= plane[idx+1:] ^ plane[idx]
+        diff = POPCOUNT[diff].sum(axis=1, dtype=np.int64)
+        dists[start:start+len(diff)] = diff / float(ncols)
+        start += len(diff)
+    return dists
+
+
+def blocked_euclidean(get_rows, nrows, block_size=BLOCK_SIZE):
+    """
+    Condensed euclidean distances computed a block of rows at a time
+
+    Only two blocks of rows are held as floats. The distances match pdist
+    to within rounding (a single block gives exactly the pdist values).
+
+    :param get_rows: a function (start, stop) returning those rows as floats
+    :param nrows: the number of rows
+    :param block_size: the number of rows per block
+
+    :returns: a condensed distance matrix (as per scipy pdist)
+    """
+    from scipy.spatial.distance import pdist, cdist
+    if nrows <= block_size:
+        return pdist(get_rows(0, nrows))
+    dists = np.empty(nrows * (nrows - 1) // 2, dtype=np.float64)
+    for i_start in range(0, nrows, block_size):
+        i_stop = min(i_start+block_size, nrows)
+        rows_i = get_rows(i_start, i_stop)
+        for j_start in range(i_start, nrows, block_size):
+            j_stop = min(j_start+block_size, nrows)
+            if j_start == i_start:
+                rows_j = rows_i
+            else:
+                rows_j = get_rows(j_start, j_stop)
+            block = cdist(rows_i, rows_j)
+            for i in range(i_start, i_stop):
+                first = max(i+1, j_start)
+                if first >= j_stop:
+                    continue
+                # Condensed index of (i, first)
+                offset = nrows*i - i*(i+1)//2 + first - i - 1
+                dists[offset:offset+j_stop-first] = \
+                    block[i-i_start, first-j_start:]
+    return dists
+
+
+def distances(matrix, metric='euclidean'):
+    """
+    Condensed distance matrix between the rows of a matrix
+
+    :param matrix: a numpy matrix or a HitMatrix
+    :param metric: euclidean (default) or hamming (on packed bit vectors)
+
+    :type matrix: numpy matrix or HitMatrix
+    :type metric: string
+
+    :returns: a condensed distance matrix (as per scipy pdist)
+    """
+    from scipy.spatial.distance import pdist
+    if isinstance(matrix, hitmatrix.HitMatrix):
+        if metric == 'hamming':
+            return packed_hamming(matrix.planes(), matrix.ncols)
+        return blocked_euclidean(matrix.scores, matrix.shape[0])
+    if metric == 'hamming':
+        return packed_hamming(pack_states(matrix), matrix.shape[1])
+    return pdist(matrix)
+
+
+def hierarchy(matrix, algorithm, metric='euclidean'):
+    """
+    Hierarchical clustering of the rows of a matrix
+
+    :param matrix: a numpy matrix or a HitMatrix
+    :param algorithm: the clustering algorithm (linkage (default, False)
+                      or UPGMA)
+    :param metric: euclidean (default) or hamming
+
+    :type matrix: numpy matrix or HitMatrix
+    :type algorithm: boolean
+    :type metric: string
+
+    :returns: the linkage matrix
+    """
+    from scipy.cluster.hierarchy import linkage, average
+    Y = distances(matrix, metric)
+    if not algorithm:
+        return linkage(Y)
+    return average(Y)
+
+
+def leaf_order(Z):
+    """
+    The left to right leaf order of a linkage (as per dendrogram leaves)
+
+    Computed without recursion so deep trees need no recursion limit.
+
+    :param Z: a linkage matrix
+
+    :returns: a list of row indices
+    """
+    from scipy.cluster.hierarchy import leaves_list
+    return [int(leaf) for leaf in leaves_list(Z)]
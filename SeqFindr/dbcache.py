@@ -0,0 +1,187 @@
+# Copyright 2013-2014 Mitchell Stanton-Cook Licensed under the
+#     Educational Community License, Version 2.0 (the "License"); you may
+#     not use this file except in compliance with the License. You may
+#     obtain a copy of the License at
+#
+#      http://www.osedu.org/licenses/ECL-2.0
+#
+#     Unless required by applicable law or agreed to in writing,
+#     software distributed under the License is distributed on an "AS IS"
+#     BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+#     or implied. See the License for the specific language governing
+#     permissions and limitations under the License.
+
+"""
+SeqFindr BLAST database cache
+
+BLAST databases are stored under a key built from the hash of the FASTA
+contents & the BLAST version so unchanged genomes are never re-indexed
+between runs. Entries are evicted least recently used first once the cache
+grows beyond its size limit.
+"""
+
+import os
+import sys
+import shutil
+import hashlib
+import tempfile
+
+from SeqFindr import util
+
+# Nucleotide database files produced by makeblastdb
+DB_EXTS = ['.nhr', '.nin', '.nsq']
+
+
+class DatabaseCache(object):
+    """
+    A content addressed, size limited (LRU) cache of BLAST databases
+    """
+
+    def __init__(self, cache_dir, max_size=None):
+        """
+        :param cache_dir: full path to the cache directory (created if
+                          needed)
+        :param max_size: the maximum size of the cache in bytes (default =
+                         None, unlimited)
+        """
+        self.cache_dir = os.path.abspath(os.path.expanduser(cache_dir))
+        self.max_size = max_size
+        if not os.path.isdir(self.cache_dir):
+            try:
+                os.makedirs(self.cache_dir)
+            except OSError:
+                # Created by a concurrent run
+                if not os.path.isdir(self.cache_dir):
+                    raise
+
+    def key(self, fasta_file, blast_version):
+        """
+        The cache key of a FASTA file
+
+        :param fasta_file: full path to a fasta file
+        :param blast_version: the BLAST (makeblastdb) version string
+
+        :returns: a hex digest of the FASTA contents & BLAST version
+        """
+        digest = hashlib.sha1(util.hash_file(fasta_file))
+        digest.update(blast_version)
+        return digest.hexdigest()
+
+    def fetch(self, key, db_prefix):
+        """
+        Link a cached database into place
+
+        Hard links are used where possible (falling back to symlinks across
+        file systems).
+
+        :param key: the cache key (see key())
+        :param db_prefix: the database path to link to i.e. DBs/strain.fa
+
+        :returns: True on a cache hit, otherwise False
+        """
+        entry = os.path.join(self.cache_dir, key)
+        if not os.path.isdir(entry):
+            return False
+        for ext in DB_EXTS:
+            src = os.path.join(entry, 'db'+ext)
+            if not os.path.isfile(src):
+                return False
+        for ext in DB_EXTS:
+            link_file(os.path.join(entry, 'db'+ext), db_prefix+ext)
+        # Mark as recently used
+        try:
+            os.utime(entry, None)
+        except OSError:
+            pass
+        return True
+
+    def store(self, key, db_prefix):
+        """
+        Add a freshly built database to the cache & evict if over size
+
+        The entry is assembled in a temporary directory & renamed into place
+        so a concurrent reader never sees a partial entry.
+
+        :param key: the cache key (see key())
+        :param db_prefix: the database path i.e. DBs/strain.fa
+        """
+        entry = os.path.join(self.cache_dir, key)
+        if os.path.isdir(entry):
+            return
+        tmp = tempfile.mkdtemp(prefix='.tmp', dir=self.cache_dir)
+        try:
+            for ext in DB_EXTS:
+                shutil.copy2(db_prefix+ext, os.path.join(tmp, 'db'+ext))
+            os.rename(tmp, entry)
+        except (IOError, OSError):
+            # Lost a race with a concurrent store of the same key (or a
+            # database file is missing)
+            shutil.rmtree(tmp, ignore_errors=True)
+        self.evict()
+
+    def entries(self):
+        """
+        List the cache entries
+
+        :returns: a list of (last used time, size in bytes, path) tuples
+        """
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            path = os.path.join(self.cache_dir, name)
+            if name.startswith('.') or not os.path.isdir(path):
+                continue
+            try:
+                size = sum([os.path.getsize(os.path.join(path, f))
+                            for f in os.listdir(path)])
+                entries.append((os.path.getmtime(path), size, path))
+            except OSError:
+                # Evicted by a concurrent run
+                continue
+        return entries
+
+    def evict(self):
+        """
+        Remove the least recently used entries until within max_size
+        """
+        if self.max_size is None:
+            return
+        entries = sorted(self.entries())
+        total = sum([size for _, size, _ in entries])
+        for _, size, path in entries:
+            if total <= self.max_size:
+                break
+            sys.stderr.write("Evicting %s from the database cache\n" % (path))
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
+
+
+def link_file(src, dst):
+    """
+    Hard link src to dst, falling back to a symlink (replaces dst)
+
+    :param src: full path to the source file
+    :param dst: full path to the destination
+    """
+    if os.path.lexists(dst):
+        os.remove(dst)
+    try:
+        os.link(src, dst)
+    except OSError:
+        os.symlink(src, dst)
+
+
+def get_db_cache(args):
+    """
+    Build the DatabaseCache requested on the command line (if any)
+
+    :param args: the arguments given from argparse (uses args.db_cache &
+                 args.db_cache_size in GB)
+
+    :returns: a DatabaseCache or None
+    """
+    if args.db_cache is None:
+        return None
+    max_size = None
+    if args.db_cache_size:
+        max_size = int(args.db_cache_size * 1024**3)
+    return DatabaseCache(args.db_cache, max_size)
@@ -0,0 +1,167 @@
+# Copyright 2013-2014 Mitchell Stanton-Cook Licensed under the
+#     Educational Community License, Version 2.0 (the "License"); you may
+#     not use this file except in compliance with the License. You may
+#     obtain a copy of the License at
+#
+#      http://www.osedu.org/licenses/ECL-2.0
+#
+#     Unless required by applicable law or agreed to in writing,
+#     software distributed under the License is distributed on an "AS IS"
+#     BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+#     or implied. See the License for the specific language governing
+#     permissions and limitations under the License.
+
+"""
+SeqFindr bit-packed hit matrix
+
+Every cell of the SeqFindr matrix is one of a few states (no hit, assembly
+hit &, for mapping consensus runs, consensus hit or both). The matrix is
+held as one presence/absence bit plane per data source (8 cells per byte,
+see numpy.packbits) & only converted to the float scale used for plotting
+at render time::
+
+    no hit = 0.5, assembly hit = -0.15 (+ 0.5 without a consensus hit)
+    consensus hit = -0.85 (+ 0.5 without an assembly hit)
+"""
+
+import numpy as np
+
+# The float scale of each data source (a hit vs no hit)
+NO_HIT, ASS_WT, CONS_WT = 0.5, -0.15, -0.85
+
+# Rows converted to floats at a time when writing
+BLOCK_SIZE = 1024
+
+
+def pack_hits(all_vfs, hits):
+    """
+    Build a presence/absence bit plane from each row's accepted hits
+
+    :param all_vfs: a list of all virulence factor (query) ids
+    :param hits: a list (one element per row) of lists of accepted hits
+
+    :type all_vfs: list
+    :type hits: list
+
+    :returns: a numpy uint8 array (rows x ceil(len(all_vfs)/8)) of packed
+              bits (most significant bit first)
+    """
+    column = dict((factor, idx) for idx, factor in enumerate(all_vfs))
+    packed = np.zeros((len(hits), (len(all_vfs)+7) // 8), dtype=np.uint8)
+    for row, accepted_hits in enumerate(hits):
+        cols = np.array([column[factor] for factor in set(accepted_hits)
+                         if factor in column], dtype=np.intp)
+        np.bitwise_or.at(packed[row], cols >> 3,
+                         (0x80 >> (cols & 7)).astype(np.uint8))
+    return packed
+
+
+def unpack(packed, ncols):
+    """
+    Unpack a bit plane
+
+    :param packed: a packed bit plane
+    :param ncols: the number of cells per row
+
+    :returns: a numpy boolean array (rows x ncols)
+    """
+    return np.unpackbits(packed, axis=1)[:, :ncols].astype(bool)
+
+
+class HitMatrix(object):
+    """
+    The SeqFindr matrix as packed assembly (& consensus) hit bit planes
+    """
+
+    def __init__(self, ncols, assembly, consensus=None):
+        """
+        :param ncols: the number of cells (queries) per row
+        :param assembly: the packed assembly hit plane (see pack_hits())
+        :param consensus: the packed mapping consensus hit plane (default =
+                          None, not a consensus run). Rows must match the
+                          assembly rows
+        """
+        self.ncols = ncols
+        self.assembly = assembly
+        self.consensus = consensus
+        if consensus is not None and consensus.shape != assembly.shape:
+            raise ValueError("Assembly & consensus hit planes differ in "
+                             "shape")
+
+    @property
+    def shape(self):
+        """
+        The (rows, columns) of the matrix
+        """
+        return (self.assembly.shape[0], self.ncols)
+
+    def planes(self):
+        """
+        The packed bit planes
+
+        :returns: a list of 1 (assembly) or 2 (assembly, consensus) planes
+        """
+        if self.consensus is None:
+            return [self.assembly]
+        return [self.assembly, self.consensus]
+
+    def packed(self):
+        """
+        The packed bit planes side by side (one byte string per row state)
+
+        :returns: a numpy uint8 array
+        """
+        return np.hstack(self.planes())
+
+    def take(self, rows):
+        """
+        Select (& reorder) rows
+
+        :param rows: a list of row indices
+
+        :returns: a new HitMatrix
+        """
+        consensus = None
+        if self.consensus is not None:
+            consensus = self.consensus[rows]
+        return HitMatrix(self.ncols, self.assembly[rows], consensus)
+
+    def transpose(self):
+        """
+        Swap the rows & columns
+
+        :returns: a new HitMatrix
+        """
+        planes = [np.packbits(unpack(plane, self.ncols).T, axis=1)
+                  for plane in self.planes()]
+        planes.append(None)
+        return HitMatrix(self.shape[0], planes[0], planes[1])
+
+    def scores(self, start=0, stop=None, dtype=np.float64):
+        """
+        Convert rows to the float scale used for plotting
+
+        :param start: the first row (default = 0)
+        :param stop: one past the last row (default = None, all rows)
+        :param dtype: the numpy dtype (default = np.float64)
+
+        :returns: a numpy array (rows x columns) of scores
+        """
+        ass = unpack(self.assembly[start:stop], self.ncols)
+        matrix = np.where(ass, ASS_WT, NO_HIT).astype(dtype)
+        if self.consensus is not None:
+            cons = unpack(self.consensus[start:stop], self.ncols)
+            matrix += np.where(cons, CONS_WT, NO_HIT).astype(dtype)
+        return matrix
+
+    def save_csv(self, fname, block_size=BLOCK_SIZE):
+        """
+        Write the float scores as CSV (as per numpy.savetxt) a block at a time
+
+        :param fname: the file to write to
+        :param block_size: the number of rows converted at a time
+        """
+        with open(fname, 'w') as fout:
+            for start in range(0, self.shape[0], block_size):
+                np.savetxt(fout, self.scores(start, start+block_size),
+                           delimiter=",")
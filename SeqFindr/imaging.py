@@ -14,12 +14,33 @@
 
 HALTON = False
 
+import sys
 import random
+import threading
 try:
     import ghalton
     HALTON = True
 except ImportError:
-    print "Using Standard"
+    pass
+
+# pyplot keeps global state (the current figure). Hold this while drawing
+# so concurrent SeqFindr sessions don't draw on each other's figures
+PLOT_LOCK = threading.RLock()
+
+
+def pyplot():
+    """
+    Import matplotlib.pyplot (with the Agg backend) on first use
+
+    matplotlib is slow to import so is only loaded when plotting.
+
+    :returns: the matplotlib.pyplot module
+    """
+    import matplotlib
+    if 'matplotlib.pyplot' not in sys.modules:
+        matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    return plt
 
 
 def hsv_to_rgb(h, s, v):
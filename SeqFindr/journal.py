@@ -0,0 +1,187 @@
+# Copyright 2013-2014 Mitchell Stanton-Cook Licensed under the
+#     Educational Community License, Version 2.0 (the "License"); you may
+#     not use this file except in compliance with the License. You may
+#     obtain a copy of the License at
+#
+#      http://www.osedu.org/licenses/ECL-2.0
+#
+#     Unless required by applicable law or agreed to in writing,
+#     software distributed under the License is distributed on an "AS IS"
+#     BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+#     or implied. See the License for the specific language governing
+#     permissions and limitations under the License.
+
+"""
+SeqFindr screening journal
+
+Every genome screened is appended to a journal in the output directory
+(one JSON line per genome) as soon as its hits are parsed::
+
+    {"run": run key, "cons": false, "genome": path, "size": bytes,
+     "mtime": seconds, "strain_id": id, "hits": [query id, ...]}
+
+A restarted run (i.e. after running out of memory or being preempted)
+skips the genomes already in the journal. An entry is only used for the
+same genome file (path, size & mtime) screened with the same queries &
+cut-offs (the run key, see run_key()).
+
+Once a run finishes screening a completion line is appended::
+
+    {"run": run key, "complete": true}
+
+& the entries of that run key before it are no longer used, so running
+the same command again screens every genome (only an interrupted run is
+resumed).
+
+Each entry is a single appended write (under an exclusive lock, so pool
+workers can share the journal, see util.append_locked()) & synced to disk.
+A line cut short by a crash is ignored & trimmed off before new entries
+are added. A genome is only journaled once its BLAST results are complete
+& parsed, so results cut short by a crash are never used.
+"""
+
+import os
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+
+from SeqFindr import manifest
+from SeqFindr import util
+
+JOURNAL_VERSION = 1
+
+# Written to the output directory
+JOURNAL_NAME = "screen_journal.jsonl"
+
+
+def run_key(args, blast_version):
+    """
+    The hash of the queries & every parameter that influences the hits
+
+    :param args: the arguments given from argparse
+    :param blast_version: the BLAST version string
+
+    :rtype: string
+    """
+    digest = hashlib.sha1(manifest.params_key(args, blast_version))
+    digest.update(util.hash_file(args.seqs_of_interest))
+    digest.update(str(JOURNAL_VERSION))
+    return digest.hexdigest()[:16]
+
+
+def genome_stamp(fasta_file):
+    """
+    The identity of a genome file (without reading it)
+
+    :param fasta_file: full path to a genome
+
+    :returns: a tuple of the absolute path, size & mtime
+    """
+    info = os.stat(fasta_file)
+    return os.path.abspath(fasta_file), info.st_size, info.st_mtime
+
+
+class Journal(object):
+    """
+    The append-only record of the genomes screened in an output directory
+
+    Pickles without the loaded entries so it can travel (on args) to pool
+    workers, which only append.
+    """
+    def __init__(self, path, key, load=True):
+        """
+        :param path: full path to the journal file (need not exist)
+        :param key: the run key (see run_key())
+        :param load: read the existing entries (default = True)
+        """
+        self.path = path
+        self.key = key
+        self.entries = {}
+        self._lock = threading.Lock()
+        if load and os.path.isfile(path):
+            self._load()
+
+    def __getstate__(self):
+        return {'path': self.path, 'key': self.key}
+
+    def __setstate__(self, state):
+        self.__init__(state['path'], state['key'], load=False)
+
+    def _load(self):
+        """
+        Read the entries of this run & trim a line cut short by a crash
+        """
+        good = 0
+        with open(self.path, 'rb') as fin:
+            for line in fin:
+                if not line.endswith('\n'):
+                    break
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    break
+                good += len(line)
+                if entry.get('run') != self.key:
+                    continue
+                if entry.get('complete'):
+                    self.entries.clear()
+                    continue
+                self.entries[(entry['cons'], entry['genome'], entry['size'],
+                              entry['mtime'])] = (entry['strain_id'],
+                                                  entry['hits'])
+        if good != os.path.getsize(self.path):
+            with open(self.path, 'r+b') as fout:
+                fout.truncate(good)
+
+    def has_entries(self):
+        """
+        Whether an unfinished run with this run key screened any genome
+
+        :rtype: boolean
+        """
+        return len(self.entries) != 0
+
+    def lookup(self, fasta_file, cons_run):
+        """
+        The journaled result of a genome
+
+        :param fasta_file: full path to a genome
+        :param cons_run: part of a mapping consensus run
+
+        :returns: a tuple of the strain id & the list of accepted hits or
+                  None if the genome is not in the journal
+        """
+        entry = self.entries.get((cons_run,) + genome_stamp(fasta_file))
+        if entry is None:
+            return None
+        return entry[0].encode('utf-8'), [hit.encode('utf-8')
+                                          for hit in entry[1]]
+
+    def record(self, fasta_file, cons_run, strain_id, hits):
+        """
+        Append (& sync) the result of a genome
+
+        :param fasta_file: full path to a genome
+        :param cons_run: part of a mapping consensus run
+        :param strain_id: the strain id
+        :param hits: the list of accepted hits
+        """
+        path, size, mtime = genome_stamp(fasta_file)
+        line = json.dumps(OrderedDict([('run', self.key), ('cons', cons_run),
+                                       ('genome', path), ('size', size),
+                                       ('mtime', mtime),
+                                       ('strain_id', strain_id),
+                                       ('hits', list(hits))]))
+        with self._lock:
+            util.append_locked(self.path, line + '\n')
+
+    def complete(self):
+        """
+        Mark the run finished (its entries are not used again)
+        """
+        line = json.dumps(OrderedDict([('run', self.key),
+                                       ('complete', True)]))
+        with self._lock:
+            util.append_locked(self.path, line + '\n')
+        self.entries = {}
@@ -0,0 +1,190 @@
+# Copyright 2013-2014 Mitchell Stanton-Cook Licensed under the
+#     Educational Community License, Version 2.0 (the "License"); you may
+#     not use this file except in compliance with the License. You may
+#     obtain a copy of the License at
+#
+#      http://www.osedu.org/licenses/ECL-2.0
+#
+#     Unless required by applicable law or agreed to in writing,
+#     software distributed under the License is distributed on an "AS IS"
+#     BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+#     or implied. See the License for the specific language governing
+#     permissions and limitations under the License.
+
+"""
+SeqFindr incremental screening manifest
+
+Records which queries have been screened against which genomes (with which
+BLAST & cutoff parameters) along with the accepted hits, so a later run only
+needs to search new genomes or new/changed queries.
+
+Genomes are identified by the hash of their contents & queries by the hash of
+their FASTA record. The manifest is a JSON file::
+
+    {"version": 1,
+     "query_sets": {set_id: [query hash, ...]},
+     "results": {"genome hash:params hash": [[set_id, [hit query hash]]]}}
+"""
+
+import os
+import json
+import hashlib
+
+from SeqFindr import util
+
+MANIFEST_VERSION = 1
+
+
+def hash_query(header, seq):
+    """
+    The hash of a single query FASTA record
+
+    :param header: the FASTA header (without '>')
+    :param seq: the sequence
+
+    :rtype: string (16 hex characters)
+    """
+    return hashlib.sha1(header.strip()+'\n'+seq.upper()).hexdigest()[:16]
+
+
+def query_hashes(query_file):
+    """
+    Hash every query in a SeqFindr formatted query file
+
+    :param query_file: full path to the query (sequences of interest) file
+
+    :returns: a list of (query id, query hash) tuples in file order
+    """
+    hashes = []
+    for header, seq in util.iter_fasta(query_file):
+        hashes.append((header.split(',')[1].strip(), hash_query(header, seq)))
+    return hashes
+
+
+def params_key(args, blast_version):
+    """
+    The hash of every parameter that influences the accepted hits
+
+    :param args: the arguments given from argparse
+    :param blast_version: the BLAST version string
+
+    :rtype: string
+    """
+    params = [blast_version, args.reftype, args.tblastx, args.evalue,
+              args.short, float(args.tol), float(args.cov),
+              float(args.careful)]
+    # --review leaves the hits to inspect out (& in the review file) rather
+    # than asking, so the hits of a --review run are never reused without it
+    # (or the other way around)
+    if getattr(args, 'review', False):
+        params.append('review')
+    return hashlib.sha1(json.dumps(params)).hexdigest()[:16]
+
+
+def write_query_subset(query_file, query_hashes, out_dir):
+    """
+    Write the queries (by record hash) of a query file to a new query file
+
+    :param query_file: full path to the query (sequences of interest) file
+    :param query_hashes: the hashes of the queries to keep
+    :param out_dir: the directory to write the subset query file to
+
+    :type query_file: string
+    :type query_hashes: set
+    :type out_dir: string
+
+    :returns: full path to the subset query file
+    """
+    tag = hashlib.sha1(''.join(sorted(query_hashes))).hexdigest()[:8]
+    base, ext = os.path.splitext(
+        os.path.basename(util.uncompressed_name(query_file)))
+    subset = os.path.join(out_dir, base+"_"+tag+ext)
+    with open(subset, 'w') as fout:
+        for header, seq in util.iter_fasta(query_file):
+            if hash_query(header, seq) in query_hashes:
+                fout.write(">%s\n%s\n" % (header, seq))
+    return subset
+
+
+class Manifest(object):
+    """
+    The record of screened (query, genome, parameters) combinations
+    """
+
+    def __init__(self, path):
+        """
+        :param path: full path to the manifest file (need not exist)
+        """
+        self.path = path
+        self.query_sets = {}
+        self.results = {}
+        if os.path.isfile(path):
+            with open(path) as fin:
+                stored = json.load(fin)
+            if stored.get('version') == MANIFEST_VERSION:
+                self.query_sets = stored['query_sets']
+                self.results = stored['results']
+
+    def lookup(self, genome_hash, params):
+        """
+        The queries screened against a genome & the queries that hit
+
+        :param genome_hash: the hash of the genome contents
+        :param params: the parameters key (see params_key())
+
+        :returns: a tuple of 2 sets of query hashes, 1) screened and 2) hits
+        """
+        screened, hits = set(), set()
+        for set_id, hit_hashes in self.results.get(genome_hash+':'+params,
+                                                   []):
+            screened.update(self.query_sets[set_id])
+            hits.update(hit_hashes)
+        return screened, hits
+
+    def record(self, genome_hash, params, screened, hits):
+        """
+        Record the result of screening a set of queries against a genome
+
+        :param genome_hash: the hash of the genome contents
+        :param params: the parameters key (see params_key())
+        :param screened: the query hashes that were screened
+        :param hits: the query hashes that were accepted as hits
+        """
+        screened = sorted(screened)
+        set_id = hashlib.sha1(''.join(screened)).hexdigest()[:16]
+        self.query_sets[set_id] = screened
+        entries = self.results.setdefault(genome_hash+':'+params, [])
+        entries.append([set_id, sorted(hits)])
+
+    def merge(self, other):
+        """
+        Add the results of another manifest (of the same file) to this one
+
+        :param other: a Manifest
+        """
+        # A set id is the hash of its queries so equal ids are equal sets
+        self.query_sets.update(other.query_sets)
+        for key, entries in other.results.items():
+            known = self.results.setdefault(key, [])
+            for entry in entries:
+                if entry not in known:
+                    known.append(entry)
+
+    def save(self):
+        """
+        Write the manifest (atomically), keeping what others saved since
+
+        Runs sharing a manifest (i.e. the shards of a run) each merge the
+        manifest on disk into theirs under an exclusive lock (of path.lock)
+        before writing it, so no run drops the results of another.
+        """
+        import fcntl
+        with open(self.path + '.lock', 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            self.merge(Manifest(self.path))
+            tmp = self.path + '.tmp'
+            with open(tmp, 'w') as fout:
+                json.dump({'version': MANIFEST_VERSION,
+                           'query_sets': self.query_sets,
+                           'results': self.results}, fout)
+            os.rename(tmp, self.path)
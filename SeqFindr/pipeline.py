@@ -0,0 +1,152 @@
+# Copyright 2013-2014 Mitchell Stanton-Cook Licensed under the
+#     Educational Community License, Version 2.0 (the "License"); you may
+#     not use this file except in compliance with the License. You may
+#     obtain a copy of the License at
+#
+#      http://www.osedu.org/licenses/ECL-2.0
+#
+#     Unless required by applicable law or agreed to in writing,
+#     software distributed under the License is distributed on an "AS IS"
+#     BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+#     or implied. See the License for the specific language governing
+#     permissions and limitations under the License.
+
+"""
+SeqFindr staged pipelines
+
+Runs items through a chain of stages with one thread per stage & a bounded
+queue between stages so the stages overlap across items i.e. the database
+of genome N+1 is built while genome N is searched & the results of genome
+N-1 are parsed::
+
+    items -> [stage 1] -> queue -> [stage 2] -> queue -> [stage 3] -> results
+
+The stages of SeqFindr wait on BLAST processes (or their I/O) so threads
+are enough to overlap them. The queues hold at most depth items so a fast
+stage can't run ahead of a slow one (i.e. build every database before the
+first search).
+
+An item that fails in a stage skips the remaining stages & is reported
+with its traceback (see run_pipeline()).
+"""
+
+import threading
+import traceback
+import Queue
+
+# How long the collecting thread blocks on a queue at a time. Keeps the
+# wait interruptible (Ctrl-C) under Python 2
+POLL = 0.5
+
+# Marks the end of the items
+_DONE = object()
+
+
+class StageError(object):
+    """
+    The failure of an item in a stage (passed down the remaining stages)
+
+    :ivar stage: the index of the stage that failed
+    :ivar error: the formatted traceback
+    """
+    def __init__(self, stage, error):
+        self.stage = stage
+        self.error = error
+
+
+def _run_stage(idx, func, inbox, outbox, stop):
+    """
+    Apply a stage to every item of inbox, passing results to outbox
+
+    :param idx: the index of the stage
+    :param func: the stage function (item -> result)
+    :param inbox: the Queue of (position, item) from the previous stage
+    :param outbox: the Queue of (position, result) to the next stage
+    :param stop: a threading.Event set when the pipeline is abandoned
+    """
+    while not stop.is_set():
+        try:
+            task = inbox.get(True, POLL)
+        except Queue.Empty:
+            continue
+        if task is _DONE:
+            _put(outbox, _DONE, stop)
+            return
+        position, item = task
+        if not isinstance(item, StageError):
+            try:
+                item = func(item)
+            except (Exception, SystemExit):
+                item = StageError(idx, traceback.format_exc())
+        _put(outbox, (position, item), stop)
+
+
+def _put(queue, task, stop):
+    """
+    Put a task on a bounded queue unless the pipeline is abandoned
+    """
+    while not stop.is_set():
+        try:
+            queue.put(task, True, POLL)
+            return
+        except Queue.Full:
+            pass
+
+
+def _feed(items, queue, stop):
+    """
+    Put the (position, item) of every item & the end marker on a queue
+    """
+    for position, item in enumerate(items):
+        _put(queue, (position, item), stop)
+    _put(queue, _DONE, stop)
+
+
+def run_pipeline(items, stages, depth=2):
+    """
+    Run every item through the stages, overlapping the stages across items
+
+    :param items: a list of items (the input of the first stage)
+    :param stages: a list of functions. Each takes the result of the
+                   previous stage (or an item) & returns its result
+    :param depth: the number of items each queue between stages holds
+                  (default = 2)
+
+    :type items: list
+    :type stages: list
+    :type depth: int
+
+    :returns: a list (same order as items) of the last stage results or
+              StageError for items that failed
+    """
+    stop = threading.Event()
+    queues = [Queue.Queue(maxsize=max(1, depth))
+              for _ in range(len(stages) + 1)]
+    threads = []
+    for idx, func in enumerate(stages):
+        thread = threading.Thread(target=_run_stage,
+                                  args=(idx, func, queues[idx],
+                                        queues[idx+1], stop))
+        thread.daemon = True
+        thread.start()
+        threads.append(thread)
+    feeder = threading.Thread(target=_feed, args=(items, queues[0], stop))
+    feeder.daemon = True
+    feeder.start()
+    results = [None] * len(items)
+    try:
+        while True:
+            try:
+                task = queues[-1].get(True, POLL)
+            except Queue.Empty:
+                continue
+            if task is _DONE:
+                break
+            position, result = task
+            results[position] = result
+    except BaseException:
+        stop.set()
+        raise
+    for thread in threads + [feeder]:
+        thread.join()
+    return results
@@ -0,0 +1,333 @@
+# Copyright 2013-2014 Mitchell Stanton-Cook Licensed under the
+#     Educational Community License, Version 2.0 (the "License"); you may
+#     not use this file except in compliance with the License. You may
+#     obtain a copy of the License at
+#
+#      http://www.osedu.org/licenses/ECL-2.0
+#
+#     Unless required by applicable law or agreed to in writing,
+#     software distributed under the License is distributed on an "AS IS"
+#     BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+#     or implied. See the License for the specific language governing
+#     permissions and limitations under the License.
+
+"""
+SeqFindr k-mer containment prefilter
+
+With --prefilter only the queries that could possibly give an accepted hit
+in a genome are searched with BLAST. The rest are no-hits without a search.
+
+Each genome is indexed once as the sorted set of its canonical k-mers
+(both strands, k <= 16 packed in a uint32) & cached in the DBs directory
+by its full path (see load_index()). A query is kept if enough of its k-mers are
+contained in the genome (see min_contained()).
+
+Why this is conservative: an HSP is accepted (see blast.check_hsp()) when
+identities >= tol * align_length & align_length >= cov * query_length.
+The (align_length - identities) other columns split the identical columns
+into at most (align_length - identities + 1) runs, & every query k-mer
+inside a run is also a k-mer of the genome. So at least::
+
+    identities - (align_length - identities + 1) * (k - 1)
+        >= cov * query_length * (tol * k - (k - 1)) - (k - 1)
+
+query k-mers are contained in the genome. With --careful the cutoff is
+tol-careful. Query k-mers with an ambiguous base (not ACGT) always count as
+contained. If tol * k <= k - 1 (a low cutoff for k) every query is kept.
+"""
+
+import os
+import hashlib
+import argparse
+
+import numpy as np
+
+from SeqFindr import util
+
+# Default k-mer size. Random 15-mers are rare in a bacterial genome (4^15
+# ~ 10^9) while the bound still needs ~30% of the k-mers at tol = 0.95
+DEFAULT_K = 15
+
+# k-mers are packed 2 bits per base in a uint32
+MAX_K = 16
+
+# Base to 2 bit code. Anything else is ambiguous (4). SEPARATOR (5) splits
+# the queries when they are indexed together
+SEPARATOR = 5
+_CODES = np.empty(256, dtype=np.uint8)
+_CODES.fill(4)
+for _idx, _base in enumerate('ACGT'):
+    _CODES[ord(_base)] = _idx
+    _CODES[ord(_base.lower())] = _idx
+_CODES[SEPARATOR] = SEPARATOR
+
+
+def parse_k(value):
+    """
+    Parse a k-mer size (argparse type)
+
+    :param value: the k-mer size (1 to MAX_K)
+
+    :rtype: int
+    """
+    try:
+        k = int(value)
+    except ValueError:
+        k = 0
+    if not 1 <= k <= MAX_K:
+        raise argparse.ArgumentTypeError("The k-mer size must be between 1 "
+                                         "& %i (not %s)" % (MAX_K, value))
+    return k
+
+
+def encode(seq):
+    """
+    The 2 bit codes of a sequence (4 for ambiguous bases)
+
+    :param seq: the sequence
+
+    :type seq: string
+
+    :returns: a numpy uint8 array
+    """
+    return _CODES[np.frombuffer(seq, dtype=np.uint8)]
+
+
+def kmer_codes(codes, k):
+    """
+    The canonical k-mers of every window of an encoded sequence
+
+    :param codes: the encoded sequence (see encode())
+    :param k: the k-mer size (<= MAX_K)
+
+    :type codes: numpy array
+    :type k: int
+
+    :returns: a tuple of 2 numpy arrays (one entry per window), the
+              canonical (smaller of both strands) uint32 k-mers & the
+              largest code in the window (> 3 for windows that are not
+              ACGT only)
+    """
+    count = len(codes) - k + 1
+    if count <= 0:
+        return np.zeros(0, dtype=np.uint32), np.zeros(0, dtype=np.uint8)
+    bases = np.minimum(codes, 3).astype(np.uint32)
+    forward = np.zeros(count, dtype=np.uint32)
+    reverse = np.zeros(count, dtype=np.uint32)
+    worst = np.zeros(count, dtype=np.uint8)
+    for offset in range(k):
+        window = bases[offset:offset+count]
+        forward <<= np.uint32(2)
+        forward |= window
+        reverse |= (np.uint32(3) - window) << np.uint32(2 * offset)
+        np.maximum(worst, codes[offset:offset+count], worst)
+    return np.minimum(forward, reverse), worst
+
+
+def genome_kmers(fasta_file, k):
+    """
+    The set of canonical k-mers of a genome (ACGT only windows)
+
+    :param fasta_file: full path to the genome (may be gzip compressed)
+    :param k: the k-mer size
+
+    :returns: a sorted numpy uint32 array of the distinct k-mers
+    """
+    kmers = []
+    for _, seq in util.iter_fasta(fasta_file):
+        canonical, worst = kmer_codes(encode(seq), k)
+        kmers.append(np.unique(canonical[worst < 4]))
+    if not kmers:
+        return np.zeros(0, dtype=np.uint32)
+    return np.unique(np.concatenate(kmers))
+
+
+def index_path(fasta_file, k, out_dir, cons_run=False):
+    """
+    The cached k-mer index of a genome
+
+    Named by the full path of the genome so an assembly & a mapping
+    consensus with the same file name get their own index.
+
+    :param fasta_file: full path to the genome
+    :param k: the k-mer size
+    :param out_dir: the SeqFindr output directory
+    :param cons_run: part of a mapping consensus run (default = False)
+
+    :returns: full path to the index (DBs/[cons_]<genome>.<path hash>.k<k>
+              .npz)
+    """
+    prefix = ''
+    if cons_run:
+        prefix = 'cons_'
+    tag = hashlib.sha1(os.path.abspath(fasta_file)).hexdigest()[:8]
+    return os.path.join(out_dir, "DBs", "%s%s.%s.k%i.npz" % (
+        prefix, os.path.basename(util.uncompressed_name(fasta_file)), tag,
+        k))
+
+
+def genome_stamp(fasta_file):
+    """
+    The size & mtime of a genome (an index is only used for the same stamp)
+
+    :param fasta_file: full path to the genome
+
+    :returns: a numpy float array
+    """
+    info = os.stat(fasta_file)
+    return np.array([info.st_size, info.st_mtime], dtype=np.float64)
+
+
+def load_index(fasta_file, k, out_dir, cons_run=False):
+    """
+    The k-mer index of a genome, built & cached if missing or out of date
+
+    The index stores the size & mtime of the genome it was built from & is
+    rebuilt when they differ.
+
+    :param fasta_file: full path to the genome
+    :param k: the k-mer size
+    :param out_dir: the SeqFindr output directory
+    :param cons_run: part of a mapping consensus run (default = False)
+
+    :returns: a sorted numpy uint32 array (see genome_kmers())
+    """
+    path = index_path(fasta_file, k, out_dir, cons_run)
+    stamp = genome_stamp(fasta_file)
+    if os.path.isfile(path):
+        with np.load(path) as stored:
+            if (stored['stamp'] == stamp).all():
+                return stored['kmers']
+    kmers = genome_kmers(fasta_file, k)
+    # Written to a temporary name (renamed once complete)
+    partial = path + '.tmp'
+    with open(partial, 'wb') as fout:
+        np.savez(fout, kmers=kmers, stamp=stamp)
+    os.rename(partial, path)
+    return kmers
+
+
+class QueryKmers(object):
+    """
+    The k-mers of every query of a query file (indexed together)
+
+    :ivar k: the k-mer size
+    :ivar lengths: the length of every query (file order)
+    :ivar kmers: the canonical k-mers of every window within a query
+    :ivar ambiguous: the windows with an ambiguous base
+    :ivar owner: the query (index) of every window
+    """
+    def __init__(self, query_file, k):
+        """
+        :param query_file: full path to the query (sequences of interest)
+                           file
+        :param k: the k-mer size
+        """
+        self.k = k
+        seqs = [seq for _, seq in util.iter_fasta(query_file)]
+        self.lengths = np.array([len(seq) for seq in seqs], dtype=np.int64)
+        codes = encode(chr(SEPARATOR).join(seqs))
+        # Windows spanning 2 queries contain the separator
+        canonical, worst = kmer_codes(codes, k)
+        inside = worst != SEPARATOR
+        self.kmers = canonical[inside]
+        self.ambiguous = worst[inside] == 4
+        starts = np.cumsum(np.concatenate([[0], self.lengths[:-1] + 1]))
+        self.owner = np.searchsorted(starts, np.flatnonzero(inside),
+                                     'right') - 1
+
+    def contained(self, genome_index):
+        """
+        The number of k-mers of each query contained in a genome
+
+        :param genome_index: the k-mer index of a genome (see load_index())
+
+        :returns: a numpy int array (one entry per query)
+        """
+        found = self.ambiguous.copy()
+        if len(genome_index):
+            pos = np.searchsorted(genome_index, self.kmers)
+            pos[pos == len(genome_index)] = 0
+            found |= genome_index[pos] == self.kmers
+        return np.bincount(self.owner[found],
+                           minlength=len(self.lengths))
+
+
+def get_query_kmers(query_file, k):
+    """
+    QueryKmers cached for as long as the query file is unchanged
+
+    :param query_file: full path to the query file
+    :param k: the k-mer size
+
+    :returns: a QueryKmers (shared, do not modify)
+    """
+    return util.cached_by_file('query_kmers_%i' % (k), query_file,
+                               lambda path: QueryKmers(path, k))
+
+
+def min_contained(lengths, k, tol, cov):
+    """
+    The fewest contained k-mers of a query that could give an accepted hit
+
+    See the module documentation for the bound.
+
+    :param lengths: the query lengths
+    :param k: the k-mer size
+    :param tol: the identity cutoff (tol-careful with --careful)
+    :param cov: the alignment coverage cutoff
+
+    :returns: a numpy float array (one entry per query, <= 0 if every query
+              of that length is kept)
+    """
+    slope = tol * k - (k - 1)
+    if slope <= 0:
+        return np.zeros(len(lengths))
+    # Rounded down a little so float error never rejects a borderline query
+    return cov * np.asarray(lengths) * slope - (k - 1) - 1e-6
+
+
+def candidates(query_file, genome_index, k, tol, cov):
+    """
+    The queries that could give an accepted hit in a genome
+
+    :param query_file: full path to the query file
+    :param genome_index: the k-mer index of the genome (see load_index())
+    :param k: the k-mer size
+    :param tol: the identity cutoff (tol-careful with --careful)
+    :param cov: the alignment coverage cutoff
+
+    :returns: a numpy boolean array (one entry per query, file order)
+    """
+    queries = get_query_kmers(query_file, k)
+    need = min_contained(queries.lengths, k, tol, cov)
+    return queries.contained(genome_index) >= need
+
+
+def write_queries(query_file, keep, out_file):
+    """
+    Write the kept queries of a query file to a new query file
+
+    :param query_file: full path to the query file
+    :param keep: one boolean per query (file order)
+    :param out_file: full path to the new query file
+    """
+    # Written to a temporary name (renamed once complete)
+    partial = out_file + '.tmp'
+    with open(partial, 'w') as fout:
+        for (header, seq), kept in zip(util.iter_fasta(query_file), keep):
+            if kept:
+                fout.write(">%s\n%s\n" % (header, seq))
+    os.rename(partial, out_file)
+
+
+def usable(k, tol):
+    """
+    Can the prefilter skip any query at this cutoff (see min_contained())
+
+    :param k: the k-mer size
+    :param tol: the identity cutoff (tol-careful with --careful)
+
+    :rtype: boolean
+    """
+    return tol * k - (k - 1) > 0
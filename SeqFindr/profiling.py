@@ -0,0 +1,238 @@
+# Copyright 2013-2014 Mitchell Stanton-Cook Licensed under the
+#     Educational Community License, Version 2.0 (the "License"); you may
+#     not use this file except in compliance with the License. You may
+#     obtain a copy of the License at
+#
+#      http://www.osedu.org/licenses/ECL-2.0
+#
+#     Unless required by applicable law or agreed to in writing,
+#     software distributed under the License is distributed on an "AS IS"
+#     BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+#     or implied. See the License for the specific language governing
+#     permissions and limitations under the License.
+
+"""
+SeqFindr stage instrumentation
+
+Each stage (i.e. makeblastdb, blast & parse per genome, clustering,
+rendering) records its:
+
+    * wall time
+    * CPU time of SeqFindr (cpu) & of the finished BLAST processes it ran
+      (child_cpu)
+    * peak RSS (KB) of SeqFindr & of its largest finished child so far
+    * bytes read & written (including finished children, Linux only)
+
+CPU, RSS & I/O are process wide so stages of concurrent sessions (threads)
+are blurred together. Stages run in pool workers are recorded in the worker
+& merged back into the parent recorder.
+
+The records of a run can be written as a JSON report (see write_report())::
+
+    {"version": 1,
+     "stages": [{"stage", "genome", "pid", "wall", "cpu", "child_cpu",
+                 "peak_rss_kb", "child_peak_rss_kb", "read_bytes",
+                 "write_bytes"}, ...],
+     "totals": {stage: {"wall", "cpu", "child_cpu", "read_bytes",
+                        "write_bytes", "count"}},
+     "genomes": {genome: {"wall", "cpu", "child_cpu", "read_bytes",
+                          "write_bytes", "count"}}}
+"""
+
+import os
+import json
+import time
+import resource
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+REPORT_VERSION = 1
+
+# Written to the output directory (see --stage_report & --cprofile)
+REPORT_NAME = "stage_report.json"
+CPROFILE_NAME = "seqfindr.pstats"
+
+# The summed fields of the totals
+SUMMED = ['wall', 'cpu', 'child_cpu', 'read_bytes', 'write_bytes']
+
+
+def io_counters():
+    """
+    The bytes read & written by this process & its finished children
+
+    :returns: a tuple of (read, written) bytes or (None, None) if
+              /proc/self/io is not available
+    """
+    counters = {}
+    try:
+        with open('/proc/self/io') as fin:
+            for line in fin:
+                key, value = line.split(':')
+                counters[key] = int(value)
+    except (IOError, ValueError):
+        return None, None
+    return counters.get('rchar'), counters.get('wchar')
+
+
+def sample():
+    """
+    A snapshot of the process resource counters
+
+    :returns: a dictionary of the current counters
+    """
+    times = os.times()
+    read, written = io_counters()
+    return {'wall': time.time(),
+            'cpu': times[0] + times[1],
+            'child_cpu': times[2] + times[3],
+            'peak_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+            'child_peak_rss_kb':
+                resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss,
+            'read_bytes': read,
+            'write_bytes': written}
+
+
+class Recorder(object):
+    """
+    Collects the stage records of a SeqFindr run (thread-safe)
+
+    Pickles as an empty recorder so it can travel (on args) to pool workers.
+    """
+    def __init__(self):
+        self.records = []
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        # Must not be empty (or __setstate__ is skipped)
+        return {'records': []}
+
+    def __setstate__(self, state):
+        self.__init__()
+
+    @contextmanager
+    def stage(self, name, genome=None):
+        """
+        Record the resources used by the enclosed block
+
+        :param name: the stage name
+        :param genome: the strain id the stage worked on (default = None)
+        """
+        before = sample()
+        try:
+            yield
+        finally:
+            after = sample()
+            record = OrderedDict([('stage', name), ('genome', genome),
+                                  ('pid', os.getpid())])
+            for key in ['wall', 'cpu', 'child_cpu', 'read_bytes',
+                        'write_bytes']:
+                if after[key] is None:
+                    record[key] = None
+                else:
+                    record[key] = after[key] - before[key]
+            record['peak_rss_kb'] = after['peak_rss_kb']
+            record['child_peak_rss_kb'] = after['child_peak_rss_kb']
+            self.extend([record])
+
+    def extend(self, records):
+        """
+        Add records (i.e. from a pool worker)
+
+        :param records: a list of stage records
+        """
+        with self._lock:
+            self.records.extend(records)
+
+
+@contextmanager
+def stage(args, name, genome=None):
+    """
+    Record a stage with args.recorder (a no-op without a recorder)
+
+    :param args: the arguments given from argparse
+    :param name: the stage name
+    :param genome: the strain id the stage worked on (default = None)
+    """
+    recorder = getattr(args, 'recorder', None)
+    if recorder is None:
+        yield
+    else:
+        with recorder.stage(name, genome):
+            yield
+
+
+def summarise(records, key):
+    """
+    Sum the records grouped by a record field
+
+    :param records: a list of stage records
+    :param key: the field to group by (i.e. 'stage' or 'genome'). Records
+                with None for the field are skipped
+
+    :returns: an OrderedDict (first seen order) of group to summed fields
+    """
+    groups = OrderedDict()
+    for record in records:
+        if record[key] is None:
+            continue
+        total = groups.setdefault(record[key], OrderedDict(
+            [(field, 0) for field in SUMMED] + [('count', 0)]))
+        for field in SUMMED:
+            if record[field] is None or total[field] is None:
+                total[field] = None
+            else:
+                total[field] += record[field]
+        total['count'] += 1
+    return groups
+
+
+def timings(records):
+    """
+    The total wall time of each stage
+
+    :param records: a list of stage records
+
+    :returns: an OrderedDict of stage name to wall time (seconds)
+    """
+    return OrderedDict([(name, total['wall']) for name, total in
+                        summarise(records, 'stage').items()])
+
+
+def write_report(path, records):
+    """
+    Write the JSON stage report
+
+    :param path: full path to the report file
+    :param records: a list of stage records
+    """
+    report = OrderedDict([('version', REPORT_VERSION),
+                          ('stages', records),
+                          ('totals', summarise(records, 'stage')),
+                          ('genomes', summarise(records, 'genome'))])
+    tmp = path + '.tmp'
+    with open(tmp, 'w') as fout:
+        json.dump(report, fout, indent=1)
+    os.rename(tmp, path)
+
+
+@contextmanager
+def cprofile(path):
+    """
+    Run the enclosed block under cProfile (a no-op if path is None)
+
+    Only the calling thread is profiled.
+
+    :param path: full path to dump the profile statistics to (see pstats)
+    """
+    if path is None:
+        yield
+        return
+    import cProfile
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        profiler.dump_stats(path)
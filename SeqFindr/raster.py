@@ -0,0 +1,132 @@
+# Copyright 2013-2014 Mitchell Stanton-Cook Licensed under the
+#     Educational Community License, Version 2.0 (the "License"); you may
+#     not use this file except in compliance with the License. You may
+#     obtain a copy of the License at
+#
+#      http://www.osedu.org/licenses/ECL-2.0
+#
+#     Unless required by applicable law or agreed to in writing,
+#     software distributed under the License is distributed on an "AS IS"
+#     BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+#     or implied. See the License for the specific language governing
+#     permissions and limitations under the License.
+
+"""
+SeqFindr large matrix rasterization
+
+Renders the plotting scale matrix straight to a bounded size RGB image a
+block of rows at a time. Each pixel is the mean of the cells it covers
+(block downsampling) shaded gray as per matplotlib's gray colormap & blended
+with the query class shading (as per axvspan with alpha 0.1).
+"""
+
+import numpy as np
+
+# The shading alpha of the query class regions
+SHADE_ALPHA = 0.1
+
+# Output rows converted to RGB at a time
+BLOCK_ROWS = 256
+
+
+def bin_starts(n, bins):
+    """
+    The first index of each of a number of contiguous, near equal bins
+
+    :param n: the number of elements (>= bins)
+    :param bins: the number of bins
+
+    :returns: a numpy array of bin start indices
+    """
+    return (np.arange(bins, dtype=np.int64) * n) // bins
+
+
+def downsample(blocks, nrows, ncols, out_rows, out_cols):
+    """
+    Mean of the cells covered by each output pixel, a block of rows at a time
+
+    :param blocks: an iterable of numpy arrays (consecutive rows, ncols
+                   columns)
+    :param nrows: the total number of rows
+    :param ncols: the number of columns
+    :param out_rows: the number of output rows (<= nrows)
+    :param out_cols: the number of output columns (<= ncols)
+
+    :returns: a tuple of the (out_rows x out_cols) numpy array of means, the
+              minimum & the maximum cell value
+    """
+    sums = np.zeros((out_rows, out_cols), dtype=np.float64)
+    counts = np.zeros(out_rows, dtype=np.int64)
+    row_starts = bin_starts(nrows, out_rows)
+    col_starts = bin_starts(ncols, out_cols)
+    col_counts = np.diff(np.append(col_starts, ncols))
+    vmin, vmax = np.inf, -np.inf
+    start = 0
+    for block in blocks:
+        if block.shape[0] == 0:
+            continue
+        stop = start + block.shape[0]
+        vmin = min(vmin, block.min())
+        vmax = max(vmax, block.max())
+        col_sums = np.add.reduceat(block, col_starts, axis=1)
+        row_bins = np.searchsorted(row_starts, np.arange(start, stop),
+                                   side='right') - 1
+        first = np.flatnonzero(np.r_[True, row_bins[1:] != row_bins[:-1]])
+        sums[row_bins[first]] += np.add.reduceat(col_sums, first, axis=0)
+        counts += np.bincount(row_bins, minlength=out_rows)
+        start = stop
+    sums /= counts[:, None]
+    sums /= col_counts[None, :]
+    return sums, vmin, vmax
+
+
+def column_shading(column_colors, ncols, out_cols):
+    """
+    The premultiplied class shading (& its alpha) of each output column
+
+    :param column_colors: a list (one element per column) of RGB tuples or
+                          None (not shaded)
+    :param ncols: the number of columns
+    :param out_cols: the number of output columns (<= ncols)
+
+    :returns: a tuple of numpy arrays, the (out_cols x 3) alpha * RGB & the
+              out_cols alphas
+    """
+    color = np.zeros((ncols, 3), dtype=np.float64)
+    alpha = np.zeros(ncols, dtype=np.float64)
+    for idx, rgb in enumerate(column_colors):
+        if rgb is not None:
+            color[idx] = SHADE_ALPHA * np.asarray(rgb[:3], dtype=np.float64)
+            alpha[idx] = SHADE_ALPHA
+    col_starts = bin_starts(ncols, out_cols)
+    col_counts = np.diff(np.append(col_starts, ncols))
+    color = np.add.reduceat(color, col_starts, axis=0) / col_counts[:, None]
+    alpha = np.add.reduceat(alpha, col_starts) / col_counts
+    return color, alpha
+
+
+def to_rgb(means, vmin, vmax, shade_color, shade_alpha):
+    """
+    Shade the pixel means gray & blend in the class shading
+
+    :param means: the (out_rows x out_cols) pixel means (see downsample())
+    :param vmin: the value drawn black
+    :param vmax: the value drawn white
+    :param shade_color: the premultiplied shading (see column_shading())
+    :param shade_alpha: the shading alphas (see column_shading())
+
+    :returns: a (out_rows x out_cols x 3) numpy uint8 RGB image
+    """
+    image = np.empty(means.shape + (3,), dtype=np.uint8)
+    for start in range(0, means.shape[0], BLOCK_ROWS):
+        gray = means[start:start+BLOCK_ROWS] - vmin
+        if vmax > vmin:
+            gray /= (vmax - vmin)
+        else:
+            gray[:] = 0.0
+        gray *= (1.0 - shade_alpha)[None, :]
+        for channel in range(3):
+            rgb = gray + shade_color[None, :, channel]
+            image[start:start+BLOCK_ROWS, :, channel] = \
+                np.round(np.clip(rgb, 0.0, 1.0) * 255)
+    return image
@@ -0,0 +1,167 @@
+# Copyright 2013-2014 Mitchell Stanton-Cook Licensed under the
+#     Educational Community License, Version 2.0 (the "License"); you may
+#     not use this file except in compliance with the License. You may
+#     obtain a copy of the License at
+#
+#      http://www.osedu.org/licenses/ECL-2.0
+#
+#     Unless required by applicable law or agreed to in writing,
+#     software distributed under the License is distributed on an "AS IS"
+#     BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+#     or implied. See the License for the specific language governing
+#     permissions and limitations under the License.
+
+"""
+SeqFindr batch review of --careful hits
+
+With --careful & --review the borderline HSPs (within tol-careful of the
+cutoff) are not asked about while parsing. They are left out of the hits &
+appended to a tab separated review file in the output directory::
+
+    strain_id  source    name   score     align_length  query_length ...
+    S1         assembly  geneA  0.850000  1000          1000         ...
+
+with identities & gaps as the last columns.
+
+Copy the review file, fill in a decision column (y accepts the hit, n or
+empty rejects it) & apply it to the stored matrix (see apply_decisions() &
+seqfindr_review). Only the accepted cells change, BLAST is not run again.
+"""
+
+import sys
+
+from SeqFindr import hitmatrix
+from SeqFindr import util
+
+# Written to the output directory
+REVIEW_NAME = "careful_review.tsv"
+
+FIELDS = ['strain_id', 'source', 'name', 'score', 'align_length',
+          'query_length', 'identities', 'gaps']
+
+# The (matrix plane) source of each row of a review
+SOURCES = ['assembly', 'consensus']
+
+
+def source_name(cons_run):
+    """
+    The source of the hits of a run (assembly or consensus)
+
+    :param cons_run: part of a mapping consensus run
+
+    :rtype: string
+    """
+    return SOURCES[int(bool(cons_run))]
+
+
+def record(path, strain_id, cons_run, entries):
+    """
+    Append the HSPs to inspect of a genome to the review file
+
+    The header is written with the first entries.
+
+    :param path: full path to the review file
+    :param strain_id: the strain id
+    :param cons_run: part of a mapping consensus run
+    :param entries: a list of (name, score, align_length, query_length,
+                    identities, gaps) tuples (see blast.check_hsp())
+
+    :type path: string
+    :type strain_id: string
+    :type cons_run: boolean
+    :type entries: list
+    """
+    if not entries:
+        return
+    lines = []
+    for name, score, align_length, query_length, identities, gaps in entries:
+        lines.append("%s\t%s\t%s\t%f\t%i\t%i\t%i\t%i\n" % (
+            strain_id, source_name(cons_run), name, score, align_length,
+            query_length, identities, gaps))
+    util.append_locked(path, ''.join(lines),
+                       header='\t'.join(FIELDS) + '\n')
+
+
+def read_decisions(path):
+    """
+    Read the accepted hits of a decisions file
+
+    A decisions file is a review file with a decision column added (y, n or
+    empty). Only strain_id, source, name & decision are used. Header lines
+    after the first are skipped.
+
+    :param path: full path to the decisions file
+
+    :type path: string
+
+    :returns: a set of accepted (strain_id, source, name) tuples
+    """
+    accepted = set()
+    columns = None
+    with open(path, 'rU') as fin:
+        for number, line in enumerate(fin, 1):
+            fields = line.rstrip('\n').split('\t')
+            if not line.strip():
+                continue
+            if fields[0] == FIELDS[0]:
+                if columns is not None:
+                    continue
+                columns = dict((field, idx) for idx, field in
+                               enumerate(fields))
+                if 'decision' not in columns:
+                    raise ValueError("%s has no decision column" % (path))
+                continue
+            if columns is None:
+                raise ValueError("%s has no header line" % (path))
+            decision = ''
+            if columns['decision'] < len(fields):
+                decision = fields[columns['decision']].strip().lower()
+            if decision not in ('y', 'n', ''):
+                raise ValueError("Line %i of %s: decision must be y, n or "
+                                 "empty (not %s)" % (number, path, decision))
+            source = fields[columns['source']]
+            if source not in SOURCES:
+                raise ValueError("Line %i of %s: unknown source %s" %
+                                 (number, path, source))
+            if decision == 'y':
+                accepted.add((fields[columns['strain_id']], source,
+                              fields[columns['name']]))
+    return accepted
+
+
+def apply_decisions(matrix, strain_labels, query_list, accepted):
+    """
+    Set the matrix cells of the accepted hits
+
+    :param matrix: the hit matrix
+    :param strain_labels: the strain ids (one per row)
+    :param query_list: the query ids (one per column)
+    :param accepted: a set of (strain_id, source, name) tuples (see
+                     read_decisions())
+
+    :type matrix: HitMatrix
+    :type strain_labels: list
+    :type query_list: list
+    :type accepted: set
+
+    :returns: a tuple of the updated (copied) hit matrix & the number of
+              cells changed
+    """
+    rows = dict((label, idx) for idx, label in enumerate(strain_labels))
+    cols = dict((query, idx) for idx, query in enumerate(query_list))
+    planes = [plane.copy() for plane in matrix.planes()]
+    changed = 0
+    for strain_id, source, name in sorted(accepted):
+        plane = SOURCES.index(source)
+        if strain_id not in rows or name not in cols or \
+                plane >= len(planes):
+            sys.stderr.write("No matrix cell for %s %s %s. Skipping\n" %
+                             (strain_id, source, name))
+            continue
+        row, col = rows[strain_id], cols[name]
+        bit = 0x80 >> (col & 7)
+        if not planes[plane][row, col >> 3] & bit:
+            planes[plane][row, col >> 3] |= bit
+            changed += 1
+    planes.append(None)
+    return hitmatrix.HitMatrix(matrix.ncols, planes[0], planes[1]), changed
@@ -24,27 +24,29 @@ import argparse
 import time
 import copy
 import glob
-
-import matplotlib
-matplotlib.use('Agg')
-import matplotlib.pyplot as plt
-import matplotlib.cm as cm
-from matplotlib.ticker import MultipleLocator, FormatStrFormatter
+import json
+import functools
+import multiprocessing
+from collections import OrderedDict
 
 import numpy as np
 
-from scipy.cluster.hierarchy import linkage, average, dendrogram
-from scipy.spatial.distance import pdist
-
-from Bio import SeqIO
-
 from SeqFindr import imaging
 from SeqFindr import config
 from SeqFindr import util
 from SeqFindr import blast
-
-# Stop clustering going nuts...
-sys.setrecursionlimit(1000000)
+from SeqFindr import cluster
+from SeqFindr import dbcache
+from SeqFindr import hitmatrix
+from SeqFindr import journal
+from SeqFindr import manifest
+from SeqFindr import pipeline
+from SeqFindr import prefilter
+from SeqFindr import profiling
+from SeqFindr import raster
+from SeqFindr import review
+from SeqFindr import shard
+from SeqFindr import store
 
 __title__ = 'SeqFindr'
 __version__ = '0.35.0'
@@ -62,6 +64,9 @@ __doc__ = " %s v%s - %s (%s)" % (__title__,
                                  __description__,
                                  __url__)
 
+# Cells converted to floats at a time when rendering large matrices
+BLOCK_CELLS = 1 << 20
+
 
 def prepare_queries(args):
     """
@@ -83,22 +88,24 @@ def prepare_queries(args):
 
     :rtype: 2 lists, 1) of all queries and, 2) corresponding query classes
     """
-    query_list, query_classes = [], []
-
-    with open(args.seqs_of_interest, "rU") as fin:
-        records = SeqIO.parse(fin, "fasta")
-        for rec in records:
-            cur = rec.description
-            query_list.append(cur.split(',')[1].strip())
-            query_classes.append(cur.split('[')[-1].split(']')[0].strip())
-    unique = list(set(query_list))
-    sys.stderr.write("Investigating %i features\n" % (len(unique)))
-    for e in unique:
-        if query_list.count(e) != 1:
+    database = util.get_query_database(args.seqs_of_interest)
+    sys.stderr.write("Investigating %i features\n" %
+                     (len(set(database.query_list))))
+    if database.duplicates:
+        for e in database.duplicates:
             sys.stderr.write("Duplicates found for: %s\n" % (e))
-            sys.stderr.write("Fix duplicates\n")
-            sys.exit(1)
-    return query_list, query_classes
+        sys.stderr.write("Fix duplicates\n")
+        sys.exit(1)
+    return list(database.query_list), list(database.query_classes)
+
+
+def _trim_worker(task):
+    """
+    Pool worker wrapping util.trim_fasta_file()
+
+    :param task: a tuple of (input file, output file, strip)
+    """
+    return util.trim_fasta_file(*task)
 
 
 def strip_bases(args):
@@ -109,9 +116,18 @@ def strip_bases(args):
         * args.cons
         * args.seqs_of_interest
         * arg.strip
+        * args.output
+        * args.jobs
 
     To avoid the effects of lead in and lead out coverage resulting in
-    uncalled bases
+    uncalled bases. The stripped consensuses (stripped/) & database
+    (<database>_trimmed.<ext>) are written to the output directory
+
+    Consensuses & the database may be gzip (or bgzip) compressed (they are
+    decompressed as they are read). Files are trimmed
+    concurrently by a pool of args.jobs workers & outputs that are up to
+    date (same input size, mtime & strip as recorded in
+    stripped/.strip_state.json) are not trimmed again.
 
     :param args: the argparse args containing args.strip value
 
@@ -123,32 +139,58 @@ def strip_bases(args):
     # Get in the fasta files in the consensus directory
     fasta_in = util.get_fasta_files(args.cons)
     # Build a stripped directory
-    new_cons_dir = os.path.join(args.cons, 'stripped')
+    new_cons_dir = os.path.join(args.output, 'stripped')
     try:
         os.mkdir(new_cons_dir)
     except OSError:
         sys.stderr.write("A stripped directory exists. Overwriting\n")
-    # Update the args.cons to the stripped directory
-    args.cons = new_cons_dir
     args.strip = int(args.strip)
-    # Strip the start and end
-    for fa in fasta_in:
-        tmp = os.path.basename(fa)
-        out = os.path.join(args.cons, tmp)
-        with open(fa, "rU") as fin, open(out, 'w') as fout:
-            records = SeqIO.parse(fin, "fasta")
-            for rec in records:
-                rec.seq = rec.seq[args.strip:-args.strip]
-                SeqIO.write(rec, fout, "fasta")
-    # Trim the db as well
-    tmp = args.seqs_of_interest.split('.')
-    stripdb = '.'.join(tmp[:-1])+'_trimmed.'+tmp[-1]
-    with open(args.seqs_of_interest, "rU") as fin, open(stripdb, 'w') as fout:
-        records = SeqIO.parse(fin, "fasta")
-        for rec in records:
-            rec.seq = rec.seq[args.strip:-args.strip]
-            SeqIO.write(rec, fout, "fasta")
-    # Update the args.seqs_of_interest
+    # The database is trimmed as well
+    tmp = os.path.basename(
+        util.uncompressed_name(args.seqs_of_interest)).split('.')
+    stripdb = os.path.join(args.output,
+                           '.'.join(tmp[:-1])+'_trimmed.'+tmp[-1])
+    tasks = [(fa, os.path.join(new_cons_dir,
+                               os.path.basename(util.uncompressed_name(fa))))
+             for fa in fasta_in]
+    tasks.append((args.seqs_of_interest, stripdb))
+    # Remove stale outputs (from consensuses no longer given)
+    outputs = set([out for _, out in tasks])
+    for stale in util.get_fasta_files(new_cons_dir):
+        if stale not in outputs:
+            os.remove(stale)
+    state_file = os.path.join(new_cons_dir, '.strip_state.json')
+    state = {}
+    if os.path.isfile(state_file):
+        with open(state_file) as fin:
+            state = json.load(fin)
+    todo, new_state = [], {}
+    for src, out in tasks:
+        info = os.stat(src)
+        stamp = [src, info.st_size, info.st_mtime, args.strip]
+        new_state[out] = stamp
+        if state.get(out) != stamp or not os.path.isfile(out):
+            todo.append((src, out, args.strip))
+    sys.stderr.write("Stripping %i of %i files (%i up to date)\n" %
+                     (len(todo), len(tasks), len(tasks) - len(todo)))
+    if getattr(args, 'jobs', 1) > 1 and len(todo) > 1:
+        pool = multiprocessing.Pool(processes=min(args.jobs, len(todo)))
+        try:
+            pool.map(_trim_worker, todo)
+            pool.close()
+        except BaseException:
+            pool.terminate()
+            raise
+        finally:
+            pool.join()
+    else:
+        for task in todo:
+            _trim_worker(task)
+    with open(state_file + '.tmp', 'w') as fout:
+        json.dump(new_state, fout)
+    os.rename(state_file + '.tmp', state_file)
+    # Update the args.cons & args.seqs_of_interest
+    args.cons = new_cons_dir
     args.seqs_of_interest = stripdb
     return args
 
@@ -157,10 +199,12 @@ def build_matrix_row(all_vfs, accepted_hits, score=None):
     """
     Populate row given all possible hits, accepted hits and an optional score
 
+    A single row of hitmatrix.pack_hits() on the float scale.
+
     :param all_vfs: a list of all virulence factor ids
     :param accepted_hits: a list of a hits that passed the cutoof
     :param score: the value to fill the matrix with (default = None which
-                  implies 0.5)
+                  implies 0.0)
 
     :type all_vfs: list
     :type accepted_hits: list
@@ -170,19 +214,18 @@ def build_matrix_row(all_vfs, accepted_hits, score=None):
     """
     if score is None:
         score = 0.0
-    row = []
-    for factor in all_vfs:
-        if factor in accepted_hits:
-            row.append(score)
-        else:
-            row.append(0.5)
-    return row
+    hit = hitmatrix.unpack(hitmatrix.pack_hits(all_vfs, [accepted_hits]),
+                           len(all_vfs))[0]
+    return np.where(hit, score, 0.5).tolist()
 
 
 def match_matrix_rows(ass_mat, cons_mat):
     """
     Reorder a second matrix based on the first row element of the 1st matrix
 
+    Rows without a partner are dropped. See join_matrix_rows() to work with
+    numpy arrays & learn which strains are missing.
+
     :param ass_mat: a 2D list of scores
     :param cons_mat: a 2D list scores
 
@@ -191,14 +234,10 @@ def match_matrix_rows(ass_mat, cons_mat):
 
     :rtype: 2 matricies (2D lists)
     """
-    reordered_ass, reordered_cons = [], []
-    for i in range(0, len(ass_mat)):
-        for j in range(0, len(cons_mat)):
-            if ass_mat[i][0] == cons_mat[j][0]:
-                reordered_ass.append(ass_mat[i][1:])
-                reordered_cons.append(cons_mat[j][1:])
-                break
-    return reordered_ass, reordered_cons
+    ass_j, cons_j, _, _, _ = join_matrix_rows(
+        strip_id_from_matrix(ass_mat), [row[0] for row in ass_mat],
+        strip_id_from_matrix(cons_mat), [row[0] for row in cons_mat])
+    return ass_j.tolist(), cons_j.tolist()
 
 
 def strip_id_from_matrix(mat):
@@ -209,67 +248,162 @@ def strip_id_from_matrix(mat):
 
     :rtype: a 2D list with the 1st row elelemnt (ID) removed
     """
-    new_mat = []
-    for i in range(0, len(mat)):
-        new_mat.append(mat[i][1:])
-    return new_mat
+    return [row[1:] for row in mat]
+
+
+def join_matrix_rows(ass_mat, ass_labels, cons_mat, cons_labels):
+    """
+    Align the consensus matrix rows to the assembly matrix rows by strain id
+
+    A hash join so linear in the number of strains.
+
+    :param ass_mat: a numpy matrix of assembly scores
+    :param ass_labels: the strain ids of the ass_mat rows
+    :param cons_mat: a numpy matrix of mapping consensus scores
+    :param cons_labels: the strain ids of the cons_mat rows
+
+    :type ass_mat: numpy matrix
+    :type ass_labels: list
+    :type cons_mat: numpy matrix
+    :type cons_labels: list
+
+    :returns: a tuple of the joined assembly matrix, the joined consensus
+              matrix, the joined strain ids (assembly order), the strain ids
+              missing from the consensus & the strain ids missing from the
+              assemblies
+    """
+    cons_index = {}
+    for idx, label in enumerate(cons_labels):
+        cons_index.setdefault(label, idx)
+    ass_rows, cons_rows, labels, no_cons = [], [], [], []
+    seen = set()
+    for idx, label in enumerate(ass_labels):
+        if label in cons_index:
+            ass_rows.append(idx)
+            cons_rows.append(cons_index[label])
+            labels.append(label)
+            seen.add(label)
+        else:
+            no_cons.append(label)
+    no_ass = [label for label in cons_labels if label not in seen]
+    ass_mat, cons_mat = np.asarray(ass_mat), np.asarray(cons_mat)
+    return (ass_mat[ass_rows], cons_mat[cons_rows], labels, no_cons, no_ass)
+
+
+def draw_dendrogram(Z, labels, dpi, dendrogram_file):
+    """
+    Draw the dendrogram of a clustering
+
+    :param Z: a linkage matrix
+    :param labels: the leaf labels
+    :param dpi: the resolution to save the diagram at
+    :param dendrogram_file: the file to save the diagram to
+    """
+    from scipy.cluster.hierarchy import dendrogram
+    plt = imaging.pyplot()
+    # Drawing the dendrogram is recursive. Stop it going nuts...
+    sys.setrecursionlimit(max(sys.getrecursionlimit(), 10000 + 10*len(Z)))
+    # Clear any matplotlib formatting
+    plt.clf()
+    fig = plt.figure()
+    ax = fig.add_subplot(111)
+    # Hide x labels/ticks
+    ax.set_yticklabels([])
+    ax.set_yticks([])
+    plt.xticks(fontsize=6)
+    dendrogram(Z, labels=labels, link_color_func=None)
+    plt.savefig(dendrogram_file, dpi=dpi)
+    plt.close(fig)
 
 
-def cluster_matrix(matrix, labels, dpi, by_cols, algorithm):
+def cluster_matrix(matrix, labels, dpi, by_cols, algorithm,
+                   dendrogram_file="dendrogram.png", metric='euclidean',
+                   collapse=False):
     """
     From a matrix, generate a distance matrix & perform hierarchical clustering
 
-    :param matrix: a numpy matrix of scores
+    :param matrix: the hit matrix
     :param labels: the ids for all row elements or column elements
     :param dpi: the resolution to save the diagram at
     :param by_cols: whether to perform the clustering by row similarity
                     (default) or column similarity.
     :param algorithm: the clustering algorithm (linkage (default, False)
                       or UPGMA)
-
-    :type matrix: numpy matrix
+    :param dendrogram_file: where to draw the dendrogram (default =
+                            dendrogram.png). None skips drawing
+    :param metric: the distance metric, euclidean (default) or hamming (on
+                   packed bit vectors)
+    :param collapse: cluster the identical rows as one (default = False).
+                     Equally valid but the order within ties may differ from
+                     the uncollapsed clustering
+
+    :type matrix: HitMatrix
     :type labels: list
     :type dpi: int
     :type by_cols: boolean (default == False)
     :type algorithm: boolean
+    :type dendrogram_file: string
+    :type metric: string
+    :type collapse: boolean
 
     :returns: a tuple of the updated (clustered) matrix & the updated labels
     """
     if by_cols:
         matrix = matrix.transpose()
     print "\nClustering the matrix"
-    # Clear any matplotlib formatting
-    plt.clf()
-    fig = plt.figure()
-    ax = fig.add_subplot(111)
-    # Hide x labels/ticks
-    ax.set_yticklabels([])
-    ax.set_yticks([])
-    plt.xticks(fontsize=6)
-    Y = pdist(matrix)
-    if not algorithm:
-        Z = linkage(Y)
-        print "Linkage algorithm\n"
+    nrows = matrix.shape[0]
+    if collapse:
+        _, groups = cluster.collapse_rows(matrix.packed())
+        unique = matrix.take([group[0] for group in groups])
+        sys.stderr.write("%i unique of %i\n" % (len(groups), nrows))
     else:
-        Z = average(Y)
-        print "UPGMA algorithm\n"
-    dend = dendrogram(Z, labels=labels, link_color_func=None)
-    plt.savefig("dendrogram.png", dpi=dpi)
+        unique, groups = matrix, [[idx] for idx in range(nrows)]
+    if len(groups) > 1:
+        Z = cluster.hierarchy(unique, algorithm, metric)
+        if not algorithm:
+            print "Linkage algorithm\n"
+        else:
+            print "UPGMA algorithm\n"
+        if dendrogram_file is not None:
+            leaf_labels = [','.join([labels[idx] for idx in group])
+                           for group in groups]
+            with imaging.PLOT_LOCK:
+                draw_dendrogram(Z, leaf_labels, dpi, dendrogram_file)
+        leaves = cluster.leaf_order(Z)
+    else:
+        leaves = range(len(groups))
     # Reshape
-    ordered_index = dend['leaves']
-    updated_labels = dend['ivl']
-    tmp = []
-    for i in range(0, len(ordered_index)):
-        tmp.append(list(matrix[ordered_index[i], :]))
-    matrix = np.array(tmp)
+    ordered_index = [idx for leaf in leaves for idx in groups[leaf]]
+    updated_labels = [labels[idx] for idx in ordered_index]
+    matrix = matrix.take(ordered_index)
     if by_cols:
         matrix = matrix.transpose()
     return matrix, updated_labels
 
 
+def shading_colors(vfs_classes, color_index, config_object, seed):
+    """
+    The colors used to shade the query class regions
+
+    :param vfs_classes: the VFS class (in mfa header [class])
+    :param color_index: for a single class, choose a specific color
+    :param config_object: a SeqFindrConfig object
+    :param seed: the color generation seed
+
+    :returns: a list of RGB tuples (one per query class region)
+    """
+    if config_object['category_colors'] is not None:
+        colors = config_object['category_colors']
+    else:
+        colors = imaging.generate_colors(len(set(vfs_classes)), seed)
+    if color_index is not None:
+        colors = [colors[(color_index)]]
+    return colors
+
+
 def plot_matrix(matrix, strain_labels, vfs_classes, gene_labels,
                 show_gene_labels, color_index, config_object, grid, seed,
-                dpi, size, svg, cluster_column, aspect='auto'):
+                dpi, size, svg, cluster_column, aspect='auto', out_dir=''):
     """
     Plot the VF hit matrix
 
@@ -279,13 +413,13 @@ def plot_matrix(matrix, strain_labels, vfs_classes, gene_labels,
     :param gene_labels: the gene labels
     :param show_gene_labels: wheter top plot the gene labels
     :param color_index: for a single class, choose a specific color
+    :param out_dir: the directory to save results.png/svg to (default = '',
+                    the working directory)
     """
-    if config_object['category_colors'] is not None:
-        colors = config_object['category_colors']
-    else:
-        colors = imaging.generate_colors(len(set(vfs_classes)), seed)
-    if color_index is not None:
-        colors = [colors[(color_index)]]
+    import matplotlib.cm as cm
+    from matplotlib.ticker import MultipleLocator, FormatStrFormatter
+    plt = imaging.pyplot()
+    colors = shading_colors(vfs_classes, color_index, config_object, seed)
     # Build the regions to be shaded differently
     if not cluster_column:
         regions, prev = [], 0
@@ -332,11 +466,14 @@ def plot_matrix(matrix, strain_labels, vfs_classes, gene_labels,
         ax.grid(True)
     x, y = size.split('x')
     x, y = float(x), float(y)
-    fig.set_size_inches(x, y, dpi=dpi)
+    fig.set_size_inches(x, y)
     if svg:
-        plt.savefig("results.svg", bbox_inches='tight', dpi=dpi)
+        plt.savefig(os.path.join(out_dir, "results.svg"), bbox_inches='tight',
+                    dpi=dpi)
     else:
-        plt.savefig("results.png", bbox_inches='tight', dpi=dpi)
+        plt.savefig(os.path.join(out_dir, "results.png"), bbox_inches='tight',
+                    dpi=dpi)
+    plt.close(fig)
 
 
 def determine_nohit_score(cons, invert):
@@ -385,18 +522,10 @@ def strip_uninteresting(matrix, query_classes, query_list, cons, invert):
               query_list respectively.
     """
     nohit = determine_nohit_score(cons, invert)
-    to_remove = []
-    for idx, column in enumerate(matrix.T):
-        target = len(column)
-        count = 0
-        for elem in column:
-            if elem == nohit:
-                count += 1
-        if count == target:
-            to_remove.append(idx)
-    new = np.delete(matrix, to_remove, 1)
-    query_classes = util.del_from_list(query_classes, to_remove)
-    query_list = util. del_from_list(query_list, to_remove)
+    keep = ~(matrix == nohit).all(axis=0)
+    new = matrix[:, keep]
+    query_classes = list(np.asarray(query_classes, dtype=object)[keep])
+    query_list = list(np.asarray(query_list, dtype=object)[keep])
     return new, query_classes, query_list
 
 
@@ -411,254 +540,1396 @@ def check_singularity(matrix, cons, invert):
         raise ValueError(msg)
 
 
-def do_run(args, data_path, match_score, vfs_list, cons_run):
+def stage_prefix(cons_run):
     """
-    Perform a SeqFindr run
+    The prefix of the stage names (see profiling) of a run
+
+    :param cons_run: part of a mapping consensus run
+
+    :rtype: string
+    """
+    if cons_run:
+        return 'cons_'
+    return ''
+
+
+def review_entries(args):
+    """
+    The list collecting the HSPs to inspect of a genome
+
+    :param args: the arguments given from argparse
+
+    :returns: an empty list with args.review otherwise None (ask while
+              parsing, see blast.check_hsp())
+    """
+    if args.review:
+        return []
+    return None
+
+
+def record_review(args, strain_id, cons_run, entries):
+    """
+    Add the HSPs to inspect of a genome to the review file in args.output
+
+    :param args: the arguments given from argparse
+    :param strain_id: the strain id
+    :param cons_run: part of a mapping consensus run
+    :param entries: the HSPs to inspect (see review_entries()) or None
+    """
+    if entries is not None:
+        review.record(os.path.join(args.output, review.REVIEW_NAME),
+                      strain_id, cons_run, entries)
+
+
+def start_review(args):
+    """
+    Remove the review file of an earlier run in args.output
+
+    The file is kept when resuming an interrupted run of the same queries &
+    cut-offs (the journal has entries for the run key, see screen_genomes())
+    as the genomes already screened are not parsed again.
+
+    :param args: the arguments given from argparse
+    """
+    path = os.path.join(args.output, review.REVIEW_NAME)
+    if not os.path.isfile(path):
+        return
+    resuming = (not args.no_resume and not args.combined_db and
+                args.existing_data is None and
+                journal.Journal(os.path.join(args.output,
+                                             journal.JOURNAL_NAME),
+                                journal.run_key(args, blast.blast_version())
+                                ).has_entries())
+    if not resuming:
+        os.remove(path)
+
+
+def build_genome_database(subject, args, cons_run):
+    """
+    Build the BLAST database of a single genome (the 1st screening stage)
+
+    :param subject: full path to the genome (FASTA) to screen
+    :param args: the arguments given from argparse (databases are written
+                 to args.output)
+    :param cons_run: part of a mapping consensus run
+
+    :returns: a tuple of the genome, strain id & full path to the database
+    """
+    genome = util.get_strain_id(subject)
+    with profiling.stage(args, stage_prefix(cons_run)+'makeblastdb', genome):
+        strain_id = blast.make_BLAST_database(subject,
+                                              dbcache.get_db_cache(args),
+                                              args.output)
+    database = os.path.join(args.output, "DBs",
+                            os.path.basename(util.uncompressed_name(subject)))
+    return subject, strain_id, database
+
+
+def search_genome(built, args, cons_run):
+    """
+    Search the database of a single genome (the 2nd screening stage)
+
+    With args.prefilter only the queries that could hit the genome are
+    searched (see prefilter_queries())
+
+    :param built: the (genome, strain id, database) of
+                  build_genome_database()
+    :param args: the arguments given from argparse (results are written to
+                 args.output)
+    :param cons_run: part of a mapping consensus run
+
+    :returns: a tuple of the genome, strain id & BLAST results file
+    """
+    subject, strain_id, database = built
+    query = args.seqs_of_interest
+    if args.prefilter:
+        with profiling.stage(args, stage_prefix(cons_run)+'prefilter',
+                             strain_id):
+            query = prefilter_queries(subject, args, cons_run)
+        if query is None:
+            return subject, strain_id, blast.write_no_hits(
+                blast.results_file(args.seqs_of_interest, database, args,
+                                   cons_run, args.output))
+    with profiling.stage(args, stage_prefix(cons_run)+'blast', strain_id):
+        blast_xml = blast.run_BLAST(query, database, args, cons_run,
+                                    out_dir=args.output)
+    return subject, strain_id, blast_xml
+
+
+def prefilter_queries(subject, args, cons_run):
+    """
+    The queries of args.seqs_of_interest that could hit a genome
+
+    Queries that can't give an accepted hit (see prefilter) are left out.
+    Protein queries & tblastx searches are not prefiltered.
+
+    :param subject: full path to the genome
+    :param args: the arguments given from argparse
+    :param cons_run: part of a mapping consensus run
+
+    :returns: full path to the query file to search (args.seqs_of_interest
+              or the kept queries, written under the same name to
+              DBs/prefilter/[cons_]<genome>/ so the results file name is
+              unchanged) or None if no query could hit
+    """
+    tol = float(args.tol) - float(args.careful)
+    if args.tblastx or blast.query_is_protein(args.seqs_of_interest, args) \
+            or not prefilter.usable(args.prefilter_k, tol):
+        return args.seqs_of_interest
+    index = prefilter.load_index(subject, args.prefilter_k, args.output,
+                                 cons_run)
+    keep = prefilter.candidates(args.seqs_of_interest, index,
+                                args.prefilter_k, tol, float(args.cov))
+    sys.stderr.write("Prefilter: searching %i of %i queries in %s\n" %
+                     (keep.sum(), len(keep), util.get_strain_id(subject)))
+    if keep.all():
+        return args.seqs_of_interest
+    if not keep.any():
+        return None
+    query_dir = os.path.join(args.output, "DBs", "prefilter",
+                             stage_prefix(cons_run) +
+                             os.path.basename(util.uncompressed_name(subject)))
+    if not os.path.isdir(query_dir):
+        os.makedirs(query_dir)
+    query = os.path.join(query_dir, os.path.basename(
+        util.uncompressed_name(args.seqs_of_interest)))
+    prefilter.write_queries(args.seqs_of_interest, keep, query)
+    return query
+
+
+def parse_genome(searched, args, cons_run):
+    """
+    Parse the BLAST results of a single genome (the last screening stage)
+
+    The hits are added to args.journal (if any, see journal) & with
+    args.review the HSPs to inspect to the review file (see review)
+
+    :param searched: the (genome, strain id, BLAST results) of
+                     search_genome()
+    :param args: the arguments given from argparse
+    :param cons_run: part of a mapping consensus run
+
+    :returns: a tuple of the strain id & the list of accepted hits
+    """
+    subject, strain_id, blast_xml = searched
+    entries = review_entries(args)
+    with profiling.stage(args, stage_prefix(cons_run)+'parse', strain_id):
+        accepted_hits = blast.parse_BLAST(blast_xml, float(args.tol),
+                                          float(args.cov), args.careful,
+                                          entries)
+    record_review(args, strain_id, cons_run, entries)
+    if getattr(args, 'journal', None) is not None:
+        args.journal.record(subject, cons_run, strain_id, accepted_hits)
+    return strain_id, accepted_hits
+
+
+def screen_genome(subject, args, cons_run):
+    """
+    Build a BLAST database for a single genome, search it & parse the hits
+
+    :param subject: full path to the genome (FASTA) to screen
+    :param args: the arguments given from argparse (databases & results are
+                 written to args.output)
+    :param cons_run: part of a mapping consensus run
+
+    :type subject: string
+    :type args: argparse args
+    :type cons_run: boolean
+
+    :returns: a tuple of the strain id & the list of accepted hits
+    """
+    built = build_genome_database(subject, args, cons_run)
+    return parse_genome(search_genome(built, args, cons_run), args, cons_run)
+
+
+def screen_genomes_pipelined(in_files, args, cons_run):
+    """
+    Screen a set of genomes overlapping the makeblastdb, BLAST & parse stages
+
+    The database of the next genome is built while the current one is
+    searched & the previous results are parsed (see pipeline). At most
+    args.pipeline_depth genomes wait between stages. A genome that fails is
+    reported to STDERR and its slot is left as None.
+
+    :param in_files: a list of full paths to the genomes to screen
+    :param args: the arguments given from argparse (uses
+                 args.pipeline_depth)
+    :param cons_run: part of a mapping consensus run
+
+    :type in_files: list
+    :type args: argparse args
+    :type cons_run: boolean
+
+    :returns: a list (same order as in_files) of (strain_id, accepted_hits)
+              tuples or None for genomes that failed
+    """
+    stages = [functools.partial(func, args=args, cons_run=cons_run)
+              for func in [build_genome_database, search_genome,
+                           parse_genome]]
+    results = pipeline.run_pipeline(in_files, stages, args.pipeline_depth)
+    failed = 0
+    for idx, result in enumerate(results):
+        if isinstance(result, pipeline.StageError):
+            failed += 1
+            sys.stderr.write("Screening %s failed:\n%s" % (in_files[idx],
+                                                           result.error))
+            results[idx] = None
+    if failed:
+        sys.stderr.write("%i of %i genomes failed\n" %
+                         (failed, len(in_files)))
+    return results
+
+
+def _screen_genome_worker(task):
+    """
+    Pool worker wrapping screen_genome() so one failure can't kill the run
+
+    :param task: a tuple of (row index, subject, args, cons_run)
+
+    :returns: a tuple of (row index, subject, result, error, stage records)
+              where result is None and error holds the formatted traceback
+              on failure
+    """
+    idx, subject, args, cons_run = task
+    records = []
+    if getattr(args, 'recorder', None) is not None:
+        records = args.recorder.records
+    try:
+        result = screen_genome(subject, args, cons_run)
+    except (Exception, SystemExit):
+        return idx, subject, None, traceback.format_exc(), records
+    return idx, subject, result, None, records
+
+
+def screen_genomes_parallel(in_files, args, cons_run):
+    """
+    Screen a set of genomes concurrently using a pool of args.jobs workers
+
+    Results are filled into their input position so the row order is
+    identical to the serial path. A genome that fails is reported to STDERR
+    and its slot is left as None.
+
+    :param in_files: a list of full paths to the genomes to screen
+    :param args: the arguments given from argparse (uses args.jobs)
+    :param cons_run: part of a mapping consensus run
+
+    :type in_files: list
+    :type args: argparse args
+    :type cons_run: boolean
+
+    :returns: a list (same order as in_files) of (strain_id, accepted_hits)
+              tuples or None for genomes that failed
+    """
+    results = [None] * len(in_files)
+    tasks = [(idx, subject, args, cons_run)
+             for idx, subject in enumerate(in_files)]
+    failed = 0
+    pool = multiprocessing.Pool(processes=args.jobs)
+    try:
+        for idx, subject, result, error, records in pool.imap_unordered(
+                _screen_genome_worker, tasks):
+            if records:
+                args.recorder.extend(records)
+            if error is not None:
+                failed += 1
+                sys.stderr.write("Screening %s failed:\n%s" % (subject,
+                                                               error))
+            results[idx] = result
+        pool.close()
+    except BaseException:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+    if failed:
+        sys.stderr.write("%i of %i genomes failed\n" %
+                         (failed, len(in_files)))
+    return results
+
+
+def screen_genomes_combined(in_files, args, cons_run):
+    """
+    Screen a set of genomes with a single combined database & BLAST search
+
+    Avoids a makeblastdb & BLAST process per genome. The search is run with
+    the effective database size of the smallest genome & each HSP expect
+    value is rescaled to the genome it hit, so the accepted hits match the
+    per genome path. Genomes without sequence fail (as makeblastdb does per
+    genome) & are left out of the effective database size.
+
+    :param in_files: a list of full paths to the genomes to screen
+    :param args: the arguments given from argparse
+    :param cons_run: part of a mapping consensus run
+
+    :type in_files: list
+    :type args: argparse args
+    :type cons_run: boolean
+
+    :returns: a list (same order as in_files) of (strain_id, accepted_hits)
+              tuples or None for genomes without sequence
+    """
+    name = 'combined'
+    if cons_run:
+        name = 'cons_combined'
+    with profiling.stage(args, name+'_makeblastdb'):
+        database, strain_ids, strain_lengths, contigs = \
+            blast.make_combined_BLAST_database(in_files, name,
+                                               dbcache.get_db_cache(args),
+                                               args.output)
+    empty = set(strain_id for strain_id in strain_ids
+                if not strain_lengths[strain_id])
+    for fasta_file, strain_id in zip(in_files, strain_ids):
+        if strain_id in empty:
+            sys.stderr.write("%s has no sequence. Failed\n" % (fasta_file))
+    if len(empty) == len(strain_ids):
+        return [None] * len(strain_ids)
+    dbsize = min(strain_lengths[strain_id] for strain_id in strain_ids
+                 if strain_id not in empty)
+    protein = blast.query_is_protein(args.seqs_of_interest, args)
+    with profiling.stage(args, name+'_blast'):
+        blast_xml = blast.run_BLAST(args.seqs_of_interest, database, args,
+                                    cons_run, max_target_seqs=contigs,
+                                    dbsize=dbsize, out_dir=args.output)
+    entries = None
+    if args.review:
+        entries = {}
+    with profiling.stage(args, name+'_parse'):
+        hits = blast.parse_combined_BLAST(blast_xml, float(args.tol),
+                                          float(args.cov), args.careful,
+                                          strain_lengths, dbsize,
+                                          blast.search_evalue(args, protein),
+                                          entries)
+    if entries is not None:
+        for strain_id in strain_ids:
+            record_review(args, strain_id, cons_run,
+                          entries.get(strain_id, []))
+    return [None if strain_id in empty else
+            (strain_id, hits.get(strain_id, [])) for strain_id in strain_ids]
+
+
+def screen_genomes(in_files, args, cons_run):
+    """
+    Screen a set of genomes using the requested strategy
+
+    A single combined database (args.combined_db), a pool of args.jobs
+    workers, a pipeline overlapping the stages of consecutive genomes
+    (args.pipeline_depth > 0) or one genome at a time.
+
+    Except for a combined database, every genome screened is journaled in
+    args.output & the genomes in the journal of an earlier (interrupted)
+    run are not screened again unless args.no_resume (see journal). The
+    journal is added to args.journals (if any) to be marked complete once
+    the whole run is screened (see Session.run()).
+
+    :param in_files: a list of full paths to the genomes to screen
+    :param args: the arguments given from argparse
+    :param cons_run: part of a mapping consensus run
+
+    :type in_files: list
+    :type args: argparse args
+    :type cons_run: boolean
+
+    :returns: a list (same order as in_files) of (strain_id, accepted_hits)
+              tuples or None for genomes that failed
+    """
+    if args.combined_db:
+        return screen_genomes_combined(in_files, args, cons_run)
+    args = copy.copy(args)
+    args.journal = journal.Journal(os.path.join(args.output,
+                                                journal.JOURNAL_NAME),
+                                   journal.run_key(args,
+                                                   blast.blast_version()),
+                                   load=not args.no_resume)
+    if getattr(args, 'journals', None) is not None:
+        args.journals.append(args.journal)
+    results = [None] * len(in_files)
+    pending = []
+    for idx, subject in enumerate(in_files):
+        results[idx] = args.journal.lookup(subject, cons_run)
+        if results[idx] is None:
+            pending.append(idx)
+    if len(pending) != len(in_files):
+        sys.stderr.write("Resuming: %i of %i genomes already screened\n" %
+                         (len(in_files) - len(pending), len(in_files)))
+    screened = screen_pending([in_files[idx] for idx in pending], args,
+                              cons_run)
+    for idx, result in zip(pending, screened):
+        results[idx] = result
+    return results
+
+
+def screen_pending(in_files, args, cons_run):
+    """
+    Screen a set of genomes with a pool, a pipeline or one at a time
+
+    See screen_genomes()
+
+    :returns: a list (same order as in_files) of (strain_id, accepted_hits)
+              tuples or None for genomes that failed
+    """
+    # --careful (without --review) prompts while parsing so runs one genome
+    # at a time
+    interactive = args.careful and not args.review
+    if args.jobs > 1:
+        if not interactive:
+            return screen_genomes_parallel(in_files, args, cons_run)
+        sys.stderr.write("--careful requires interactive input. "
+                         "Ignoring --jobs (see --review)\n")
+    elif args.pipeline_depth > 0 and len(in_files) > 1:
+        if not interactive:
+            return screen_genomes_pipelined(in_files, args, cons_run)
+    return [screen_genome(subject, args, cons_run) for subject in in_files]
+
+
+def screen_genomes_incremental(in_files, args, cons_run):
+    """
+    Screen a set of genomes, only searching what args.manifest hasn't seen
+
+    Genomes (by content hash) already screened against every query (by
+    record hash) with the same parameters are not searched again. Otherwise
+    only the new or changed queries are searched & merged with the stored
+    hits.
+
+    :param in_files: a list of full paths to the genomes to screen
+    :param args: the arguments given from argparse (uses args.manifest)
+    :param cons_run: part of a mapping consensus run
+
+    :type in_files: list
+    :type args: argparse args
+    :type cons_run: boolean
+
+    :returns: a list (same order as in_files) of (strain_id, accepted_hits)
+              tuples or None for genomes that failed
+    """
+    store = manifest.Manifest(args.manifest)
+    params = manifest.params_key(args, blast.blast_version())
+    queries = manifest.query_hashes(args.seqs_of_interest)
+    all_hashes = set([qhash for _, qhash in queries])
+    genome_hashes = [util.hash_file(subject) for subject in in_files]
+    results = [None] * len(in_files)
+    # Group the genomes by the set of queries they are missing
+    pending = {}
+    for idx, subject in enumerate(in_files):
+        screened, hits = store.lookup(genome_hashes[idx], params)
+        missing = frozenset(all_hashes - screened)
+        if missing:
+            pending.setdefault(missing, []).append(idx)
+        else:
+            results[idx] = (util.get_strain_id(subject),
+                            [qid for qid, qhash in queries if qhash in hits])
+    sys.stderr.write("%i of %i genomes already screened\n" %
+                     (len(in_files) - sum([len(v) for v in pending.values()]),
+                      len(in_files)))
+    query_to_hash = dict(queries)
+    for missing, idxs in pending.items():
+        sub_args = copy.copy(args)
+        if len(missing) != len(all_hashes):
+            sub_args.seqs_of_interest = manifest.write_query_subset(
+                args.seqs_of_interest, missing, os.path.join(args.output,
+                                                             "DBs"))
+        sub_results = screen_genomes([in_files[idx] for idx in idxs],
+                                     sub_args, cons_run)
+        for idx, result in zip(idxs, sub_results):
+            if result is None:
+                continue
+            strain_id, new_hits = result
+            new_hashes = set([query_to_hash[qid] for qid in new_hits])
+            store.record(genome_hashes[idx], params, missing, new_hashes)
+            _, hits = store.lookup(genome_hashes[idx], params)
+            results[idx] = (strain_id,
+                            [qid for qid, qhash in queries if qhash in hits])
+        # Saved as each group finishes so an interrupted run keeps them
+        store.save()
+    return results
+
+
+def run_inputs(args, data_path):
+    """
+    The genomes of a run in their row order (see args.index_file)
+
+    :param args: the arguments given from argparse
+    :param data_path: full path to a directory of genomes
+
+    :returns: a list of full paths
     """
-    matrix, y_label, exist_ord = [], [], []
     in_files = util.get_fasta_files(data_path)
     # Reorder if requested
     if args.index_file is not None:
         in_files = util.order_inputs(args.index_file, in_files)
-    # Handle and existing run
-    if args.existing_data is not None:
-        cleaned, blastxml_tmp = [], []
-        blast_xml = glob.glob(os.path.abspath(args.existing_data)+"/BLAST_results/*")
-        if not cons_run:
-            for e in blast_xml:
-                if e.find("cons_DB=") == -1:
-                    blastxml_tmp.append(e)
+    return in_files
+
+
+def genome_label(fasta_file, existing):
+    """
+    The row label of a genome
+
+    :param fasta_file: full path to a genome
+    :param existing: labels of an existing run (args.existing_data) are the
+                     file name without extension, otherwise the strain id
+
+    :rtype: string
+    """
+    if existing:
+        return os.path.splitext(
+            os.path.basename(util.uncompressed_name(fasta_file)))[0]
+    return util.get_strain_id(fasta_file)
+
+
+def do_run(args, data_path, vfs_list, cons_run):
+    """
+    Perform a SeqFindr run
+
+    Only the genomes of args.shard (see shard.select()) are screened if a
+    shard is given.
+
+    :returns: a tuple of the packed hit plane (see hitmatrix.pack_hits(),
+              one row per strain) & the strain ids (y labels)
+    """
+    hits, y_label, exist_ord = [], [], []
+    in_files = run_inputs(args, data_path)
+    if args.shard is not None:
+        in_files = shard.select(in_files, args.shard)
+    if args.existing_data is None:
+        if args.manifest is not None:
+            results = screen_genomes_incremental(in_files, args, cons_run)
         else:
-            for e in blast_xml:
-                if e.find("cons_DB=") != -1:
-                    blastxml_tmp.append(e)
-        blast_xml = []
-        blast_xml = blastxml_tmp
-        for e in blast_xml:
-            sid = e.split("ID=")[-1].split("_blast.xml")[0]
-            cleaned.append(sid)
-        for i in in_files:
-            for j in cleaned:
-                if i.find(j) != -1:
-                    y_label.append(j)
-                    break
-        for i in blast_xml:
-            for j in y_label:
-                if i.find(j) != -1:
-                    exist_ord.append(i)
-                    break
-        in_files = exist_ord
-    # Make sure XML are right order
-    for idx, subject in enumerate(in_files):
-        if args.existing_data is None:
-            strain_id = blast.make_BLAST_database(subject)
+            results = screen_genomes(in_files, args, cons_run)
+        failed = [subject for subject, result in zip(in_files, results)
+                  if result is None]
+        if failed and not args.skip_failed:
+            sys.stderr.write("%i of %i genomes failed (see above): %s. Use "
+                             "--skip_failed to leave them out\n" %
+                             (len(failed), len(in_files), ', '.join(failed)))
+            sys.exit(1)
+        for result in results:
+            if result is None:
+                continue
+            strain_id, accepted_hits = result
             y_label.append(strain_id)
-            database = os.path.basename(subject)
-            blast_xml = blast.run_BLAST(args.seqs_of_interest, os.path.join(os.getcwd(), "DBs/"+database), args, cons_run)
-            accepted_hits = blast.parse_BLAST(blast_xml, float(args.tol), float(args.cov), args.careful)
+            hits.append(accepted_hits)
+        return hitmatrix.pack_hits(vfs_list, hits), y_label
+    # Handle and existing run
+    blast_xml = glob.glob(os.path.abspath(args.existing_data)+"/BLAST_results/*")
+    by_sid = {}
+    for e in blast_xml:
+        if (e.find("cons_DB=") != -1) != cons_run:
+            continue
+        # Results cut short (see blast.run_BLAST())
+        if e.endswith('.tmp'):
+            continue
+        sid = e.split("ID=")[-1].split("_blast.")[0]
+        by_sid[sid] = e
+    # Match on the full database name (not a substring) & keep input order
+    for i in in_files:
+        sid = genome_label(i, True)
+        if sid in by_sid:
+            y_label.append(sid)
+            exist_ord.append(by_sid[sid])
+    prefix = stage_prefix(cons_run)
+    for sid, blast_results in zip(y_label, exist_ord):
+        entries = review_entries(args)
+        with profiling.stage(args, prefix+'parse', sid):
+            hits.append(blast.parse_BLAST(blast_results, float(args.tol),
+                                          float(args.cov), args.careful,
+                                          entries))
+        record_review(args, sid, cons_run, entries)
+    return hitmatrix.pack_hits(vfs_list, hits), y_label
+
+
+class ScreenResult(object):
+    """
+    The in memory result of a SeqFindr screen (see Session.run())
+
+    :ivar matrix: the (clustered) hit matrix
+    :ivar strain_labels: the strain ids (one per row)
+    :ivar query_list: the query ids (one per column)
+    :ivar query_classes: the query classes (one per column)
+    :ivar cons: whether the hit matrix includes mapping consensus hits
+    :ivar stages: the stage records (see profiling.Recorder)
+    :ivar timings: an OrderedDict of stage name to wall time (seconds)
+    """
+    def __init__(self, matrix, strain_labels, query_list, query_classes,
+                 cons, stages):
+        self.matrix = matrix
+        self.strain_labels = strain_labels
+        self.query_list = query_list
+        self.query_classes = query_classes
+        self.cons = cons
+        self.stages = []
+        self.timings = OrderedDict()
+        self.add_stages(stages)
+
+    def add_stages(self, stages):
+        """
+        Add stage records (& update the timings)
+
+        :param stages: a list of stage records
+        """
+        self.stages.extend(stages)
+        self.timings = profiling.timings(self.stages)
+
+
+class Session(object):
+    """
+    A SeqFindr screen usable as a library
+
+    Every input & output path is explicit (the working directory is never
+    changed) & the results are returned in memory, so sessions with
+    different output directories can run concurrently in threads::
+
+        session = Session.create('queries.fa', 'assemblies/', 'run1',
+                                 cons='consensuses/', tol=0.9)
+        result = session.run()
+        print result.strain_labels, result.timings
+        session.write(result)
+    """
+    def __init__(self, args):
+        """
+        :param args: the arguments (see build_parser()). args.output
+                     defaults to the working directory
+        """
+        args = copy.copy(args)
+        if args.output is None:
+            args.output = os.getcwd()
+        self.args = util.ensure_paths_for_args(args)
+        self.config = config.SeqFindrConfig()
+
+    @classmethod
+    def create(cls, seqs_of_interest, assembly_dir, output_dir, **options):
+        """
+        A Session using the command line defaults for any option not given
+
+        :param seqs_of_interest: full path to the sequences of interest
+        :param assembly_dir: full path to the directory of assemblies
+        :param output_dir: full path to the output directory
+        :param options: any other SeqFindr option by its argparse dest (i.e.
+                        cons, tol, cov, jobs)
+
+        :type seqs_of_interest: string
+        :type assembly_dir: string
+        :type output_dir: string
+
+        :returns: a Session
+        """
+        args = build_parser().parse_args([seqs_of_interest, assembly_dir])
+        for key, value in options.items():
+            if not hasattr(args, key):
+                raise TypeError("Unknown SeqFindr option: %s" % (key))
+            setattr(args, key, value)
+        args.output = output_dir
+        return cls(args)
+
+    def run(self):
+        """
+        Screen the genomes & cluster the hit matrix. Nothing is plotted
+
+        TODO: Exception handling if do_run fails or produces no results
+
+        :returns: a ScreenResult
+        """
+        args = copy.copy(self.args)
+        args.recorder = profiling.Recorder()
+        args.journals = []
+        with profiling.stage(args, 'check_database'):
+            util.check_database(args.seqs_of_interest)
+        util.make_output_dirs(args.output)
+        if args.review:
+            start_review(args)
+        if args.prefilter and not prefilter.usable(
+                args.prefilter_k, float(args.tol) - float(args.careful)):
+            sys.stderr.write("--prefilter can't rule out hits at this "
+                             "cutoff with k = %i (see --prefilter_k). "
+                             "Searching every query\n" % (args.prefilter_k))
+        with profiling.stage(args, 'prepare_queries'):
+            query_list, query_classes = prepare_queries(args)
+            args = blast.decide_query_type(args)
+        with profiling.stage(args, 'screen_assemblies'):
+            results_a, ylab = do_run(args, args.assembly_dir, query_list,
+                                     False)
+        if not ylab:
+            sys.stderr.write("No genomes were screened. Nothing to write\n")
+            sys.exit(1)
+        if args.cons is not None:
+            with profiling.stage(args, 'strip_bases'):
+                args = strip_bases(args)
+            # TODO: Exception handling if do_run fails or produces no
+            # results. Should be caught here before throwing ugly exceptions
+            # downstream.
+            with profiling.stage(args, 'screen_consensuses'):
+                results_m, ylab_m = do_run(args, args.cons, query_list, True)
+            results_a, results_m, ylab, no_cons, no_ass = join_matrix_rows(
+                results_a, ylab, results_m, ylab_m)
+            if no_cons or no_ass:
+                print "\nAssemblies and mapping consensuses don't match\n"
+                if no_cons:
+                    print "No mapping consensus for: %s" % (', '.join(no_cons))
+                if no_ass:
+                    print "No assembly for: %s" % (', '.join(no_ass))
+                sys.exit(1)
+            matrix = hitmatrix.HitMatrix(len(query_list), results_a,
+                                         results_m)
         else:
-            strain_id = y_label[idx]
-            accepted_hits = blast.parse_BLAST(in_files[idx], float(args.tol), float(args.cov), args.careful)
-        row = build_matrix_row(vfs_list, accepted_hits, match_score)
-        row.insert(0, strain_id)
-        matrix.append(row)
-    return matrix, y_label
+            matrix = hitmatrix.HitMatrix(len(query_list), results_a)
+        # Every genome is screened. Running again screens them again
+        for jrnl in args.journals:
+            jrnl.complete()
+        # cluster if not ordered (shards are clustered once merged)
+        if args.index_file is None and args.shard is None:
+            with profiling.stage(args, 'cluster'):
+                matrix, ylab, query_list = cluster_screen(args, matrix, ylab,
+                                                          query_list)
+        return ScreenResult(matrix, ylab, query_list, query_classes,
+                            args.cons is not None, args.recorder.records)
+
+    def write(self, result):
+        """
+        Write the matrix store, matrix.csv & figure to the output directory
+
+        A shard (args.shard) only writes its (unclustered) matrix store,
+        see shard & merge()
+
+        With args.stage_report the stage records are also written (see
+        profiling.write_report())
+
+        :param result: the ScreenResult of run()
+
+        :type result: ScreenResult
+        """
+        args = copy.copy(self.args)
+        args.recorder = profiling.Recorder()
+        if not result.cons:
+            args.reshape = False
+        params = store.run_params(args)
+        if args.shard is not None:
+            existing = args.existing_data is not None
+            row_order = [genome_label(fasta_file, existing) for fasta_file
+                         in run_inputs(args, args.assembly_dir)]
+            params = shard.shard_params(params, args.shard, row_order)
+        with profiling.stage(args, 'write_store'):
+            store.save_matrix(os.path.join(args.output, store.STORE_NAME),
+                              result.matrix, result.strain_labels,
+                              result.query_list, result.query_classes,
+                              params)
+        if args.shard is not None:
+            # Partial results are only plotted once merged
+            self._write_report(args, result)
+            return
+        if not args.no_csv:
+            with profiling.stage(args, 'write_csv'):
+                result.matrix.save_csv(os.path.join(args.output,
+                                                    "matrix.csv"))
+        with profiling.stage(args, 'render'):
+            render(result.matrix, list(result.strain_labels),
+                   result.query_classes, result.query_list, result.cons,
+                   args, self.config, args.output)
+        self._write_report(args, result)
+
+    def _write_report(self, args, result):
+        """
+        Add the stages of write() & write the stage report (if requested)
+        """
+        result.add_stages(args.recorder.records)
+        if args.stage_report:
+            profiling.write_report(os.path.join(args.output,
+                                                profiling.REPORT_NAME),
+                                   result.stages)
+
+
+def cluster_screen(args, matrix, ylab, query_list):
+    """
+    Cluster the rows (or with args.cluster_column the columns) of a screen
+
+    The dendrogram is drawn to args.output unless args.no_dendrogram
+
+    :param args: the arguments given from argparse
+    :param matrix: the hit matrix
+    :param ylab: the strain ids (one per row)
+    :param query_list: the query ids (one per column)
+
+    :returns: a tuple of the clustered matrix, strain ids & query ids
+    """
+    dendrogram_file = os.path.join(args.output, "dendrogram.png")
+    if args.no_dendrogram:
+        dendrogram_file = None
+    if not args.cluster_column:
+        matrix, ylab = cluster_matrix(matrix, ylab, args.DPI,
+                                      args.cluster_column,
+                                      args.UPGMA_clustering, dendrogram_file,
+                                      args.cluster_metric,
+                                      args.collapse_identical)
+    else:
+        tmp = copy.deepcopy(ylab)
+        matrix, ylab = cluster_matrix(matrix, query_list, args.DPI,
+                                      args.cluster_column,
+                                      args.UPGMA_clustering, dendrogram_file,
+                                      args.cluster_metric,
+                                      args.collapse_identical)
+        query_list = ylab
+        ylab = tmp
+    return matrix, ylab, query_list
+
+
+def merge(store_paths, output_dir):
+    """
+    Merge the shards of a run (see shard), cluster & write the results
+
+    The options of the original run are used throughout so the results
+    match a single (unsharded) run.
+
+    :param store_paths: full paths to the output directories (or matrix
+                        stores) of every shard
+    :param output_dir: full path to the output directory
+
+    :type store_paths: list
+    :type output_dir: string
+
+    :returns: the ScreenResult
+    """
+    recorder = profiling.Recorder()
+    with recorder.stage('merge_shards'):
+        matrix, ylab, query_list, query_classes, params = \
+            shard.merge_stores(store_paths)
+    return write_stored(params, output_dir, recorder, matrix, ylab,
+                        query_list, query_classes)
+
+
+def apply_review(store_path, decisions_file, output_dir):
+    """
+    Apply the decisions of a --review run (see review), cluster & write
+
+    The hits accepted in the decisions file are set in the stored matrix
+    of the run. BLAST is not run again. The options of the original run
+    are used throughout.
+
+    :param store_path: full path to the output directory (or matrix store)
+                       of the --review run
+    :param decisions_file: full path to the review file with a decision
+                           column added
+    :param output_dir: full path to the output directory (may be the output
+                       directory of the run)
+
+    :type store_path: string
+    :type decisions_file: string
+    :type output_dir: string
+
+    :returns: the ScreenResult
+    """
+    recorder = profiling.Recorder()
+    path = shard.find_store(os.path.abspath(os.path.expanduser(store_path)))
+    if not os.path.isdir(path):
+        raise ValueError("No SeqFindr matrix store at %s" % (path))
+    with recorder.stage('apply_review'):
+        matrix, ylab, query_list, query_classes, params = \
+            store.load_matrix(path, mmap=False)
+        if params.get('shard') is not None:
+            raise ValueError("%s is the store of a shard. Apply the "
+                             "decisions once merged" % (path))
+        matrix, changed = review.apply_decisions(
+            matrix, ylab, query_list, review.read_decisions(decisions_file))
+    print "%i hits accepted on review" % (changed)
+    return write_stored(params, output_dir, recorder, matrix, ylab,
+                        query_list, query_classes)
+
+
+def write_stored(params, output_dir, recorder, matrix, ylab, query_list,
+                 query_classes):
+    """
+    Cluster & write a stored (or merged) hit matrix with its run options
+
+    See merge() & apply_review()
+
+    :param params: the stored run parameters (see store.run_params())
+    :param output_dir: full path to the output directory
+    :param recorder: the profiling.Recorder of the stages so far
+
+    :returns: the ScreenResult
+    """
+    args = build_parser().parse_args([params['seqs_of_interest'],
+                                      params['assembly_dir']])
+    for key, value in params.items():
+        if hasattr(args, key):
+            setattr(args, key, value)
+    args.output = output_dir
+    session = Session(args)
+    if not os.path.isdir(session.args.output):
+        os.makedirs(session.args.output)
+    cons = session.args.cons is not None
+    if session.args.index_file is None:
+        with recorder.stage('cluster'):
+            matrix, ylab, query_list = cluster_screen(session.args, matrix,
+                                                      ylab, query_list)
+    result = ScreenResult(matrix, ylab, query_list, query_classes, cons,
+                          recorder.records)
+    session.write(result)
+    return result
 
 
 def core(args):
     """
     The 'core' SeqFindr method
 
-    TODO: Exception handling if do_run fails or produces no results
+    Results go to args.output (default = the working directory)
 
     :param args: the arguments given from argparse
     """
-    DEFAULT_NO_HIT, ASS_WT, CONS_WT = 0.5, -0.15, -0.85
-    cons_run = False
-    args = util.ensure_paths_for_args(args)
-    configObject = config.SeqFindrConfig()
-    util.check_database(args.seqs_of_interest)
-    util.init_output_dirs(args.output)
-    query_list, query_classes = prepare_queries(args)
-    results_a, ylab = do_run(args, args.assembly_dir, ASS_WT, query_list, cons_run)
-    if args.cons is not None:
-        cons_run = True
-        args = strip_bases(args)
-        # TODO: Exception handling if do_run fails or produces no results.
-        # Should be caught here before throwing ugly exceptions downstream.
-        results_m, _ = do_run(args, args.cons, CONS_WT, query_list, cons_run)
-        if len(results_m) == len(results_a):
-            results_a, results_m = match_matrix_rows(results_a, results_m)
-            DEFAULT_NO_HIT = 1.0
-            matrix = np.array(results_a) + np.array(results_m)
-        else:
-            print "\nAssemblies and mapping consensuses don't match\n"
-            sys.exit(1)
-    else:
-        args.reshape = False
-        results_a = strip_id_from_matrix(results_a)
-        matrix = np.array(results_a)
-    # cluster if not ordered
-    if args.index_file is None:
-        if not args.cluster_column:
-            matrix, ylab = cluster_matrix(matrix, ylab, args.DPI,
-                                          args.cluster_column,
-                                          args.UPGMA_clustering)
-        else:
-            tmp = copy.deepcopy(ylab)
-            matrix, ylab = cluster_matrix(matrix, query_list, args.DPI,
-                                          args.cluster_column,
-                                          args.UPGMA_clustering)
-            query_list = ylab
-            ylab = tmp
-    np.savetxt("matrix.csv", matrix, delimiter=",")
-    # Add the buffer
-    newrow = [DEFAULT_NO_HIT] * matrix.shape[1]
-    # matrix = np.vstack([newrow, matrix])
-    matrix = np.vstack([newrow, matrix])
-    # Handle new option to only show presence
+    session = Session(args)
+    cprofile_file = None
+    if session.args.cprofile:
+        cprofile_file = os.path.join(session.args.output,
+                                     profiling.CPROFILE_NAME)
+    with profiling.cprofile(cprofile_file):
+        result = session.run()
+        session.write(result)
+    if session.args.verbose:
+        for name, wall in result.timings.items():
+            print "%s: %.2f seconds" % (name, wall)
+
+
+def to_plot_scale(scores, reshape, invert):
+    """
+    Map hit matrix scores to the values plotted (element-wise)
+
+    :param scores: a numpy matrix of scores (see HitMatrix.scores())
+    :param reshape: only show presence (hide mapping vs assembly)
+    :param invert: invert the shading so missing hits are black
+
+    :returns: the numpy matrix of plotted values
+    """
     cutoff = 0.49
-    if args.reshape is True:
+    if reshape is True:
         cutoff = 0.99
-        for x in np.nditer(matrix, op_flags=['readwrite']):
-            if x < cutoff:
-                x[...] = -1.0
+        scores[scores < cutoff] = -1.0
+    if invert:
+        scores[scores < cutoff] = -cutoff-0.01
+        scores = scores*-1
+    return scores
+
+
+def buffer_row(ncols, cons, reshape, invert):
+    """
+    The extra first row that anchors the gray scale of the figure
+
+    :param ncols: the number of columns
+    :param cons: whether the hit matrix includes mapping consensus hits
+    :param reshape: only show presence (hide mapping vs assembly)
+    :param invert: invert the shading so missing hits are black
+
+    :returns: a numpy array (1 x ncols)
+    """
+    value = hitmatrix.NO_HIT
+    if cons:
+        value = 1.0
+    if invert:
+        value = 0.5
+        if reshape is True:
+            value = 1.0
+    return np.array([[value] * ncols])
+
+
+def render(hits, ylab, query_classes, query_list, cons, args, config_object,
+           out_dir=''):
+    """
+    Convert a (clustered) hit matrix to the plotting scale & plot it
+
+    :param hits: the hit matrix
+    :param ylab: the strain ids (one per row)
+    :param query_classes: the query classes (one per column)
+    :param query_list: the query ids (one per column)
+    :param cons: whether the hit matrix includes mapping consensus hits
+    :param args: the arguments given from argparse (the figure options,
+                 reshape & cluster_column)
+    :param config_object: a SeqFindrConfig object
+    :param out_dir: the directory to save results.png/svg to (default = '',
+                    the working directory)
+
+    :type hits: HitMatrix
+    :type ylab: list
+    :type query_classes: list
+    :type query_list: list
+    :type cons: boolean
+    :type out_dir: string
+    """
+    reshape = args.reshape and cons
+    cons_flag = None
+    if cons:
+        cons_flag = True
+    if args.large_render:
+        with imaging.PLOT_LOCK:
+            render_large(hits, ylab, query_classes, query_list, cons_flag,
+                         reshape, args, config_object, out_dir)
+        return
+    # Only now convert to the float scale for plotting. Add the buffer
+    matrix = np.vstack([buffer_row(hits.ncols, cons, reshape, args.invert),
+                        to_plot_scale(hits.scores(), reshape, args.invert)])
     ylab = ['', ''] + ylab
-    if args.invert:
-        for elem in np.nditer(matrix, op_flags=['readwrite']):
-            if elem < cutoff:
-                elem[...] = -cutoff-0.01
-        matrix[0,:] *= -1
-        if args.reshape is False:
-            matrix[0,:] *= 0.0
-            matrix[0,:] += -0.5
-        matrix = matrix*-1
     # Remove empty columns
     if args.remove_empty_cols:
         matrix, query_classes, query_list = strip_uninteresting(matrix,
                                                                 query_classes,
                                                                 query_list,
-                                                                args.cons,
+                                                                cons_flag,
                                                                 args.invert)
     # Check for singular matrix
-    check_singularity(matrix, args.cons, args.invert)
-    plot_matrix(matrix, ylab, query_classes, query_list, args.label_genes,
-                args.color, configObject, args.grid, args.seed, args.DPI,
-                args.size, args.svg, args.cluster_column)
-    # Handle labels here
-    #os.system("rm blast.xml")
-    #os.system("rm DBs/*")
+    check_singularity(matrix, cons_flag, args.invert)
+    with imaging.PLOT_LOCK:
+        plot_matrix(matrix, ylab, query_classes, query_list, args.label_genes,
+                    args.color, config_object, args.grid, args.seed, args.DPI,
+                    args.size, args.svg, args.cluster_column,
+                    out_dir=out_dir)
+
+
+def iter_plot_blocks(hits, cons, reshape, invert, keep=None,
+                     block_cells=BLOCK_CELLS):
+    """
+    The plotted values (buffer row first) a block of rows at a time
+
+    :param hits: the hit matrix
+    :param cons: whether the hit matrix includes mapping consensus hits
+    :param reshape: only show presence (hide mapping vs assembly)
+    :param invert: invert the shading so missing hits are black
+    :param keep: a boolean numpy array of the columns to keep (default =
+                 None, all)
+    :param block_cells: the (approximate) number of cells per block
+
+    :returns: a generator of numpy arrays
+    """
+    block_size = max(1, block_cells // max(1, hits.ncols))
+    row = buffer_row(hits.ncols, cons, reshape, invert)
+    if keep is not None:
+        row = row[:, keep]
+    yield row
+    for start in range(0, hits.shape[0], block_size):
+        block = to_plot_scale(hits.scores(start, start+block_size), reshape,
+                              invert)
+        if keep is not None:
+            block = block[:, keep]
+        yield block
+
+
+def render_large(hits, ylab, query_classes, query_list, cons, reshape, args,
+                 config_object, out_dir=''):
+    """
+    Render a hit matrix of any size with bounded memory
+
+    The plotted values are streamed a block of rows at a time straight into
+    a raster no bigger than the figure (see raster.downsample()). Removing
+    empty columns & the singularity check are also done block-wise.
+
+    :param hits: the hit matrix
+    :param ylab: the strain ids (one per row)
+    :param query_classes: the query classes (one per column)
+    :param query_list: the query ids (one per column)
+    :param cons: whether the Seqfindr run is using mapping consensus data
+                 (None or True)
+    :param reshape: only show presence (hide mapping vs assembly)
+    :param args: the arguments given from argparse (the figure options &
+                 cluster_column)
+    :param config_object: a SeqFindrConfig object
+    :param out_dir: the directory to save results.png/svg to (default = '',
+                    the working directory)
+    """
+    nohit = determine_nohit_score(cons, args.invert)
+    keep = np.zeros(hits.ncols, dtype=bool)
+    for block in iter_plot_blocks(hits, cons, reshape, args.invert):
+        keep |= ~(block == nohit).all(axis=0)
+    # Check for singular matrix
+    if not keep.any():
+        msg = ("There are no informative sites (no hits) in the SeqFindr "
+               "matrix. Consider lowering hit tolerance (-t/--t")
+        raise ValueError(msg)
+    # Remove empty columns
+    if args.remove_empty_cols:
+        query_classes = list(np.asarray(query_classes, dtype=object)[keep])
+        query_list = list(np.asarray(query_list, dtype=object)[keep])
+    else:
+        keep = None
+    ncols = len(query_list)
+    nrows = hits.shape[0] + 1
+    x, y = args.size.split('x')
+    x, y = float(x), float(y)
+    out_rows = max(1, min(nrows, int(y*args.DPI)))
+    out_cols = max(1, min(ncols, int(x*args.DPI)))
+    means, vmin, vmax = raster.downsample(
+        iter_plot_blocks(hits, cons, reshape, args.invert, keep),
+        nrows, ncols, out_rows, out_cols)
+    colors = shading_colors(query_classes, args.color, config_object,
+                            args.seed)
+    if args.cluster_column:
+        column_colors = [colors[0]] * ncols
+    else:
+        column_colors, run = [], 0
+        for i in xrange(0, ncols):
+            if i > 0 and query_classes[i] != query_classes[i-1]:
+                run += 1
+            if run < len(colors):
+                column_colors.append(colors[run])
+            else:
+                column_colors.append(None)
+    shade_color, shade_alpha = raster.column_shading(column_colors, ncols,
+                                                     out_cols)
+    image = raster.to_rgb(means, vmin, vmax, shade_color, shade_alpha)
+    plt = imaging.pyplot()
+    plt.clf()
+    fig = plt.figure()
+    ax = fig.add_subplot(111)
+    ax.imshow(image, interpolation='nearest', aspect='auto',
+              extent=(-0.5, ncols-0.5, nrows-0.5, -0.5))
+    # Axes & labels are drawn separately from the raster
+    if len(ylab) < 999:
+        ax.set_yticks(range(1, nrows))
+        ax.set_yticklabels(ylab)
+    else:
+        ax.set_yticks([])
+    if args.label_genes and ncols < 999:
+        ax.set_xticks(range(0, ncols))
+        ax.set_xticklabels(query_list)
+    else:
+        ax.set_xticks([])
+    ax.tick_params(axis='both', which='both', labelsize=6, direction='out',
+                   labelleft='on', labelright='off', labelbottom='off',
+                   labeltop='on', left='on', right='off', bottom='off',
+                   top='on')
+    plt.xticks(rotation=90)
+    if args.grid:
+        ax.grid(True)
+    fig.set_size_inches(x, y)
+    if args.svg:
+        plt.savefig(os.path.join(out_dir, "results.svg"), bbox_inches='tight',
+                    dpi=args.DPI)
+    else:
+        plt.savefig(os.path.join(out_dir, "results.png"), bbox_inches='tight',
+                    dpi=args.DPI)
+    plt.close(fig)
+
+
+def add_figure_options(fig):
+    """
+    Add the figure options to an argparse parser (or argument group)
+
+    Shared by SeqFindr & seqfindr_replot.
+
+    :param fig: an argparse parser or argument group
+    """
+    fig.add_argument('-l', '--label_genes', action='store_true',
+                     default=False,
+                     help=('Label the x axis with the query identifier '
+                           '[default = False]'))
+    fig.add_argument('-g', '--grid', action='store_false', default=True,
+                     help='Figure has grid lines [default = True]')
+    fig.add_argument('--color', action='store', default=None, type=int,
+                     help=('The color index [default = None]. See manual '
+                           'for more info'))
+    fig.add_argument('--invert', action='store_true', default=False,
+                     help=('Invert the shading so that missing hits are '
+                           'black [default = False].'))
+    fig.add_argument('--remove_empty_cols', action='store_true',
+                     default=False, help=('Remove columns that have no '
+                                          'hits [default = False].'))
+    fig.add_argument('--DPI', action='store', type=int, default=300,
+                     help='DPI of figure [default = 300]')
+    fig.add_argument('--seed', action='store', type=int, default=99,
+                     help='Color generation seed')
+    fig.add_argument('--svg', action='store_true', default=False,
+                     help=('Draws figure in svg'))
+    fig.add_argument('--size', action='store', type=str, default='10x12',
+                     help='Size of figure [default = 10x12 (inches)]')
+    fig.add_argument('--large_render', action='store_true', default=False,
+                     help=('Render the matrix straight to a raster no '
+                           'bigger than the figure, a block of rows at a '
+                           'time. Bounded memory for very large matrices '
+                           '[default = False]'))
+
+
+def build_parser():
+    """
+    The SeqFindr command line parser
+
+    :returns: an argparse.ArgumentParser
+    """
+    parser = argparse.ArgumentParser(description=__doc__, epilog=epi)
+    alg = parser.add_argument_group('Optional algorithm options',
+                                    ('Options relating to the SeqFindr '
+                                     'algorithm'))
+    io = parser.add_argument_group('Optional input/output options',
+                                   ('Options relating to input and '
+                                    'output'))
+    fig = parser.add_argument_group('Figure options',
+                                    ('Options relating to the output '
+                                     'figure'))
+    blast_opt = parser.add_argument_group('BLAST options',
+                                          ('Options relating to BLAST'))
+    add_figure_options(fig)
+    blast_opt.add_argument('-R', '--reftype', action='store',
+                           help=('Reference Sequence type. If not given '
+                                 'will try to detect it'), dest='reftype',
+                           choices=('nucl', 'prot'), default=None)
+    blast_opt.add_argument('-X', '--tblastx', action='store_true',
+                           default=False,
+                           help=('Run tBLASTx rather than BLASTn'))
+    blast_opt.add_argument('--evalue', action='store', type=float,
+                           default='0.0001',
+                           help=('BLAST evalue (Expect)'))
+    blast_opt.add_argument('--short', action='store_true',
+                           default=False, help=('Have short queries i.e. '
+                                                'PCR Primers'))
+    parser.add_argument('-v', '--verbose', action='store_true',
+                        default=False, help='verbose output')
+    io.add_argument('-o', '--output', action='store', default=None,
+                    help=('Output the results to this location'))
+    io.add_argument('-p', '--output_prefix', action='store', default=None,
+                    help=('Give all result files this prefix'))
+    # Required options now positional arguments
+    parser.add_argument('seqs_of_interest', action='store',
+                        help=('Full path to FASTA file containing a '
+                              'set of sequences of interest'))
+    parser.add_argument('assembly_dir', action='store',
+                        help=('Full path to directory containing a '
+                              'set of assemblies in FASTA format'))
+    alg.add_argument('-t', '--tol', action='store', type=float,
+                     default=0.95,
+                     help=('Similarity cutoff [default = 0.95]'))
+    alg.add_argument('--cov', action='store', type=float,
+                     default=1.0,
+                     help=('Proportion of query covered cutoff [default = 1.0]'))
+    alg.add_argument('-m', '--cons', action='store', default=None,
+                     help=('Full path to directory containing mapping '
+                           'consensuses [default = None]. See manual for '
+                           'more info'))
+    alg.add_argument('-r', '--reshape', action='store_false', default=True,
+                     help=('Differentiate between mapping and assembly '
+                           'hits in the figure [default = no '
+                           'differentiation]'))
+    alg.add_argument('--index_file', action='store', default=None,
+                     help=('Maintain the y axis strain order according to '
+                           'order given in this file. Otherwise '
+                           'clustering by row similarity. [default = do '
+                           'clustering]. See manual for more info'))
+    alg.add_argument('--cluster_column', action='store_true',
+                     default=False,
+                     help=('Cluster by column similarity rather than row'))
+    alg.add_argument('-s', '--strip', action='store', default=10,
+                     help=('Strip the 1st and last N bases of mapping '
+                           'consensuses & database [default = 10]'))
+    alg.add_argument('-c', '--careful', action='store', type=float,
+                     default=0,
+                     help=('Manually consider hits that fall '
+                           '(tol-careful) below the cutoff. [default = 0].'
+                           ' With default tol (0.95) & careful = 0.2, we '
+                           'will manually inspect all hits in 0.95-0.75 '
+                           'range'))
+    alg.add_argument('--review', action='store_true', default=False,
+                     help=('With --careful, write the hits to inspect to '
+                           '%s in the output directory rather than asking. '
+                           'Apply the decisions with seqfindr_review '
+                           '[default = False]' % (review.REVIEW_NAME)))
+    io.add_argument('-e', '--existing_data', action='store',
+                    default=None,
+                    help=('Full path to an existing SeqFindr run '
+                          'directory. Must contain a BLAST_results '
+                          'directory'))
+    blast_opt.add_argument('--BLAST_THREADS', action='store', type=int,
+                           default=1, help=('Use this number of threads '
+                                            'in BLAST run [default = 1]'))
+    blast_opt.add_argument('--outfmt', action='store', default='xml',
+                           choices=('xml', 'tabular'),
+                           help=('BLAST output format. tabular is '
+                                 'smaller & faster to parse '
+                                 '[default = xml]'))
+    blast_opt.add_argument('--combined_db', action='store_true',
+                           default=False,
+                           help=('Search all genomes with a single '
+                                 'combined BLAST database rather than '
+                                 'one per genome [default = False]'))
+    blast_opt.add_argument('--db_cache', action='store', default=None,
+                           help=('Full path to a directory used to '
+                                 'cache BLAST databases between runs '
+                                 '[default = None]'))
+    blast_opt.add_argument('--db_cache_size', action='store',
+                           type=float, default=10.0,
+                           help=('Maximum size of the BLAST database '
+                                 'cache in GB. 0 is unlimited '
+                                 '[default = 10]'))
+    io.add_argument('--shard', action='store', type=shard.parse_shard,
+                    default=None,
+                    help=('Only screen shard i of N (given as i/N) of the '
+                          'genomes & store the unclustered rows. Combine '
+                          'the shards with seqfindr_merge [default = '
+                          'None]'))
+    io.add_argument('--no_resume', action='store_true', default=False,
+                    help=('Screen every genome again rather than skipping '
+                          'those in the journal (%s) of an interrupted '
+                          'run in the output directory [default = False]' %
+                          (journal.JOURNAL_NAME)))
+    io.add_argument('--manifest', action='store', default=None,
+                    help=('Full path to an incremental screening '
+                          'manifest (created if needed). Only new '
+                          'genomes or new/changed queries are searched '
+                          '[default = None]'))
+    blast_opt.add_argument('--prefilter', action='store_true',
+                           default=False,
+                           help=('Only BLAST the queries that share enough '
+                                 'k-mers with a genome to give a hit at '
+                                 'the tol & cov cut-offs. Never changes '
+                                 'the hits [default = False]'))
+    blast_opt.add_argument('--prefilter_k', action='store',
+                           type=prefilter.parse_k,
+                           default=prefilter.DEFAULT_K,
+                           help=('The k-mer size of --prefilter (at most '
+                                 '%i) [default = %i]' % (prefilter.MAX_K,
+                                                         prefilter.DEFAULT_K)))
+    blast_opt.add_argument('-j', '--jobs', action='store', type=int,
+                           default=1, help=('Screen this number of '
+                                            'genomes concurrently '
+                                            '[default = 1]'))
+    blast_opt.add_argument('--pipeline_depth', action='store', type=int,
+                           default=0, help=('Without --jobs, overlap the '
+                                            'makeblastdb, BLAST & parse '
+                                            'stages of consecutive genomes '
+                                            'with at most this number of '
+                                            'genomes waiting between '
+                                            'stages. 0 screens one genome '
+                                            'at a time [default = 0]'))
+    blast_opt.add_argument('--skip_failed', action='store_true',
+                           default=False,
+                           help=('With --jobs or --pipeline_depth, leave '
+                                 'out the genomes that fail to screen '
+                                 'rather than stopping [default = False]'))
+    alg.add_argument('--UPGMA_clustering', action='store_true', default=False,
+                     help=('Use UPGMA the clustering algorithm. '
+                           'Default is the linkage algorithm'))
+    alg.add_argument('--cluster_metric', action='store',
+                     default='euclidean',
+                     choices=('euclidean', 'hamming'),
+                     help=('Clustering distance. hamming uses packed '
+                           'bit vectors [default = euclidean]'))
+    alg.add_argument('--collapse_identical', action='store_true',
+                     default=False,
+                     help=('Cluster identical rows as one. Much faster '
+                           'for many strains [default = False]'))
+    io.add_argument('--no_csv', action='store_true', default=False,
+                    help=('Do not write matrix.csv (the matrix is always '
+                          'stored in %s) [default = False]' %
+                          (store.STORE_NAME)))
+    io.add_argument('--stage_report', action='store_true', default=False,
+                    help=('Write the wall time, CPU time, peak RSS & bytes '
+                          'read/written of each stage (per genome) to %s '
+                          '[default = False]' % (profiling.REPORT_NAME)))
+    io.add_argument('--cprofile', action='store_true', default=False,
+                    help=('Dump cProfile statistics of the run to %s '
+                          '[default = False]' % (profiling.CPROFILE_NAME)))
+    fig.add_argument('--no_dendrogram', action='store_true',
+                     default=False,
+                     help=('Do not draw the clustering dendrogram '
+                           '[default = False]'))
+    parser.set_defaults(func=core)
+    return parser
 
 
 if __name__ == '__main__':
     try:
         start_time = time.time()
 
-        parser = argparse.ArgumentParser(description=__doc__, epilog=epi)
-        alg = parser.add_argument_group('Optional algorithm options',
-                                        ('Options relating to the SeqFindr '
-                                         'algorithm'))
-        io = parser.add_argument_group('Optional input/output options',
-                                       ('Options relating to input and '
-                                        'output'))
-        fig = parser.add_argument_group('Figure options',
-                                        ('Options relating to the output '
-                                         'figure'))
-        blast_opt = parser.add_argument_group('BLAST options',
-                                              ('Options relating to BLAST'))
-        blast_opt.add_argument('-R', '--reftype', action='store',
-                               help=('Reference Sequence type. If not given '
-                                     'will try to detect it'), dest='reftype',
-                               choices=('nucl', 'prot'), default=None)
-        blast_opt.add_argument('-X', '--tblastx', action='store_true',
-                               default=False,
-                               help=('Run tBLASTx rather than BLASTn'))
-        blast_opt.add_argument('--evalue', action='store', type=float,
-                               default='0.0001',
-                               help=('BLAST evalue (Expect)'))
-        blast_opt.add_argument('--short', action='store_true',
-                               default=False, help=('Have short queries i.e. '
-                                                    'PCR Primers'))
-        parser.add_argument('-v', '--verbose', action='store_true',
-                            default=False, help='verbose output')
-        io.add_argument('-o', '--output', action='store', default=None,
-                        help=('Output the results to this location'))
-        io.add_argument('-p', '--output_prefix', action='store', default=None,
-                        help=('Give all result files this prefix'))
-        # Required options now positional arguments
-        parser.add_argument('seqs_of_interest', action='store',
-                            help=('Full path to FASTA file containing a '
-                                  'set of sequences of interest'))
-        parser.add_argument('assembly_dir', action='store',
-                            help=('Full path to directory containing a '
-                                  'set of assemblies in FASTA format'))
-        alg.add_argument('-t', '--tol', action='store', type=float,
-                         default=0.95,
-                         help=('Similarity cutoff [default = 0.95]'))
-        alg.add_argument('--cov', action='store', type=float,
-                         default=1.0,
-                         help=('Proportion of query covered cutoff [default = 1.0]'))
-        alg.add_argument('-m', '--cons', action='store', default=None,
-                         help=('Full path to directory containing mapping '
-                               'consensuses [default = None]. See manual for '
-                               'more info'))
-        fig.add_argument('-l', '--label_genes', action='store_true',
-                         default=False,
-                         help=('Label the x axis with the query identifier '
-                               '[default = False]'))
-        alg.add_argument('-r', '--reshape', action='store_false', default=True,
-                         help=('Differentiate between mapping and assembly '
-                               'hits in the figure [default = no '
-                               'differentiation]'))
-        fig.add_argument('-g', '--grid', action='store_false', default=True,
-                         help='Figure has grid lines [default = True]')
-        alg.add_argument('--index_file', action='store', default=None,
-                         help=('Maintain the y axis strain order according to '
-                               'order given in this file. Otherwise '
-                               'clustering by row similarity. [default = do '
-                               'clustering]. See manual for more info'))
-        alg.add_argument('--cluster_column', action='store_true',
-                         default=False,
-                         help=('Cluster by column similarity rather than row'))
-        fig.add_argument('--color', action='store', default=None, type=int,
-                         help=('The color index [default = None]. See manual '
-                               'for more info'))
-        fig.add_argument('--invert', action='store_true', default=False,
-                         help=('Invert the shading so that missing hits are '
-                               'black [default = False].'))
-        fig.add_argument('--remove_empty_cols', action='store_true',
-                         default=False, help=('Remove columns that have no '
-                                              'hits [default = False].'))
-        fig.add_argument('--DPI', action='store', type=int, default=300,
-                         help='DPI of figure [default = 300]')
-        fig.add_argument('--seed', action='store', type=int, default=99,
-                         help='Color generation seed')
-        fig.add_argument('--svg', action='store_true', default=False,
-                         help=('Draws figure in svg'))
-        fig.add_argument('--size', action='store', type=str, default='10x12',
-                         help='Size of figure [default = 10x12 (inches)]')
-        alg.add_argument('-s', '--strip', action='store', default=10,
-                         help=('Strip the 1st and last N bases of mapping '
-                               'consensuses & database [default = 10]'))
-        alg.add_argument('-c', '--careful', action='store', type=float,
-                         default=0,
-                         help=('Manually consider hits that fall '
-                               '(tol-careful) below the cutoff. [default = 0].'
-                               ' With default tol (0.95) & careful = 0.2, we '
-                               'will manually inspect all hits in 0.95-0.75 '
-                               'range'))
-        io.add_argument('-e', '--existing_data', action='store',
-                        default=None,
-                        help=('Full path to an existing SeqFindr run '
-                              'directory. Must contain a BLAST_results '
-                              'directory'))
-        blast_opt.add_argument('--BLAST_THREADS', action='store', type=int,
-                               default=1, help=('Use this number of threads '
-                                                'in BLAST run [default = 1]'))
-        alg.add_argument('--UPGMA_clustering', action='store_true', default=False,
-                         help=('Use UPGMA the clustering algorithm. '
-                               'Default is the linkage algorithm'))
-        parser.set_defaults(func=core)
+        parser = build_parser()
         args = parser.parse_args()
         if args.verbose:
             print "Executing @ " + time.asctime()
@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+
+# Copyright 2013-2014 Mitchell Stanton-Cook Licensed under the
+#     Educational Community License, Version 2.0 (the "License"); you may
+#     not use this file except in compliance with the License. You may
+#     obtain a copy of the License at
+#
+#      http://www.osedu.org/licenses/ECL-2.0
+#
+#     Unless required by applicable law or agreed to in writing,
+#     software distributed under the License is distributed on an "AS IS"
+#     BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+#     or implied. See the License for the specific language governing
+#     permissions and limitations under the License.
+
+
+"""
+seqfindr_merge
+==============
+
+Merge the shards of a SeqFindr run, then cluster & plot once
+
+Each shard of a run (SeqFindr --shard i/N) stores its unclustered rows in
+the matrix_store of its output directory. Give every shard of the run (in
+any order). The rows are put back into the order of a single run &
+clustered & plotted with the options of the original run, so the results
+match a single (unsharded) run.
+
+Examples::
+
+    # A run split in 3 (i.e. a cluster array job)
+    $ SeqFindr queries.fa assemblies/ -o shard1 --shard 1/3
+    $ SeqFindr queries.fa assemblies/ -o shard2 --shard 2/3
+    $ SeqFindr queries.fa assemblies/ -o shard3 --shard 3/3
+    $ seqfindr_merge shard1 shard2 shard3 -o merged
+"""
+
+__author__ = "Mitchell Stanton-Cook"
+__licence__ = "ECL"
+__version__ = "0.1"
+__email__ = "m.stantoncook@gmail.com"
+epi = "Licence: " + __licence__ + " by " + __author__ + " <" + __email__ + ">"
+USAGE = "seqfindr_merge -h"
+
+
+import sys
+import os
+import traceback
+import argparse
+import time
+
+from SeqFindr import seqfindr
+
+
+def main(args):
+    """
+    Merge the shards, cluster & plot
+
+    :param args: the arguments given from argparse
+    """
+    output = args.output
+    if output is None:
+        output = os.getcwd()
+    try:
+        seqfindr.merge(args.shards, output)
+    except ValueError, e:
+        sys.stderr.write("%s\n" % (e))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    try:
+        start_time = time.time()
+
+        desc = __doc__.split('\n\n')[1].strip()
+        parser = argparse.ArgumentParser(description=desc, epilog=epi)
+        parser.add_argument('shards', action='store', nargs='+',
+                            help=('Full paths to the output directories (or '
+                                  'matrix stores) of every shard of a run'))
+        parser.add_argument('-o', '--output', action='store', default=None,
+                            help=('Output the merged results to this '
+                                  'location [default = current directory]'))
+        parser.add_argument('-v', '--verbose', action='store_true',
+                            default=False, help='verbose output')
+        parser.set_defaults(func=main)
+        args = parser.parse_args()
+        if args.verbose:
+            print "Executing @ " + time.asctime()
+        args.func(args)
+        if args.verbose:
+            print "Ended @ " + time.asctime()
+            print 'Exec time minutes %f:' % ((time.time() - start_time) / 60.0)
+        sys.exit(0)
+    except KeyboardInterrupt, e:
+        # Ctrl-C
+        raise e
+    except SystemExit, e:
+        # sys.exit()
+        raise e
+    except Exception, e:
+        print 'ERROR, UNEXPECTED EXCEPTION'
+        print str(e)
+        traceback.print_exc()
+        sys.exit(1)
@@ -0,0 +1,118 @@
+#!/usr/bin/env python
+
+# Copyright 2013-2014 Mitchell Stanton-Cook Licensed under the
+#     Educational Community License, Version 2.0 (the "License"); you may
+#     not use this file except in compliance with the License. You may
+#     obtain a copy of the License at
+#
+#      http://www.osedu.org/licenses/ECL-2.0
+#
+#     Unless required by applicable law or agreed to in writing,
+#     software distributed under the License is distributed on an "AS IS"
+#     BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+#     or implied. See the License for the specific language governing
+#     permissions and limitations under the License.
+
+
+"""
+seqfindr_replot
+===============
+
+Re-plot a stored SeqFindr matrix (no BLAST results needed)
+
+Every SeqFindr run stores its (clustered) matrix, labels & run parameters in
+the matrix_store directory of the output directory. Use this to re-render
+the figure with different figure options.
+
+Examples::
+
+    # Re-render at a higher resolution
+    $ seqfindr_replot run1/matrix_store --DPI 600
+
+    # Write an svg to another directory
+    $ seqfindr_replot run1/matrix_store --svg -o run1_svg
+"""
+
+__author__ = "Mitchell Stanton-Cook"
+__licence__ = "ECL"
+__version__ = "0.1"
+__email__ = "m.stantoncook@gmail.com"
+epi = "Licence: " + __licence__ + " by " + __author__ + " <" + __email__ + ">"
+USAGE = "seqfindr_replot -h"
+
+
+import sys
+import os
+import traceback
+import argparse
+import time
+
+from SeqFindr import config
+from SeqFindr import seqfindr
+from SeqFindr import store
+
+
+def main(args):
+    """
+    Load a stored matrix & plot it
+
+    :param args: the arguments given from argparse
+    """
+    if not os.path.isdir(args.store):
+        sys.stderr.write("No SeqFindr matrix store at %s\n" % (args.store))
+        sys.exit(1)
+    matrix, ylab, query_list, query_classes, params = \
+        store.load_matrix(os.path.abspath(args.store))
+    # Options fixed by the original run
+    cons = params.get('cons') is not None
+    args.cluster_column = params.get('cluster_column', False)
+    out_dir = ''
+    if args.output is not None:
+        out_dir = os.path.abspath(os.path.expanduser(args.output))
+        if not os.path.exists(out_dir):
+            os.makedirs(out_dir)
+    seqfindr.render(matrix, ylab, query_classes, query_list, cons, args,
+                    config.SeqFindrConfig(), out_dir)
+
+
+if __name__ == '__main__':
+    try:
+        start_time = time.time()
+
+        desc = __doc__.split('\n\n')[1].strip()
+        parser = argparse.ArgumentParser(description=desc, epilog=epi)
+        parser.add_argument('store', action='store',
+                            help=('Full path to a SeqFindr matrix store '
+                                  '(matrix_store in a SeqFindr output '
+                                  'directory)'))
+        parser.add_argument('-o', '--output', action='store', default=None,
+                            help=('Output the figure to this location '
+                                  '[default = current directory]'))
+        parser.add_argument('-r', '--reshape', action='store_false',
+                            default=True,
+                            help=('Differentiate between mapping and '
+                                  'assembly hits in the figure [default = no '
+                                  'differentiation]'))
+        parser.add_argument('-v', '--verbose', action='store_true',
+                            default=False, help='verbose output')
+        seqfindr.add_figure_options(parser)
+        parser.set_defaults(func=main)
+        args = parser.parse_args()
+        if args.verbose:
+            print "Executing @ " + time.asctime()
+        args.func(args)
+        if args.verbose:
+            print "Ended @ " + time.asctime()
+            print 'Exec time minutes %f:' % ((time.time() - start_time) / 60.0)
+        sys.exit(0)
+    except KeyboardInterrupt, e:
+        # Ctrl-C
+        raise e
+    except SystemExit, e:
+        # sys.exit()
+        raise e
+    except Exception, e:
+        print 'ERROR, UNEXPECTED EXCEPTION'
+        print str(e)
+        traceback.print_exc()
+        sys.exit(1)
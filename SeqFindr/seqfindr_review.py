@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+
+# Copyright 2013-2014 Mitchell Stanton-Cook Licensed under the
+#     Educational Community License, Version 2.0 (the "License"); you may
+#     not use this file except in compliance with the License. You may
+#     obtain a copy of the License at
+#
+#      http://www.osedu.org/licenses/ECL-2.0
+#
+#     Unless required by applicable law or agreed to in writing,
+#     software distributed under the License is distributed on an "AS IS"
+#     BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+#     or implied. See the License for the specific language governing
+#     permissions and limitations under the License.
+
+
+"""
+seqfindr_review
+===============
+
+Apply the decisions on the hits of a SeqFindr --careful --review run
+
+With --careful --review the hits within (tol-careful) of the cutoff are
+written to careful_review.tsv in the output directory rather than asked
+about while parsing. Add a decision column to the file (y accepts the hit,
+n or empty rejects it) & apply it to the stored matrix of the run. Only the
+accepted cells change (BLAST is not run again). The matrix is clustered &
+plotted with the options of the original run.
+
+Examples::
+
+    $ SeqFindr queries.fa assemblies/ -o run1 --careful 0.2 --review -j 8
+    # Add the decision column to a copy of run1/careful_review.tsv
+    $ seqfindr_review run1 decisions.tsv -o run1_reviewed
+"""
+
+__author__ = "Mitchell Stanton-Cook"
+__licence__ = "ECL"
+__version__ = "0.1"
+__email__ = "m.stantoncook@gmail.com"
+epi = "Licence: " + __licence__ + " by " + __author__ + " <" + __email__ + ">"
+USAGE = "seqfindr_review -h"
+
+
+import sys
+import os
+import traceback
+import argparse
+import time
+
+from SeqFindr import seqfindr
+
+
+def main(args):
+    """
+    Apply the decisions, cluster & plot
+
+    :param args: the arguments given from argparse
+    """
+    output = args.output
+    if output is None:
+        output = os.getcwd()
+    try:
+        seqfindr.apply_review(args.run, args.decisions, output)
+    except (IOError, ValueError), e:
+        sys.stderr.write("%s\n" % (e))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    try:
+        start_time = time.time()
+
+        desc = __doc__.split('\n\n')[1].strip()
+        parser = argparse.ArgumentParser(description=desc, epilog=epi)
+        parser.add_argument('run', action='store',
+                            help=('Full path to the output directory (or '
+                                  'matrix store) of a --review run'))
+        parser.add_argument('decisions', action='store',
+                            help=('Full path to the review file with a '
+                                  'decision column (y/n) added'))
+        parser.add_argument('-o', '--output', action='store', default=None,
+                            help=('Output the reviewed results to this '
+                                  'location [default = current directory]'))
+        parser.add_argument('-v', '--verbose', action='store_true',
+                            default=False, help='verbose output')
+        parser.set_defaults(func=main)
+        args = parser.parse_args()
+        if args.verbose:
+            print "Executing @ " + time.asctime()
+        args.func(args)
+        if args.verbose:
+            print "Ended @ " + time.asctime()
+            print 'Exec time minutes %f:' % ((time.time() - start_time) / 60.0)
+        sys.exit(0)
+    except KeyboardInterrupt, e:
+        # Ctrl-C
+        raise e
+    except SystemExit, e:
+        # sys.exit()
+        raise e
+    except Exception, e:
+        print 'ERROR, UNEXPECTED EXCEPTION'
+        print str(e)
+        traceback.print_exc()
+        sys.exit(1)
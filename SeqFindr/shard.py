@@ -0,0 +1,166 @@
+# Copyright 2013-2014 Mitchell Stanton-Cook Licensed under the
+#     Educational Community License, Version 2.0 (the "License"); you may
+#     not use this file except in compliance with the License. You may
+#     obtain a copy of the License at
+#
+#      http://www.osedu.org/licenses/ECL-2.0
+#
+#     Unless required by applicable law or agreed to in writing,
+#     software distributed under the License is distributed on an "AS IS"
+#     BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+#     or implied. See the License for the specific language governing
+#     permissions and limitations under the License.
+
+"""
+SeqFindr sharded runs
+
+A screen can be split across N processes (i.e. the tasks of a cluster
+array job) with --shard i/N. Shard i screens every Nth genome of the
+genomes sorted by strain id, starting at the ith, so the split only
+depends on the genomes given (not the directory listing order). Each shard
+stores its unclustered rows (see store) together with the row order of
+the whole run::
+
+    $ SeqFindr queries.fa assemblies/ -o shard1 --shard 1/3
+    $ SeqFindr queries.fa assemblies/ -o shard2 --shard 2/3
+    $ SeqFindr queries.fa assemblies/ -o shard3 --shard 3/3
+    $ seqfindr_merge shard1 shard2 shard3 -o merged
+
+The merge (see merge_stores()) puts the rows back into the order of a
+single run, which is then clustered & plotted once.
+"""
+
+import os
+import argparse
+
+import numpy as np
+
+from SeqFindr import hitmatrix
+from SeqFindr import store
+from SeqFindr import util
+
+
+def parse_shard(value):
+    """
+    Parse a shard given as i/N (argparse type)
+
+    :param value: the shard i.e. 2/8 (shards are numbered from 1)
+
+    :type value: string
+
+    :returns: a tuple of (i, N)
+    """
+    try:
+        index, count = [int(part) for part in value.split('/')]
+    except ValueError:
+        raise argparse.ArgumentTypeError("A shard is given as i/N i.e. 2/8 "
+                                         "(not %s)" % (value))
+    if count < 1 or not 1 <= index <= count:
+        raise argparse.ArgumentTypeError("Shard %s is not between 1/%i and "
+                                         "%i/%i" % (value, count, count,
+                                                    count))
+    return index, count
+
+
+def select(in_files, shard):
+    """
+    The genomes screened by a shard (in their input order)
+
+    :param in_files: a list of full paths to all the genomes of the run
+    :param shard: a tuple of (i, N) (see parse_shard())
+
+    :type in_files: list
+    :type shard: tuple
+
+    :returns: a list of full paths
+    """
+    index, count = shard
+    ranked = sorted(in_files, key=lambda f: (util.get_strain_id(f),
+                                             os.path.basename(f)))
+    chosen = set(ranked[index-1::count])
+    return [f for f in in_files if f in chosen]
+
+
+def shard_params(params, shard, row_order):
+    """
+    Add the shard & row order of the whole run to the stored parameters
+
+    :param params: the run parameters (see store.run_params())
+    :param shard: a tuple of (i, N)
+    :param row_order: the labels of every genome of the run in the order a
+                      single (unsharded) run would give them
+
+    :returns: the updated params
+    """
+    params['shard'] = list(shard)
+    params['shard_row_order'] = list(row_order)
+    return params
+
+
+def find_store(path):
+    """
+    The matrix store of a shard
+
+    :param path: full path to a shard output directory or its matrix store
+
+    :returns: full path to the matrix store
+    """
+    if os.path.isfile(os.path.join(path, 'meta.json')):
+        return path
+    return os.path.join(path, store.STORE_NAME)
+
+
+def merge_stores(paths):
+    """
+    Combine the matrix stores of every shard of a run
+
+    :param paths: a list of full paths to the shard output directories (or
+                  their matrix stores), in any order
+
+    :type paths: list
+
+    :returns: a tuple of the hit matrix (rows in single run order), strain
+              ids, query ids, query classes & run parameters (of shard 1,
+              without the shard entries)
+    """
+    shards = {}
+    for path in paths:
+        path = find_store(os.path.abspath(os.path.expanduser(path)))
+        if not os.path.isdir(path):
+            raise ValueError("No SeqFindr matrix store at %s" % (path))
+        loaded = store.load_matrix(path, mmap=False)
+        params = loaded[-1]
+        if params.get('shard') is None:
+            raise ValueError("%s is not the store of a sharded run" % (path))
+        index, count = params['shard']
+        if index in shards:
+            raise ValueError("Shard %i/%i given more than once" % (index,
+                                                                  count))
+        shards[index] = loaded
+    first = shards[min(shards)]
+    count = first[-1]['shard'][1]
+    missing = [str(idx) for idx in range(1, count+1) if idx not in shards]
+    if missing:
+        raise ValueError("Missing shards %s of %i" % (', '.join(missing),
+                                                     count))
+    for matrix, labels, queries, classes, params in shards.values():
+        if params['shard'][1] != count or \
+                params['shard_row_order'] != first[-1]['shard_row_order'] or \
+                queries != first[2] or \
+                (matrix.consensus is None) != (first[0].consensus is None):
+            raise ValueError("The shards are not from the same run")
+    ordered = [shards[idx] for idx in range(1, count+1)]
+    labels = sum([list(loaded[1]) for loaded in ordered], [])
+    position = dict((label, pos) for pos, label in
+                    enumerate(first[-1]['shard_row_order']))
+    rows = sorted(range(len(labels)), key=lambda row: position[labels[row]])
+    planes = []
+    for plane in range(len(first[0].planes())):
+        planes.append(np.vstack([loaded[0].planes()[plane]
+                                 for loaded in ordered]))
+    planes.append(None)
+    matrix = hitmatrix.HitMatrix(first[0].ncols, planes[0], planes[1])
+    params = dict(first[-1])
+    del params['shard'], params['shard_row_order']
+    return (matrix.take(rows), [labels[row] for row in rows], first[2],
+            first[3], params)
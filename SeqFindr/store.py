@@ -0,0 +1,131 @@
+# Copyright 2013-2014 Mitchell Stanton-Cook Licensed under the
+#     Educational Community License, Version 2.0 (the "License"); you may
+#     not use this file except in compliance with the License. You may
+#     obtain a copy of the License at
+#
+#      http://www.osedu.org/licenses/ECL-2.0
+#
+#     Unless required by applicable law or agreed to in writing,
+#     software distributed under the License is distributed on an "AS IS"
+#     BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+#     or implied. See the License for the specific language governing
+#     permissions and limitations under the License.
+
+"""
+SeqFindr results store
+
+The (clustered) hit matrix is saved as a directory holding the packed hit
+planes as .npy files (so they can be memory-mapped) & the labels and run
+parameters as JSON::
+
+    matrix_store/
+        assembly.npy
+        consensus.npy      (mapping consensus runs only)
+        meta.json          {"version", "ncols", "strain_labels",
+                            "query_list", "query_classes", "params"}
+
+A stored matrix can be re-plotted without any BLAST results (see
+seqfindr_replot).
+"""
+
+import os
+import json
+import shutil
+
+import numpy as np
+
+from SeqFindr import hitmatrix
+
+STORE_VERSION = 1
+
+# The default store name (in the SeqFindr output directory)
+STORE_NAME = "matrix_store"
+
+
+def run_params(args):
+    """
+    The JSON serialisable run parameters
+
+    :param args: the arguments given from argparse
+
+    :returns: a dictionary of option name to value
+    """
+    params = {}
+    for key, value in vars(args).items():
+        if value is None or isinstance(value, (bool, int, long, float,
+                                               basestring)):
+            params[key] = value
+    return params
+
+
+def save_matrix(path, matrix, strain_labels, query_list, query_classes,
+                params):
+    """
+    Save a hit matrix & its labels (atomically replacing any existing store)
+
+    :param path: full path to the store directory
+    :param matrix: the hit matrix
+    :param strain_labels: the strain ids (one per row)
+    :param query_list: the query ids (one per column)
+    :param query_classes: the query classes (one per column)
+    :param params: the run parameters (see run_params())
+
+    :type path: string
+    :type matrix: HitMatrix
+    :type strain_labels: list
+    :type query_list: list
+    :type query_classes: list
+    :type params: dict
+    """
+    tmp = path + '.tmp'
+    if os.path.exists(tmp):
+        shutil.rmtree(tmp)
+    os.makedirs(tmp)
+    np.save(os.path.join(tmp, 'assembly.npy'), matrix.assembly)
+    if matrix.consensus is not None:
+        np.save(os.path.join(tmp, 'consensus.npy'), matrix.consensus)
+    with open(os.path.join(tmp, 'meta.json'), 'w') as fout:
+        json.dump({'version': STORE_VERSION,
+                   'ncols': matrix.ncols,
+                   'strain_labels': list(strain_labels),
+                   'query_list': list(query_list),
+                   'query_classes': list(query_classes),
+                   'params': params}, fout)
+    if os.path.exists(path):
+        shutil.rmtree(path)
+    os.rename(tmp, path)
+
+
+def load_matrix(path, mmap=True):
+    """
+    Load a stored hit matrix
+
+    :param path: full path to the store directory
+    :param mmap: memory-map the hit planes rather than reading them
+                 (default = True)
+
+    :type path: string
+    :type mmap: boolean
+
+    :returns: a tuple of the hit matrix, strain ids, query ids, query
+              classes & run parameters
+    """
+    with open(os.path.join(path, 'meta.json')) as fin:
+        meta = json.load(fin)
+    if meta.get('version') != STORE_VERSION:
+        raise ValueError("Unsupported SeqFindr matrix store version in %s" %
+                         (path))
+    mmap_mode = None
+    if mmap:
+        mmap_mode = 'r'
+    assembly = np.load(os.path.join(path, 'assembly.npy'),
+                       mmap_mode=mmap_mode)
+    consensus = None
+    if os.path.isfile(os.path.join(path, 'consensus.npy')):
+        consensus = np.load(os.path.join(path, 'consensus.npy'),
+                            mmap_mode=mmap_mode)
+    matrix = hitmatrix.HitMatrix(meta['ncols'], assembly, consensus)
+    labels, queries, classes = [[item.encode('utf-8') for item in meta[key]]
+                                for key in ('strain_labels', 'query_list',
+                                            'query_classes')]
+    return matrix, labels, queries, classes, meta['params']
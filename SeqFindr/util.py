@@ -17,8 +17,8 @@ SeqFindr utility methods
 
 import os
 import sys
-import re
-from Bio import SeqIO
+import hashlib
+import threading
 
 
 def ensure_paths_for_args(args):
@@ -42,6 +42,10 @@ def ensure_paths_for_args(args):
         args.index_file = os.path.abspath(os.path.expanduser(args.index_file))
     if args.existing_data is not None:
         args.existing_data = os.path.abspath(os.path.expanduser(args.existing_data))
+    if args.db_cache is not None:
+        args.db_cache = os.path.abspath(os.path.expanduser(args.db_cache))
+    if args.manifest is not None:
+        args.manifest = os.path.abspath(os.path.expanduser(args.manifest))
     return args
 
 
@@ -49,40 +53,124 @@ def init_output_dirs(output_dir):
     """
     Create the output base (if needed) and change dir to it
 
-    :param args: the arguments given from argparse
+    The directories are created by make_output_dirs() (use it directly to
+    leave the working directory alone).
+
+    :param output_dir: the output directory (default None, the working
+                       directory)
+
+    :returns: the working directory before the change
     """
     current_dir = os.getcwd()
     if output_dir is not None:
-        if not os.path.exists(output_dir):
-            os.makedirs(output_dir)
-        else:
-            sys.stderr.write("Output directory exists\n")
+        output_dir = make_output_dirs(output_dir)
         os.chdir(output_dir)
+    else:
+        make_output_dirs(current_dir)
+    return current_dir
+
+
+def make_output_dirs(output_dir):
+    """
+    Create the output base (if needed) & its DBs & BLAST_results directories
+
+    Never changes the working directory.
+
+    :param output_dir: the output directory
+
+    :returns: the absolute path to the output directory
+    """
+    output_dir = os.path.abspath(os.path.expanduser(output_dir))
+    if not os.path.exists(output_dir):
+        os.makedirs(output_dir)
+    elif output_dir != os.getcwd():
+        sys.stderr.write("Output directory exists\n")
     try:
-        os.mkdir("DBs")
+        os.mkdir(os.path.join(output_dir, "DBs"))
     except OSError:
         sys.stderr.write("A DBs directory exists. Overwriting\n")
     try:
-        os.mkdir("BLAST_results")
+        os.mkdir(os.path.join(output_dir, "BLAST_results"))
     except OSError:
         sys.stderr.write("A BLAST_results directory exists.")
-    return current_dir
+    return output_dir
 
 
-def get_fasta_files(data_path):
+# The recognised FASTA extensions (& compression)
+FASTA_EXTS = (".fas", ".fna", ".fa", ".fasta")
+COMPRESSED_EXTS = (".gz",)
+
+
+def get_fasta_files(data_path, compressed=True):
     """
     Returns all files ending with .fas/.fa/fna in a directory
 
     :param data_path: the full path to the directory of interest
+    :param compressed: also return gzip (or bgzip) compressed FASTA files
+                       i.e. strain.fa.gz (default = True)
+
+    A plain & a compressed copy of the same file (strain.fa &
+    strain.fa.gz) would share a strain id & output files so only the plain
+    file is returned (with a warning).
 
     :returns: a list of fasta files (valid extensions: .fas, .fna, .fa
     """
-    in_files = []
+    in_files, by_name = [], {}
     for files in os.listdir(data_path):
-            if files.endswith(".fas") or files.endswith(".fna") \
-                    or files.endswith(".fa") or files.endswith(".fasta"):
-                in_files.append(os.path.join(data_path, files))
-    return in_files
+            name = files
+            if compressed and name.endswith(COMPRESSED_EXTS):
+                name = os.path.splitext(name)[0]
+            if name.endswith(FASTA_EXTS):
+                in_files.append(files)
+                by_name.setdefault(name, []).append(files)
+    for name, copies in by_name.items():
+        if len(copies) > 1:
+            sys.stderr.write("Found both %s & a compressed copy in %s. "
+                             "Using %s\n" % (name, data_path, name))
+            for files in copies:
+                if files != name:
+                    in_files.remove(files)
+    return [os.path.join(data_path, files) for files in in_files]
+
+
+def is_compressed(fasta_file):
+    """
+    Whether a FASTA file is gzip (or bgzip) compressed (by extension)
+
+    :param fasta_file: path to a FASTA file
+
+    :rtype: boolean
+    """
+    return fasta_file.endswith(COMPRESSED_EXTS)
+
+
+def uncompressed_name(fasta_file):
+    """
+    The name of a FASTA file without any compression extension
+
+    :param fasta_file: path to a FASTA file
+
+    :rtype: string
+    """
+    if is_compressed(fasta_file):
+        return os.path.splitext(fasta_file)[0]
+    return fasta_file
+
+
+def open_fasta(fasta_file):
+    """
+    Open a (possibly gzip or bgzip compressed) FASTA file for reading
+
+    Compressed files are decompressed as they are read.
+
+    :param fasta_file: path to a FASTA file
+
+    :returns: a file object
+    """
+    if is_compressed(fasta_file):
+        import gzip
+        return gzip.open(fasta_file, 'rb')
+    return open(fasta_file, 'rU')
 
 
 def order_inputs(order_index_file, dir_listing):
@@ -128,64 +216,174 @@ def order_inputs(order_index_file, dir_listing):
     return ordered
 
 
+# IUPAC nucleotide codes (incl. ambiguity codes, gaps & masking) & line
+# whitespace. Any other character in a sequence means protein
+NUCLEOTIDE_CODES = 'ACGTUNRYSWKMBDHVXacgtunryswkmbdhvx-.\r\n\t '
+
+
+def is_protein_line(line):
+    """
+    Whether a sequence line has a (non IUPAC nucleotide) protein character
+
+    A byte-level check (str.translate) so it is fast on long lines.
+
+    :param line: a line of sequence
+
+    :type line: string
+
+    :rtype: boolean
+    """
+    return len(line.translate(None, NUCLEOTIDE_CODES)) != 0
+
+
 def is_protein(fasta_file):
     """
     Checks if a FASTA file is protein or nucleotide.
 
-    Will return -1 if no protein detected
+    Will return -1 if no protein detected. A sequence is protein if any of
+    its lines is (see is_protein_line(), as used by read_query_database())
 
-    TODO: Abiguity characters?
     TODO: exception if mix of protein/nucleotide?
 
     :param fasta_file: path to input FASTA file
 
     :type fasta_file: string
 
-    :returns: number of protein sequences in fasta_file (int)
+    :returns: number of protein sequences in fasta_file minus 1 (int)
     """
-    protein_hits = -1
-    with open(fasta_file, 'rU') as fin:
-        for record in SeqIO.parse(fin, 'fasta'):
-            if re.match('[^ATCGNatcgn]+', str(record.seq)) is not None:
+    protein_hits, decided = -1, True
+    with open_fasta(fasta_file) as fin:
+        for line in fin:
+            if line.startswith('>'):
+                decided = False
+            elif not decided and is_protein_line(line):
                 protein_hits += 1
+                decided = True
     return protein_hits
 
 
-def check_database(database_file):
+class QueryDatabase(object):
     """
-    Check the database conforms to the SeqFindr format
+    The queries of a SeqFindr formatted database (see read_query_database())
+
+    :ivar path: full path to the database
+    :ivar query_list: the query ids (gene id, in file order)
+    :ivar query_classes: the corresponding query classes
+    :ivar duplicates: the query ids given more than once (first seen order)
+    :ivar grouped: whether the records of each class are contiguous
+    :ivar protein: whether any query is protein (see is_protein_line())
+    """
+    def __init__(self, path):
+        self.path = path
+        self.query_list = []
+        self.query_classes = []
+        self.duplicates = []
+        self.grouped = True
+        self.protein = False
 
-    .. note:: this is not particulalry extensive
 
-    :args database_file: full path to a database file as a string
+def read_query_database(database_file):
+    """
+    Validate & load a SeqFindr formatted database in a single streaming pass
+
+    Every header must be in the format:
+
+    >ident, gene id, annotation, organism [class]
+
+    Sequence lines are only checked (see is_protein_line()) until the first
+    protein query is found.
+
+    :param database_file: full path to a database file
 
     :type database_file: string
+
+    :returns: a QueryDatabase
     """
-    at_least_one = 0
-    stored_categories = []
-    with open(database_file) as db_in:
+    database = QueryDatabase(database_file)
+    seen, seen_classes, duplicated = set(), set(), set()
+    prev_class = None
+    with open_fasta(database_file) as db_in:
         for line in db_in:
             if line.startswith('>'):
-                at_least_one += 1
-                # Do the check
-                if len(line.split(',')) != 4 or line.split(',')[-1].count(']') != 1 or line.split(',')[-1].count('[') != 1:
-                    raise Exception("Database is not formatted correctly at this line: " + line)
+                fields = line.split(',')
+                if len(fields) != 4 or fields[-1].count(']') != 1 or \
+                        fields[-1].count('[') != 1:
+                    raise Exception("Database is not formatted correctly at "
+                                    "this line: " + line)
+                query = fields[1].strip()
+                query_class = fields[-1].split('[')[-1].split(']')[0].strip()
+                if query in seen:
+                    if query not in duplicated:
+                        duplicated.add(query)
+                        database.duplicates.append(query)
                 else:
-                    tmp = line.split(',')[-1]
-                    cur = tmp.split('[')[-1].split(']')[0].strip()
-                    stored_categories.append(cur)
-    if at_least_one == 0:
+                    seen.add(query)
+                if query_class != prev_class:
+                    if query_class in seen_classes:
+                        database.grouped = False
+                    seen_classes.add(query_class)
+                    prev_class = query_class
+                database.query_list.append(query)
+                database.query_classes.append(query_class)
+            elif not database.protein and is_protein_line(line):
+                database.protein = True
+    if not database.query_list:
         raise Exception("Database contains no fasta headers")
-    # Check that the categories maintain the correct order.
-    cat_counts = len(set(stored_categories))
-    prev = stored_categories[0]
-    # There will always be 1
-    detected_cats = 1
-    for i in range(1, len(stored_categories)):
-        if stored_categories[i] != prev:
-            detected_cats += 1
-        prev = stored_categories[i]
-    if cat_counts != detected_cats:
+    return database
+
+
+_FILE_CACHE = {}
+_FILE_CACHE_LOCK = threading.Lock()
+
+
+def cached_by_file(kind, path, loader):
+    """
+    loader(path) cached for as long as the file (mtime & size) is unchanged
+
+    :param kind: the cache namespace (i.e. the loader name)
+    :param path: path to the file
+    :param loader: a function of the full path to the file
+
+    :returns: the (shared, do not modify) result of loader
+    """
+    path = os.path.abspath(path)
+    info = os.stat(path)
+    key = (info.st_mtime, info.st_size)
+    with _FILE_CACHE_LOCK:
+        cached = _FILE_CACHE.get((kind, path))
+    if cached is not None and cached[0] == key:
+        return cached[1]
+    result = loader(path)
+    with _FILE_CACHE_LOCK:
+        _FILE_CACHE[(kind, path)] = (key, result)
+    return result
+
+
+def get_query_database(database_file):
+    """
+    read_query_database() cached for as long as the file is unchanged
+
+    :param database_file: full path to a database file
+
+    :type database_file: string
+
+    :returns: a QueryDatabase (shared, do not modify)
+    """
+    return cached_by_file('query_database', database_file,
+                          read_query_database)
+
+
+def check_database(database_file):
+    """
+    Check the database conforms to the SeqFindr format
+
+    .. note:: this is not particulalry extensive
+
+    :args database_file: full path to a database file as a string
+
+    :type database_file: string
+    """
+    if not get_query_database(database_file).grouped:
         print ("Please ensure that your classifications ([ element ]) are "
                "grouped")
         sys.exit(1)
@@ -216,7 +414,163 @@ def del_from_list(target, index_positions):
     for e in index_positions:
         if e >= len(target):
             raise ValueError("index_positions > len target list")
-    for offset, index in enumerate(index_positions):
-        index -= offset
-        del target[index]
+    remove = set(index_positions)
+    target[:] = [e for idx, e in enumerate(target) if idx not in remove]
     return target
+
+
+def append_locked(path, text, header=None):
+    """
+    Append to a file in a single write under an exclusive lock & sync it
+
+    Safe for concurrent processes (i.e. pool workers) appending to the same
+    file.
+
+    :param path: full path to the file (created if needed)
+    :param text: the text to append
+    :param header: written first if the file is empty (checked under the
+                   lock so it is written once, default = None)
+
+    :type path: string
+    :type text: string
+    :type header: string
+    """
+    import fcntl
+    fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0644)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        if header is not None and os.fstat(fd).st_size == 0:
+            text = header + text
+        os.write(fd, text)
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def hash_file(path, block_size=1 << 20):
+    """
+    Hash the contents of a file
+
+    :param path: full path to the file
+    :param block_size: the number of bytes to read at a time
+
+    :type path: string
+    :type block_size: int
+
+    :returns: the sha1 hex digest of the file contents
+    """
+    digest = hashlib.sha1()
+    with open(path, 'rb') as fin:
+        while True:
+            block = fin.read(block_size)
+            if not block:
+                break
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def get_strain_id(fasta_file):
+    """
+    The strain id of a genome (basename delimited by '_')
+
+    :param fasta_file: full path to a fasta file
+
+    :type fasta_file: string
+
+    :rtype: string
+    """
+    return os.path.basename(uncompressed_name(fasta_file)).split('_')[0]
+
+
+def iter_fasta(fasta_file):
+    """
+    Stream the records of a FASTA file without building SeqRecords
+
+    :param fasta_file: full path to a fasta file
+
+    :type fasta_file: string
+
+    :returns: a generator of (header, sequence) tuples where header excludes
+              the leading '>'
+    """
+    header, seq = None, []
+    with open_fasta(fasta_file) as fin:
+        for line in fin:
+            if line.startswith('>'):
+                if header is not None:
+                    yield header, ''.join(seq)
+                header, seq = line[1:].strip(), []
+            elif header is not None:
+                seq.append(line.strip())
+    if header is not None:
+        yield header, ''.join(seq)
+
+
+def trim_fasta(fin, fout, strip, wrap=60):
+    """
+    Strip the 1st and last strip bases of every record of a FASTA stream
+
+    Works on the raw lines with a buffer of strip + one line of bases, so
+    records of any length are trimmed in bounded memory. Output is wrapped
+    at wrap bases per line (as Bio.SeqIO's FASTA writer).
+
+    :param fin: the input FASTA file object
+    :param fout: the output file object
+    :param strip: the number of bases to strip from each end (0 keeps
+                  the records whole)
+    :param wrap: the output line length
+
+    :type strip: int
+    :type wrap: int
+    """
+    def write_wrapped(bases):
+        for start in range(0, len(bases), wrap):
+            fout.write(bases[start:start+wrap] + '\n')
+
+    def finish(buf):
+        if len(buf) > strip:
+            write_wrapped(buf[:len(buf)-strip])
+
+    buf, skip, in_record = '', 0, False
+    for line in fin:
+        if line.startswith('>'):
+            if in_record:
+                finish(buf)
+            fout.write('>' + line[1:].rstrip() + '\n')
+            buf, skip, in_record = '', strip, True
+            continue
+        if not in_record:
+            continue
+        bases = line.strip().replace(' ', '')
+        if skip:
+            dropped = min(skip, len(bases))
+            bases = bases[dropped:]
+            skip -= dropped
+        buf += bases
+        # Emit whole lines that can't be in the last strip bases
+        ready = ((len(buf) - strip) // wrap) * wrap
+        if ready > 0:
+            write_wrapped(buf[:ready])
+            buf = buf[ready:]
+    if in_record:
+        finish(buf)
+
+
+def trim_fasta_file(fasta_file, out_file, strip):
+    """
+    trim_fasta() a (possibly compressed) FASTA file to an (uncompressed) file
+
+    The output is written to a temporary file & renamed into place so an
+    interrupted run never leaves a partial output.
+
+    :param fasta_file: path to the input FASTA file
+    :param out_file: path to the output FASTA file
+    :param strip: the number of bases to strip from each end
+
+    :returns: out_file
+    """
+    tmp = out_file + '.tmp'
+    with open_fasta(fasta_file) as fin, open(tmp, 'w') as fout:
+        trim_fasta(fin, fout, strip)
+    os.rename(tmp, out_file)
+    return out_file
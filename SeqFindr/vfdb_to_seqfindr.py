@@ -74,7 +74,6 @@ import argparse
 import time
 import fileinput
 import shutil
-from Bio import SeqIO
 
 
 def main(args):
@@ -118,6 +117,7 @@ def order_by_class(args):
     """
     Ensure that all particualr classes are in the same block
     """
+    from Bio import SeqIO
     d = {}
     with open(args.outfile, "rU") as fin:
         for record in SeqIO.parse(fin, "fasta"):
@@ -71,7 +71,9 @@ setup(
     packages=packages,
     test_suite="tests",
     package_dir={__title__: __title__},
-    scripts=[__title__+'/'+__title__, __title__+'/vfdb_to_seqfindr'],
+    scripts=[__title__+'/'+__title__, __title__+'/vfdb_to_seqfindr',
+             __title__+'/seqfindr_replot', __title__+'/seqfindr_merge',
+             __title__+'/seqfindr_review'],
     package_data={},
     data_files=[('', ['LICENSE', 'requirements.txt', 'README.rst']),
                 ('docs', html), ('docs/_static', static),
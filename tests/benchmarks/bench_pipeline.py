@@ -0,0 +1,136 @@
+#!/usr/bin/env python
+
+"""
+Benchmark the SeqFindr pipeline stages on a synthetic panel
+
+Generates a panel (see synthetic.py) & times check_database,
+prepare_queries, parse_BLAST (on the canned results), the matrix build,
+clustering & plotting. No BLAST install is needed. Reports the wall time,
+CPU time & peak RSS of each stage (see SeqFindr.profiling)::
+
+    $ python bench_pipeline.py --genomes 1000 --queries 1000
+    $ python bench_pipeline.py --genomes 10000 --queries 100 \\
+          --outfmt tabular --large_render --report bench.json
+
+Peak RSS is the process high water mark so the growth column shows the
+stage that raised it.
+"""
+
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+
+PACKAGE = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+sys.path.insert(0, PACKAGE)
+
+from SeqFindr import blast
+from SeqFindr import hitmatrix
+from SeqFindr import profiling
+from SeqFindr import seqfindr
+from SeqFindr import util
+
+import synthetic
+
+
+def run_stages(paths, args, out_dir):
+    """
+    Run & record the pipeline stages on a panel
+
+    :returns: the stage records
+    """
+    recorder = profiling.Recorder()
+    sf_args = seqfindr.build_parser().parse_args([paths['queries'],
+                                                  paths['assemblies']])
+    sf_args.output = out_dir
+    sf_args.existing_data = paths['existing']
+    sf_args.large_render = args.large_render
+    sf_args.cluster_metric = args.cluster_metric
+    sf_args.reshape = False
+    with recorder.stage('check_database'):
+        util.check_database(paths['queries'])
+    with recorder.stage('prepare_queries'):
+        query_list, query_classes = seqfindr.prepare_queries(sf_args)
+    results = sorted(os.listdir(os.path.join(paths['existing'],
+                                             'BLAST_results')))
+    with recorder.stage('parse_BLAST'):
+        hits = [blast.parse_BLAST(os.path.join(paths['existing'],
+                                               'BLAST_results', result),
+                                  float(sf_args.tol), float(sf_args.cov), 0)
+                for result in results]
+    labels = [result.split('ID=')[-1].split('_blast.')[0]
+              for result in results]
+    with recorder.stage('matrix_build'):
+        matrix = hitmatrix.HitMatrix(len(query_list),
+                                     hitmatrix.pack_hits(query_list, hits))
+    dendrogram_file = None
+    if args.dendrogram:
+        dendrogram_file = os.path.join(out_dir, 'dendrogram.png')
+    with recorder.stage('cluster'):
+        matrix, labels = seqfindr.cluster_matrix(matrix, labels,
+                                                 sf_args.DPI, False,
+                                                 False, dendrogram_file,
+                                                 args.cluster_metric,
+                                                 args.collapse_identical)
+    if not args.no_plot:
+        with recorder.stage('plot'):
+            seqfindr.render(matrix, labels, query_classes, query_list, False,
+                            sf_args, {'category_colors': None}, out_dir)
+    return recorder.records
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[1])
+    synthetic.add_panel_options(parser)
+    parser.add_argument('--cluster_metric', default='euclidean',
+                        choices=('euclidean', 'hamming'),
+                        help='Clustering distance [default = euclidean]')
+    parser.add_argument('--collapse_identical', action='store_true',
+                        default=False, help='Cluster identical rows as one')
+    parser.add_argument('--dendrogram', action='store_true', default=False,
+                        help='Also draw the dendrogram')
+    parser.add_argument('--large_render', action='store_true', default=False,
+                        help='Plot with the bounded memory renderer')
+    parser.add_argument('--no_plot', action='store_true', default=False,
+                        help='Skip plotting')
+    parser.add_argument('--work_dir', default=None,
+                        help=('Generate the panel & outputs here (kept) '
+                              '[default = a temporary directory]'))
+    parser.add_argument('--report', default=None,
+                        help='Also write the JSON stage report here')
+    args = parser.parse_args()
+    work_dir = args.work_dir
+    if work_dir is None:
+        work_dir = tempfile.mkdtemp(prefix='seqfindr_bench_')
+    try:
+        start = time.time()
+        paths = synthetic.panel_from_args(os.path.join(work_dir, 'panel'),
+                                          args)
+        print "%i genomes x %i queries (%s) generated in %.1f s" % (
+            args.genomes, args.queries, args.outfmt, time.time() - start)
+        out_dir = os.path.join(work_dir, 'out')
+        if not os.path.isdir(out_dir):
+            os.makedirs(out_dir)
+        records = run_stages(paths, args, out_dir)
+    finally:
+        if args.work_dir is None:
+            shutil.rmtree(work_dir)
+    print "%-16s %10s %10s %12s %12s" % ('stage', 'wall (s)', 'cpu (s)',
+                                         'peak RSS MB', 'growth MB')
+    previous = None
+    for record in records:
+        peak = record['peak_rss_kb'] / 1024.0
+        growth = 0.0
+        if previous is not None:
+            growth = peak - previous
+        previous = peak
+        print "%-16s %10.3f %10.3f %12.1f %12.1f" % (
+            record['stage'], record['wall'], record['cpu'], peak, growth)
+    if args.report is not None:
+        profiling.write_report(args.report, records)
+
+
+if __name__ == '__main__':
+    main()
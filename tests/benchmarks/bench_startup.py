@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+
+"""
+Benchmark the start up time of the SeqFindr command line tools
+
+Runs each command a number of times & reports the median wall time. With
+--max_ms the benchmark fails (exit 1) if any median exceeds the limit, so
+it can guard against import time regressions::
+
+    $ python bench_startup.py --repeat 20 --max_ms 500
+"""
+
+import os
+import sys
+import time
+import argparse
+import subprocess
+
+PACKAGE = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+
+COMMANDS = [('SeqFindr --help', ['SeqFindr/seqfindr.py', '--help']),
+            ('vfdb_to_seqfindr --help', ['SeqFindr/vfdb_to_seqfindr.py',
+                                         '--help']),
+            ('seqfindr_replot --help', ['SeqFindr/seqfindr_replot.py',
+                                        '--help']),
+            ('import SeqFindr.seqfindr', ['-c',
+                                          'import SeqFindr.seqfindr'])]
+
+
+def time_command(cmd, repeat):
+    """
+    The median wall time (ms) of running a command with this interpreter
+    """
+    env = dict(os.environ, PYTHONPATH=PACKAGE)
+    cmd = [sys.executable] + [os.path.join(PACKAGE, arg)
+                              if arg.startswith('SeqFindr/') else arg
+                              for arg in cmd]
+    times = []
+    with open(os.devnull, 'w') as devnull:
+        for _ in range(repeat):
+            start = time.time()
+            subprocess.check_call(cmd, stdout=devnull, stderr=devnull,
+                                  env=env)
+            times.append((time.time() - start) * 1000.0)
+    return sorted(times)[len(times) // 2]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[1])
+    parser.add_argument('--repeat', type=int, default=10,
+                        help='Runs per command [default = 10]')
+    parser.add_argument('--max_ms', type=float, default=None,
+                        help='Fail if a median exceeds this [default = None]')
+    args = parser.parse_args()
+    baseline = time_command(['-c', 'pass'], args.repeat)
+    print "%-28s %8.1f ms" % ('python (baseline)', baseline)
+    failed = False
+    for name, cmd in COMMANDS:
+        median = time_command(cmd, args.repeat)
+        print "%-28s %8.1f ms" % (name, median)
+        if args.max_ms is not None and median > args.max_ms:
+            failed = True
+    if failed:
+        sys.stderr.write("Start up time exceeds %.1f ms\n" % (args.max_ms))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,262 @@
+#!/usr/bin/env python
+
+"""
+Generate a synthetic SeqFindr panel at any scale
+
+Writes a SeqFindr formatted query database, a directory of assemblies & the
+BLAST results of screening them (as an existing SeqFindr run, see
+SeqFindr -e) so the pipeline can be benchmarked without BLAST::
+
+    $ python synthetic.py panel --genomes 1000 --queries 500
+
+    panel/
+        queries.fa
+        assemblies/g00000_asm.fa ...
+        existing/BLAST_results/DB=queriesID=g00000_asm_blast.xml ...
+
+Each genome carries a query with probability --hit_rate. Carried queries
+are embedded in the assembly (so a real BLAST run finds them too) & are
+exact hits in the canned results. A further --partial_rate of the queries
+are canned partial hits (90% identity) that fall below the default
+cutoff.
+"""
+
+import os
+import sys
+import argparse
+
+import numpy as np
+
+BASES = np.array(list('ACGT'))
+
+XML_HEAD = """<?xml version="1.0"?>
+<BlastOutput>
+  <BlastOutput_program>blastn</BlastOutput_program>
+  <BlastOutput_version>BLASTN 2.2.28+</BlastOutput_version>
+  <BlastOutput_db>DBs/%s</BlastOutput_db>
+  <BlastOutput_query-ID>Query_1</BlastOutput_query-ID>
+  <BlastOutput_query-def>q</BlastOutput_query-def>
+  <BlastOutput_query-len>100</BlastOutput_query-len>
+  <BlastOutput_param><Parameters>
+    <Parameters_expect>0.0001</Parameters_expect>
+    <Parameters_sc-match>1</Parameters_sc-match>
+    <Parameters_sc-mismatch>-2</Parameters_sc-mismatch>
+    <Parameters_gap-open>0</Parameters_gap-open>
+    <Parameters_gap-extend>0</Parameters_gap-extend>
+    <Parameters_filter>F</Parameters_filter>
+  </Parameters></BlastOutput_param>
+  <BlastOutput_iterations>
+"""
+
+XML_ITERATION = """<Iteration>
+  <Iteration_iter-num>%i</Iteration_iter-num>
+  <Iteration_query-ID>Query_%i</Iteration_query-ID>
+  <Iteration_query-def>%s</Iteration_query-def>
+  <Iteration_query-len>%i</Iteration_query-len>
+  <Iteration_hits>
+"""
+
+XML_HIT = """<Hit>
+  <Hit_num>1</Hit_num>
+  <Hit_id>gnl|BL_ORD_ID|0</Hit_id>
+  <Hit_def>contig1</Hit_def>
+  <Hit_accession>0</Hit_accession>
+  <Hit_len>%i</Hit_len>
+  <Hit_hsps>
+<Hsp>
+  <Hsp_num>1</Hsp_num>
+  <Hsp_bit-score>%i</Hsp_bit-score>
+  <Hsp_score>%i</Hsp_score>
+  <Hsp_evalue>1e-40</Hsp_evalue>
+  <Hsp_query-from>1</Hsp_query-from>
+  <Hsp_query-to>%i</Hsp_query-to>
+  <Hsp_hit-from>1</Hsp_hit-from>
+  <Hsp_hit-to>%i</Hsp_hit-to>
+  <Hsp_identity>%i</Hsp_identity>
+  <Hsp_positive>%i</Hsp_positive>
+  <Hsp_gaps>0</Hsp_gaps>
+  <Hsp_align-len>%i</Hsp_align-len>
+  <Hsp_qseq>A</Hsp_qseq>
+  <Hsp_hseq>A</Hsp_hseq>
+  <Hsp_midline>|</Hsp_midline>
+</Hsp>
+</Hit_hsps></Hit>
+"""
+
+
+def random_seq(rng, length):
+    """
+    A random nucleotide sequence
+    """
+    return ''.join(BASES[rng.randint(0, 4, length)])
+
+
+def write_fasta(fout, header, seq, width=80):
+    """
+    Write a FASTA record (wrapped)
+    """
+    fout.write('>%s\n' % (header))
+    for start in range(0, len(seq), width):
+        fout.write(seq[start:start+width] + '\n')
+
+
+def query_headers(nqueries, nclasses):
+    """
+    SeqFindr formatted query headers (the classes are grouped)
+
+    :returns: a list of headers (without the leading '>')
+    """
+    nclasses = max(1, min(nclasses, nqueries))
+    return ['%i, gene%05i, synthetic gene %i, Synthetic organism [class%03i]'
+            % (idx+1, idx, idx, (idx * nclasses) // nqueries)
+            for idx in range(nqueries)]
+
+
+def hit_states(ngenomes, nqueries, hit_rate, partial_rate, seed):
+    """
+    The hit state of every genome & query
+
+    :returns: a (ngenomes x nqueries) numpy array. 2 is a hit (the query is
+              carried), 1 a partial hit & 0 no hit
+    """
+    draws = np.random.RandomState(seed).rand(ngenomes, nqueries)
+    states = np.zeros((ngenomes, nqueries), dtype=np.int8)
+    states[draws < hit_rate + partial_rate] = 1
+    states[draws < hit_rate] = 2
+    return states
+
+
+def write_xml(path, database, headers, query_length, states, genome_length):
+    """
+    Write canned BLAST XML for a genome (one iteration per query)
+    """
+    partial = int(query_length * 0.9)
+    with open(path, 'w') as fout:
+        fout.write(XML_HEAD % (database))
+        for idx, header in enumerate(headers):
+            fout.write(XML_ITERATION % (idx+1, idx+1, header, query_length))
+            if states[idx]:
+                ident = query_length
+                if states[idx] == 1:
+                    ident = partial
+                fout.write(XML_HIT % (genome_length, ident, ident,
+                                      query_length, query_length, ident,
+                                      ident, query_length))
+            fout.write("</Iteration_hits></Iteration>\n")
+        fout.write("</BlastOutput_iterations>\n</BlastOutput>\n")
+
+
+def write_tsv(path, headers, query_length, states):
+    """
+    Write canned tabular (outfmt 7, see blast.TABULAR_FIELDS) BLAST results
+    """
+    partial = int(query_length * 0.9)
+    with open(path, 'w') as fout:
+        fout.write("# BLASTN 2.2.28+\n")
+        for idx, header in enumerate(headers):
+            fout.write("# Query: %s\n" % (header))
+            fout.write("# Fields: query id, subject id, ...\n")
+            fout.write("# %i hits found\n" % (int(states[idx] > 0)))
+            if states[idx]:
+                ident = query_length
+                if states[idx] == 1:
+                    ident = partial
+                fout.write("%s\tcontig1\t%i\t%i\t%i\t0\t1e-40\tcontig1\n" %
+                           (header.split()[0], query_length, ident,
+                            query_length))
+        fout.write("# BLAST processed %i queries\n" % (len(headers)))
+
+
+def make_panel(out_dir, ngenomes, nqueries, nclasses=10, query_length=500,
+               genome_length=5000, hit_rate=0.4, partial_rate=0.1,
+               outfmt='xml', seed=1):
+    """
+    Write a synthetic panel (see the module docstring)
+
+    :returns: a dictionary of the paths (queries, assemblies, existing) &
+              the hit states (see hit_states())
+    """
+    rng = np.random.RandomState(seed)
+    paths = {'queries': os.path.join(out_dir, 'queries.fa'),
+             'assemblies': os.path.join(out_dir, 'assemblies'),
+             'existing': os.path.join(out_dir, 'existing')}
+    results_dir = os.path.join(paths['existing'], 'BLAST_results')
+    for path in [paths['assemblies'], results_dir]:
+        if not os.path.isdir(path):
+            os.makedirs(path)
+    headers = query_headers(nqueries, nclasses)
+    queries = [random_seq(rng, query_length) for _ in headers]
+    with open(paths['queries'], 'w') as fout:
+        for header, seq in zip(headers, queries):
+            write_fasta(fout, header, seq)
+    states = hit_states(ngenomes, nqueries, hit_rate, partial_rate, seed)
+    suffix = {'xml': '_blast.xml', 'tabular': '_blast.tsv'}[outfmt]
+    for gidx in range(ngenomes):
+        name = 'g%05i_asm' % (gidx)
+        carried = [queries[qidx] for qidx in np.flatnonzero(states[gidx] == 2)]
+        # The carried queries separated by random sequence
+        filler = random_seq(rng, genome_length)
+        contig = filler + ''.join([query + filler[:100] for query in carried])
+        with open(os.path.join(paths['assemblies'], name + '.fa'), 'w') as fout:
+            write_fasta(fout, 'contig1', contig)
+        result = os.path.join(results_dir,
+                              'DB=queriesID=%s%s' % (name, suffix))
+        if outfmt == 'xml':
+            write_xml(result, name + '.fa', headers, query_length,
+                      states[gidx], len(contig))
+        else:
+            write_tsv(result, headers, query_length, states[gidx])
+    paths['states'] = states
+    return paths
+
+
+def add_panel_options(parser):
+    """
+    Add the panel options to an argparse parser
+    """
+    parser.add_argument('--genomes', type=int, default=100,
+                        help='Number of genomes [default = 100]')
+    parser.add_argument('--queries', type=int, default=200,
+                        help='Number of queries [default = 200]')
+    parser.add_argument('--classes', type=int, default=10,
+                        help='Number of query classes [default = 10]')
+    parser.add_argument('--query_length', type=int, default=500,
+                        help='Query length [default = 500]')
+    parser.add_argument('--genome_length', type=int, default=5000,
+                        help=('Random sequence per assembly (plus the '
+                              'carried queries) [default = 5000]'))
+    parser.add_argument('--hit_rate', type=float, default=0.4,
+                        help='Probability a query is carried [default = 0.4]')
+    parser.add_argument('--partial_rate', type=float, default=0.1,
+                        help=('Probability of a canned partial hit '
+                              '[default = 0.1]'))
+    parser.add_argument('--outfmt', default='xml', choices=('xml', 'tabular'),
+                        help='Canned BLAST result format [default = xml]')
+    parser.add_argument('--seed', type=int, default=1,
+                        help='Random seed [default = 1]')
+
+
+def panel_from_args(out_dir, args):
+    """
+    make_panel() with the panel options of add_panel_options()
+    """
+    return make_panel(out_dir, args.genomes, args.queries, args.classes,
+                      args.query_length, args.genome_length, args.hit_rate,
+                      args.partial_rate, args.outfmt, args.seed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[1])
+    parser.add_argument('out_dir', help='Write the panel here')
+    add_panel_options(parser)
+    args = parser.parse_args()
+    paths = panel_from_args(args.out_dir, args)
+    sys.stderr.write("Wrote %i genomes x %i queries to %s\n" %
+                     (args.genomes, args.queries, args.out_dir))
+    sys.stderr.write("Screen with: SeqFindr %s %s -e %s\n" %
+                     (paths['queries'], paths['assemblies'],
+                      paths['existing']))
+
+
+if __name__ == '__main__':
+    main()
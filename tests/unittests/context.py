@@ -5,8 +5,20 @@ import pytest
 sys.path.insert(0, os.path.abspath('../../'))
 
 from SeqFindr import blast
+from SeqFindr import cluster
 from SeqFindr import config
+from SeqFindr import dbcache
+from SeqFindr import hitmatrix
 from SeqFindr import imaging
+from SeqFindr import journal
+from SeqFindr import manifest
+from SeqFindr import pipeline
+from SeqFindr import prefilter
+from SeqFindr import profiling
+from SeqFindr import raster
+from SeqFindr import review
 from SeqFindr import seqfindr
+from SeqFindr import shard
+from SeqFindr import store
 from SeqFindr import util
 from SeqFindr import vfdb_to_seqfindr
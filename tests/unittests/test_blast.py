@@ -1,9 +1,109 @@
 from context import blast
+from context import dbcache
 from context import pytest
 import os
 import glob
 
 
+BLAST_XML_HEAD = """<?xml version="1.0"?>
+<BlastOutput>
+  <BlastOutput_program>blastn</BlastOutput_program>
+  <BlastOutput_version>BLASTN 2.2.28+</BlastOutput_version>
+  <BlastOutput_db>DBs/test</BlastOutput_db>
+  <BlastOutput_query-ID>Query_1</BlastOutput_query-ID>
+  <BlastOutput_query-def>q</BlastOutput_query-def>
+  <BlastOutput_query-len>100</BlastOutput_query-len>
+  <BlastOutput_param><Parameters>
+    <Parameters_expect>0.0001</Parameters_expect>
+    <Parameters_sc-match>1</Parameters_sc-match>
+    <Parameters_sc-mismatch>-2</Parameters_sc-mismatch>
+    <Parameters_gap-open>0</Parameters_gap-open>
+    <Parameters_gap-extend>0</Parameters_gap-extend>
+    <Parameters_filter>F</Parameters_filter>
+  </Parameters></BlastOutput_param>
+  <BlastOutput_iterations>
+"""
+
+BLAST_XML_ITERATION = """<Iteration>
+  <Iteration_iter-num>%i</Iteration_iter-num>
+  <Iteration_query-ID>Query_%i</Iteration_query-ID>
+  <Iteration_query-def>%s</Iteration_query-def>
+  <Iteration_query-len>%i</Iteration_query-len>
+  <Iteration_hits>
+"""
+
+BLAST_XML_HIT = """<Hit>
+  <Hit_num>%i</Hit_num>
+  <Hit_id>gnl|BL_ORD_ID|%i</Hit_id>
+  <Hit_def>%s</Hit_def>
+  <Hit_accession>%i</Hit_accession>
+  <Hit_len>1000</Hit_len>
+  <Hit_hsps>
+"""
+
+BLAST_XML_HSP = """<Hsp>
+  <Hsp_num>%i</Hsp_num>
+  <Hsp_bit-score>100</Hsp_bit-score>
+  <Hsp_score>100</Hsp_score>
+  <Hsp_evalue>%g</Hsp_evalue>
+  <Hsp_query-from>1</Hsp_query-from>
+  <Hsp_query-to>%i</Hsp_query-to>
+  <Hsp_hit-from>1</Hsp_hit-from>
+  <Hsp_hit-to>%i</Hsp_hit-to>
+  <Hsp_identity>%i</Hsp_identity>
+  <Hsp_positive>%i</Hsp_positive>
+  <Hsp_gaps>%i</Hsp_gaps>
+  <Hsp_align-len>%i</Hsp_align-len>
+  <Hsp_qseq>A</Hsp_qseq>
+  <Hsp_hseq>A</Hsp_hseq>
+  <Hsp_midline>|</Hsp_midline>
+</Hsp>
+"""
+
+
+def write_blast_xml(path, queries):
+    """
+    Write a minimal BLAST XML file
+
+    queries is a list of (query def, query length, hits) where hits is a
+    list of (hit def, hsps) & hsps a list of (identities, align length,
+    gaps, evalue)
+    """
+    with open(path, 'w') as fout:
+        fout.write(BLAST_XML_HEAD)
+        for num, (qdef, qlen, hits) in enumerate(queries):
+            fout.write(BLAST_XML_ITERATION % (num+1, num+1, qdef, qlen))
+            for hnum, (hdef, hsps) in enumerate(hits):
+                fout.write(BLAST_XML_HIT % (hnum+1, hnum, hdef, hnum))
+                for snum, (ident, alen, gaps, evalue) in enumerate(hsps):
+                    fout.write(BLAST_XML_HSP % (snum+1, evalue, alen, alen,
+                                                ident, ident, gaps, alen))
+                fout.write("</Hit_hsps></Hit>\n")
+            fout.write("</Iteration_hits></Iteration>\n")
+        fout.write("</BlastOutput_iterations>\n</BlastOutput>\n")
+
+
+def write_blast_tsv(path, queries):
+    """
+    Write a tabular (outfmt 7, blast.TABULAR_FIELDS) BLAST file
+
+    Takes the same queries structure as write_blast_xml()
+    """
+    with open(path, 'w') as fout:
+        fout.write("# BLASTN 2.2.28+\n")
+        for qdef, qlen, hits in queries:
+            fout.write("# Query: %s\n# Database: DBs/test\n" % (qdef))
+            fout.write("# Fields: query id, subject id, ...\n")
+            fout.write("# %i hits found\n" % (len(hits)))
+            for hnum, (hdef, hsps) in enumerate(hits):
+                for ident, alen, gaps, evalue in hsps:
+                    fout.write("\t".join([qdef.split()[0], hdef.split()[0],
+                                          str(alen), str(ident), str(qlen),
+                                          str(gaps), "%g" % evalue, hdef]))
+                    fout.write("\n")
+        fout.write("# BLAST processed %i queries\n" % (len(queries)))
+
+
 def test_make_BLAST_database(tmpdir):
     """
     Test the make_BLAST_database() function
@@ -28,6 +128,132 @@ def test_make_BLAST_database(tmpdir):
     assert "Antibiotic_markers.fa" in tidied
 
 
+FAKE_MAKEBLASTDB = """#!%s
+import sys
+args = sys.argv[1:]
+if '-version' in args:
+    print 'makeblastdb: 2.2.28+'
+    sys.exit(0)
+opts = dict(zip(args[::2], args[1::2]))
+if opts['-in'] == '-':
+    fin = sys.stdin
+else:
+    fin = open(opts['-in'])
+with open(opts['-out'] + '.nsq', 'w') as fout:
+    fout.write(opts.get('-title', '') + '\\n' + fin.read())
+if 'FAIL' in opts['-out']:
+    sys.exit(2)
+"""
+
+
+def test_make_BLAST_database_compressed(tmpdir, monkeypatch):
+    """
+    Test the make_BLAST_database() function streams compressed genomes
+
+    Function signature::
+
+        make_BLAST_database(fasta_file, db_cache=None, out_dir=None)
+    """
+    import gzip
+    import sys
+    bin_dir = tmpdir.mkdir("bin")
+    fake = bin_dir.join("makeblastdb")
+    fake.write(FAKE_MAKEBLASTDB % (sys.executable))
+    fake.chmod(0755)
+    monkeypatch.setenv("PATH", str(bin_dir) + os.pathsep +
+                       os.environ["PATH"])
+    text = ">contig1\nACGTACGT\n>contig2\nTTTT\n"
+    genome = str(tmpdir.join("S1_asm.fa.gz"))
+    with gzip.open(genome, 'wb') as fout:
+        fout.write(text)
+    out_dir = tmpdir.mkdir("out")
+    out_dir.mkdir("DBs")
+    assert blast.make_BLAST_database(genome, out_dir=str(out_dir)) == "S1"
+    assert out_dir.join("DBs", "S1_asm.fa.nsq").read() == \
+        "S1_asm.fa\n" + text
+    # The compressed genome is linked (never decompressed) into DBs/
+    assert sorted(os.listdir(str(out_dir.join("DBs")))) == \
+        ["S1_asm.fa.gz", "S1_asm.fa.nsq"]
+
+
+def test_make_combined_BLAST_database(tmpdir, monkeypatch):
+    """
+    Test the make_combined_BLAST_database() function (empty genomes)
+
+    Function signature::
+
+        make_combined_BLAST_database(fasta_files, name='combined',
+                                     db_cache=None, out_dir=None)
+    """
+    import sys
+    bin_dir = tmpdir.mkdir("bin")
+    fake = bin_dir.join("makeblastdb")
+    fake.write(FAKE_MAKEBLASTDB % (sys.executable))
+    fake.chmod(0755)
+    monkeypatch.setenv("PATH", str(bin_dir) + os.pathsep +
+                       os.environ["PATH"])
+    genomes = []
+    for name, text in [("S1_asm.fa", ">c1\nACGT\nAC\n>c2\n>c3\nTT\n"),
+                       ("S2_asm.fa", ">c1\n"), ("S3_asm.fa", "")]:
+        tmpdir.join(name).write(text)
+        genomes.append(str(tmpdir.join(name)))
+    out_dir = tmpdir.mkdir("out")
+    out_dir.mkdir("DBs")
+    database, strain_ids, lengths, contigs = \
+        blast.make_combined_BLAST_database(genomes, out_dir=str(out_dir))
+    assert strain_ids == ['S1', 'S2', 'S3']
+    assert lengths == {'S1': 8, 'S2': 0, 'S3': 0}
+    assert contigs == 2
+    assert open(database).read() == ">S1_c1\nACGT\nAC\n>S1_c3\nTT\n"
+    assert os.path.isfile(database + ".nsq")
+    # No database without any sequence
+    database, _, _, contigs = blast.make_combined_BLAST_database(
+        genomes[1:], 'empty', out_dir=str(out_dir))
+    assert contigs == 0
+    assert not os.path.isfile(database + ".nsq")
+
+
+def test_build_BLAST_database_failed(tmpdir, monkeypatch):
+    """
+    Test the build_BLAST_database() function never caches a failed build
+
+    Function signature::
+
+        build_BLAST_database(fasta_file, db_prefix, db_cache=None)
+    """
+    import subprocess
+    import sys
+    bin_dir = tmpdir.mkdir("bin")
+    fake = bin_dir.join("makeblastdb")
+    fake.write(FAKE_MAKEBLASTDB % (sys.executable))
+    fake.chmod(0755)
+    monkeypatch.setenv("PATH", str(bin_dir) + os.pathsep +
+                       os.environ["PATH"])
+    genome = tmpdir.join("S1_asm.fa")
+    genome.write(">contig1\nACGTACGT\n")
+    cache_dir = tmpdir.join("cache")
+    cache = dbcache.DatabaseCache(str(cache_dir))
+    db_prefix = str(tmpdir.mkdir("DBs").join("FAIL_asm.fa"))
+    with pytest.raises(subprocess.CalledProcessError):
+        blast.build_BLAST_database(str(genome), db_prefix, cache)
+    assert os.listdir(str(cache_dir)) == []
+    assert not os.path.exists(db_prefix + ".nsq")
+
+
+def test_run_command_line():
+    """
+    Test the run_command_line function
+
+    Function signature::
+
+        run_command_line(command, stdin=None)
+    """
+    from Bio.Application import ApplicationError
+    assert blast.run_command_line("cat", "ACGT\n") == ("ACGT\n", "")
+    with pytest.raises(ApplicationError):
+        blast.run_command_line("exit 3")
+
+
 def test_run_BLAST():
     """
     Test the run_BLAST() function
@@ -39,12 +265,67 @@ def test_run_BLAST():
     pass
 
 
-def test_parse_BLAST():
+def test_parse_BLAST(tmpdir):
     """
-    Test the parse_BLAST() function
+    Test the parse_BLAST() function (XML & tabular)
 
     Function signature::
 
-        parse_BLAST(blast_results, tol, careful)
+        parse_BLAST(blast_results, tol, cov, careful)
     """
-    pass
+    queries = [("1, geneA, ann, org [c1]", 100,
+                [("contig1 len=5000", [(96, 100, 1, 1e-40),
+                                       (50, 60, 0, 1e-10)])]),
+               ("2, geneB, ann, org [c1]", 100,
+                [("contig2 len=5000", [(90, 100, 2, 1e-30)])]),
+               ("3, geneC, ann, org [c2]", 200,
+                [("contig1 len=5000", [(150, 150, 0, 1e-30)])]),
+               ("4, geneD, ann, org [c2]", 80, [])]
+    xml = str(tmpdir.join("blast.xml"))
+    tsv = str(tmpdir.join("blast.tsv"))
+    write_blast_xml(xml, queries)
+    write_blast_tsv(tsv, queries)
+    assert blast.parse_BLAST(xml, 0.95, 1.0, 0) == ['geneA']
+    assert blast.parse_BLAST(tsv, 0.95, 1.0, 0) == ['geneA']
+    assert blast.parse_BLAST(xml, 0.95, 0.5, 0) == ['geneA', 'geneC']
+    assert blast.parse_BLAST(tsv, 0.95, 0.5, 0) == ['geneA', 'geneC']
+    # --careful --review collects the borderline hits rather than asking
+    for results in [xml, tsv]:
+        review = []
+        assert blast.parse_BLAST(results, 0.95, 1.0, 0.2, review) == \
+            ['geneA']
+        assert review == [('geneB', 0.9, 100, 100, 90, 2)]
+    with pytest.raises(SystemExit):
+        blast.parse_BLAST(str(tmpdir.join("missing.xml")), 0.95, 1.0, 0)
+
+
+def test_parse_combined_BLAST(tmpdir):
+    """
+    Test the parse_combined_BLAST() function
+
+    Function signature::
+
+        parse_combined_BLAST(blast_results, tol, cov, careful,
+                             strain_lengths=None, dbsize=None, evalue=None)
+    """
+    xml = str(tmpdir.join("combined_blast.xml"))
+    tsv = str(tmpdir.join("combined_blast.tsv"))
+    queries = [
+        ("1, geneA, ann, org [c1]", 100,
+         [("s1_contig1", [(100, 100, 0, 1e-50)]),
+          ("s2_contig1", [(80, 100, 0, 1e-40)]),
+          ("s2_contig2", [(100, 100, 0, 1e-30)]),
+          ("s3_contig1", [(100, 100, 0, 1e-5)])]),
+        ("2, geneB, ann, org [c1]", 50,
+         [("s2_contig1", [(50, 50, 0, 1e-20)])])]
+    write_blast_xml(xml, queries)
+    write_blast_tsv(tsv, queries)
+    for results in [xml, tsv]:
+        hits = blast.parse_combined_BLAST(results, 0.95, 1.0, 0)
+        # Only the top target of each strain counts
+        assert hits == {'s1': ['geneA'], 's2': ['geneB'], 's3': ['geneA']}
+        # s3 is 100x larger than the search space so its hit is rescaled away
+        lengths = {'s1': 1000, 's2': 1000, 's3': 100000}
+        hits = blast.parse_combined_BLAST(results, 0.95, 1.0, 0, lengths,
+                                          1000, 0.0001)
+        assert hits == {'s1': ['geneA'], 's2': ['geneB']}
@@ -0,0 +1,69 @@
+from context import cluster
+from context import hitmatrix
+import numpy as np
+from scipy.cluster.hierarchy import linkage, dendrogram
+from scipy.spatial.distance import pdist
+
+
+def test_collapse_rows():
+    """
+    Test the collapse_rows function
+
+    Function signature::
+
+        collapse_rows(matrix)
+    """
+    matrix = np.array([[0.5, 0.0], [0.0, 0.0], [0.5, 0.0], [0.5, 0.0]])
+    unique, groups = cluster.collapse_rows(matrix)
+    assert (unique == np.array([[0.5, 0.0], [0.0, 0.0]])).all()
+    assert groups == [[0, 2, 3], [1]]
+
+
+def test_packed_hamming():
+    """
+    Test the Hamming distances on packed rows match scipy
+
+    Function signature::
+
+        distances(matrix, metric='euclidean')
+    """
+    rng = np.random.RandomState(42)
+    states = np.array([1.0, 0.35, -0.35, -1.0])
+    matrix = states[rng.randint(0, 4, size=(25, 37))]
+    expected = pdist(matrix, 'hamming')
+    assert np.allclose(cluster.distances(matrix, 'hamming'), expected)
+    assert np.allclose(cluster.distances(matrix), pdist(matrix))
+
+
+def test_leaf_order():
+    """
+    Test the leaf order matches the dendrogram leaves
+
+    Function signature::
+
+        leaf_order(Z)
+    """
+    rng = np.random.RandomState(7)
+    matrix = (rng.rand(40, 12) < 0.5) * -0.15 + 0.5
+    Z = linkage(pdist(matrix))
+    assert cluster.leaf_order(Z) == dendrogram(Z, no_plot=True)['leaves']
+
+
+def test_hitmatrix_distances():
+    """
+    Test the distances between packed hit rows match scipy
+
+    Function signature::
+
+        blocked_euclidean(get_rows, nrows, block_size=BLOCK_SIZE)
+    """
+    rng = np.random.RandomState(3)
+    ass = np.packbits(rng.rand(23, 19) < 0.4, axis=1)
+    cons = np.packbits(rng.rand(23, 19) < 0.6, axis=1)
+    matrix = hitmatrix.HitMatrix(19, ass, cons)
+    scores = matrix.scores()
+    assert np.allclose(cluster.blocked_euclidean(matrix.scores, 23, 5),
+                       pdist(scores))
+    assert (cluster.distances(matrix) == pdist(scores)).all()
+    assert np.allclose(cluster.distances(matrix, 'hamming'),
+                       pdist(scores, 'hamming'))
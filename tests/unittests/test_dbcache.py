@@ -0,0 +1,77 @@
+from context import dbcache
+import os
+import time
+
+
+def _fake_db(prefix, content):
+    for ext in dbcache.DB_EXTS:
+        with open(prefix+ext, 'w') as fout:
+            fout.write(content)
+
+
+def test_fetch_store(tmpdir):
+    """
+    Test the DatabaseCache fetch() & store() methods
+
+    Function signatures::
+
+        fetch(key, db_prefix)
+        store(key, db_prefix)
+    """
+    cache = dbcache.DatabaseCache(str(tmpdir.join("cache")))
+    fasta = str(tmpdir.join("s1_genome.fa"))
+    with open(fasta, 'w') as fout:
+        fout.write(">contig1\nACGT\n")
+    key = cache.key(fasta, "makeblastdb: 2.2.28+")
+    assert key != cache.key(fasta, "makeblastdb: 2.2.29+")
+    built = str(tmpdir.join("s1_genome.fa"))
+    linked = str(tmpdir.mkdir("DBs").join("s1_genome.fa"))
+    assert not cache.fetch(key, linked)
+    _fake_db(built, "db")
+    cache.store(key, built)
+    assert cache.fetch(key, linked)
+    for ext in dbcache.DB_EXTS:
+        assert open(linked+ext).read() == "db"
+    # Same contents, same key
+    with open(fasta, 'w') as fout:
+        fout.write(">contig1\nACGT\n")
+    assert cache.key(fasta, "makeblastdb: 2.2.28+") == key
+
+
+def test_evict(tmpdir):
+    """
+    Test the DatabaseCache evict() method (least recently used first)
+
+    Function signature::
+
+        evict()
+    """
+    cache = dbcache.DatabaseCache(str(tmpdir.join("cache")), max_size=60)
+    prefix = str(tmpdir.join("db.fa"))
+    _fake_db(prefix, "0123456789")
+    past = time.time() - 100
+    for idx, key in enumerate(['a', 'b']):
+        cache.store(key, prefix)
+        entry = os.path.join(cache.cache_dir, key)
+        os.utime(entry, (past+idx, past+idx))
+    # Use 'a' so 'b' is now the least recently used
+    assert cache.fetch('a', str(tmpdir.join("linked.fa")))
+    cache.store('c', prefix)
+    remaining = sorted(os.listdir(cache.cache_dir))
+    assert remaining == ['a', 'c']
+
+
+def test_store_missing(tmpdir):
+    """
+    Test the DatabaseCache store() method cleans up after a missing database
+
+    Function signature::
+
+        store(key, db_prefix)
+    """
+    cache = dbcache.DatabaseCache(str(tmpdir.join("cache")))
+    prefix = str(tmpdir.join("db.fa"))
+    with open(prefix + dbcache.DB_EXTS[0], 'w') as fout:
+        fout.write("partial")
+    cache.store('a', prefix)
+    assert os.listdir(cache.cache_dir) == []
@@ -0,0 +1,85 @@
+from context import hitmatrix
+from context import pytest
+import numpy as np
+
+
+ALL_VFS = ['vf%02i' % i for i in range(11)]
+ASS_HITS = [['vf00', 'vf03', 'vf10'], [], ['vf03', 'vf07', 'missing'],
+            ALL_VFS]
+CONS_HITS = [['vf03'], ['vf01', 'vf10'], [], ['vf00']]
+# ASS_HITS & CONS_HITS as bits (one column per vf)
+ASS_BITS = np.array([[1, 0, 0, 1, 0, 0, 0, 0, 0, 0, 1],
+                     [0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0],
+                     [0, 0, 0, 1, 0, 0, 0, 1, 0, 0, 0],
+                     [1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1]], dtype=bool)
+CONS_BITS = np.array([[0, 0, 0, 1, 0, 0, 0, 0, 0, 0, 0],
+                      [0, 1, 0, 0, 0, 0, 0, 0, 0, 0, 1],
+                      [0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0],
+                      [1, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0]], dtype=bool)
+
+
+def test_pack_hits():
+    """
+    Test the pack_hits function
+
+    Function signature::
+
+        pack_hits(all_vfs, hits)
+    """
+    packed = hitmatrix.pack_hits(ALL_VFS, ASS_HITS)
+    assert packed.dtype == np.uint8
+    assert packed.tolist() == [[0x90, 0x20], [0x00, 0x00], [0x11, 0x00],
+                               [0xff, 0xe0]]
+    assert (hitmatrix.unpack(packed, len(ALL_VFS)) == ASS_BITS).all()
+    assert hitmatrix.pack_hits(ALL_VFS, []).shape == (0, 2)
+
+
+def test_scores():
+    """
+    Test the float scale of a HitMatrix
+
+    Function signature::
+
+        scores(self, start=0, stop=None, dtype=np.float64)
+    """
+    ass = hitmatrix.pack_hits(ALL_VFS, ASS_HITS)
+    cons = hitmatrix.pack_hits(ALL_VFS, CONS_HITS)
+    single = hitmatrix.HitMatrix(len(ALL_VFS), ass)
+    # A hit is -0.15, no hit 0.5
+    expected = np.where(ASS_BITS, -0.15, 0.5)
+    assert (single.scores() == expected).all()
+    both = hitmatrix.HitMatrix(len(ALL_VFS), ass, cons)
+    # Assembly & consensus hit -1.0, assembly only 0.35, consensus only
+    # -0.35, neither 1.0
+    expected = np.array([[0.35, 1.0, 1.0, -1.0, 1.0, 1.0, 1.0, 1.0, 1.0, 1.0,
+                          0.35],
+                         [1.0, -0.35, 1.0, 1.0, 1.0, 1.0, 1.0, 1.0, 1.0, 1.0,
+                          -0.35],
+                         [1.0, 1.0, 1.0, 0.35, 1.0, 1.0, 1.0, 0.35, 1.0, 1.0,
+                          1.0],
+                         [-1.0, 0.35, 0.35, 0.35, 0.35, 0.35, 0.35, 0.35,
+                          0.35, 0.35, 0.35]])
+    assert np.allclose(both.scores(), expected)
+    assert np.allclose(both.scores(1, 3), expected[1:3])
+    assert np.allclose(both.take([3, 0]).scores(), expected[[3, 0]])
+    assert np.allclose(both.transpose().scores(), expected.T)
+    with pytest.raises(ValueError):
+        hitmatrix.HitMatrix(len(ALL_VFS), ass, cons[:2])
+
+
+def test_save_csv(tmpdir):
+    """
+    Test the blocked CSV matches numpy.savetxt
+
+    Function signature::
+
+        save_csv(self, fname, block_size=BLOCK_SIZE)
+    """
+    ass = hitmatrix.pack_hits(ALL_VFS, ASS_HITS)
+    cons = hitmatrix.pack_hits(ALL_VFS, CONS_HITS)
+    matrix = hitmatrix.HitMatrix(len(ALL_VFS), ass, cons)
+    expected = str(tmpdir.join('expected.csv'))
+    np.savetxt(expected, matrix.scores(), delimiter=",")
+    blocked = str(tmpdir.join('blocked.csv'))
+    matrix.save_csv(blocked, block_size=3)
+    assert open(blocked).read() == open(expected).read()
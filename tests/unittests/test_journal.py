@@ -0,0 +1,63 @@
+from context import journal
+import argparse
+import pickle
+
+
+def test_journal(tmpdir):
+    """
+    Test the Journal records, reloads & trims a line cut short
+
+    Function signature::
+
+        Journal(path, key, load=True)
+    """
+    genome = tmpdir.join("s1_genome.fa")
+    genome.write(">contig\nACGT\n")
+    path = str(tmpdir.join(journal.JOURNAL_NAME))
+    jrnl = journal.Journal(path, 'run1')
+    assert jrnl.lookup(str(genome), False) is None
+    jrnl.record(str(genome), False, 's1', ['geneA', 'geneB'])
+    # Pool workers append to the same journal
+    pickle.loads(pickle.dumps(jrnl)).record(str(genome), True, 's1', [])
+    # A crash mid write
+    with open(path, 'a') as fout:
+        fout.write('{"run": "run1", "cons": fal')
+    jrnl = journal.Journal(path, 'run1')
+    assert jrnl.lookup(str(genome), False) == ('s1', ['geneA', 'geneB'])
+    assert jrnl.lookup(str(genome), True) == ('s1', [])
+    assert open(path).read().endswith('[]}\n')
+    assert journal.Journal(path, 'run2').lookup(str(genome), False) is None
+    # Entries of a completed run are not used again
+    journal.Journal(path, 'run2', load=False).complete()
+    jrnl = journal.Journal(path, 'run1')
+    jrnl.complete()
+    assert jrnl.lookup(str(genome), False) is None
+    assert journal.Journal(path, 'run1').lookup(str(genome), False) is None
+    jrnl.record(str(genome), False, 's1', ['geneB'])
+    jrnl = journal.Journal(path, 'run1')
+    assert jrnl.lookup(str(genome), False) == ('s1', ['geneB'])
+    # A changed genome is screened again
+    genome.write(">contig\nACGTACGT\n")
+    assert journal.Journal(path, 'run1').lookup(str(genome), False) is None
+
+
+def test_run_key(tmpdir):
+    """
+    Test the run_key function changes with the queries & cut-offs
+
+    Function signature::
+
+        run_key(args, blast_version)
+    """
+    queries = tmpdir.join("queries.fa")
+    queries.write(">1, geneA, ann, org [c1]\nACGT\n")
+    args = argparse.Namespace(seqs_of_interest=str(queries), reftype=None,
+                              tblastx=False, evalue=0.005, short=False,
+                              tol=0.95, cov=1.0, careful=0)
+    key = journal.run_key(args, 'blast 2.2.28+')
+    assert journal.run_key(args, 'blast 2.2.28+') == key
+    args.tol = 0.9
+    assert journal.run_key(args, 'blast 2.2.28+') != key
+    args.tol = 0.95
+    queries.write(">1, geneA, ann, org [c1]\nACGA\n")
+    assert journal.run_key(args, 'blast 2.2.28+') != key
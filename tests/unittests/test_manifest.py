@@ -0,0 +1,59 @@
+from context import manifest
+
+
+def test_manifest(tmpdir):
+    """
+    Test the Manifest lookup(), record() & save() methods
+    """
+    path = str(tmpdir.join("manifest.json"))
+    store = manifest.Manifest(path)
+    assert store.lookup('g1', 'p1') == (set(), set())
+    store.record('g1', 'p1', ['q1', 'q2'], ['q2'])
+    store.record('g1', 'p1', ['q3'], [])
+    store.save()
+    store = manifest.Manifest(path)
+    assert store.lookup('g1', 'p1') == (set(['q1', 'q2', 'q3']),
+                                        set(['q2']))
+    # Different parameters are a different result
+    assert store.lookup('g1', 'p2') == (set(), set())
+
+
+def test_manifest_shared(tmpdir):
+    """
+    Test runs sharing a manifest (i.e. shards) keep each others results
+
+    Function signature::
+
+        save()
+    """
+    path = str(tmpdir.join("manifest.json"))
+    shard1, shard2 = manifest.Manifest(path), manifest.Manifest(path)
+    shard1.record('g1', 'p1', ['q1', 'q2'], ['q2'])
+    shard2.record('g2', 'p1', ['q1', 'q2'], ['q1'])
+    shard1.save()
+    shard2.save()
+    shard1.save()
+    store = manifest.Manifest(path)
+    assert store.lookup('g1', 'p1') == (set(['q1', 'q2']), set(['q2']))
+    assert store.lookup('g2', 'p1') == (set(['q1', 'q2']), set(['q1']))
+    assert store.results['g1:p1'] == [[store.results['g1:p1'][0][0],
+                                       ['q2']]]
+
+
+def test_write_query_subset(tmpdir):
+    """
+    Test the write_query_subset function
+
+    Function signature::
+
+        write_query_subset(query_file, query_hashes, out_dir)
+    """
+    query_file = tmpdir.join("queries.fa")
+    query_file.write(">1, geneA, ann, org [c1]\nACGT\nAC\n"
+                     ">2, geneB, ann, org [c1]\nTTTT\n")
+    hashes = manifest.query_hashes(str(query_file))
+    assert [qid for qid, _ in hashes] == ['geneA', 'geneB']
+    subset = manifest.write_query_subset(str(query_file),
+                                         set([hashes[0][1]]), str(tmpdir))
+    assert open(subset).read() == ">1, geneA, ann, org [c1]\nACGTAC\n"
+    assert manifest.query_hashes(subset) == hashes[:1]
@@ -0,0 +1,34 @@
+from context import pipeline
+import threading
+
+
+def test_run_pipeline():
+    """
+    Test the run_pipeline function overlaps stages & keeps the item order
+
+    Function signature::
+
+        run_pipeline(items, stages, depth=2)
+    """
+    second_built = threading.Event()
+
+    def build(item):
+        if item == 2:
+            second_built.set()
+        if item == 3:
+            raise Exception("makeblastdb died")
+        return item * 10
+
+    def search(item):
+        if item == 10:
+            # Only returns once the next item has been built
+            assert second_built.wait(5)
+        return item + 1
+
+    results = pipeline.run_pipeline([1, 2, 3, 4], [build, search, str],
+                                    depth=1)
+    assert results[0] == '11' and results[1] == '21' and results[3] == '41'
+    assert isinstance(results[2], pipeline.StageError)
+    assert results[2].stage == 0
+    assert 'makeblastdb died' in results[2].error
+    assert pipeline.run_pipeline([], [build]) == []
@@ -0,0 +1,188 @@
+from context import prefilter
+from context import pytest
+import argparse
+import os
+import random
+import numpy as np
+
+COMPLEMENT = {'A': 'T', 'C': 'G', 'G': 'C', 'T': 'A'}
+
+
+def revcomp(seq):
+    return ''.join([COMPLEMENT.get(base, 'N') for base in reversed(seq)])
+
+
+def random_seq(rng, length):
+    return ''.join([rng.choice('ACGT') for _ in range(length)])
+
+
+def naive_kmers(seq, k):
+    """
+    The canonical k-mers of every ACGT only window (None otherwise)
+    """
+    kmers = []
+    for start in range(len(seq) - k + 1):
+        window = seq[start:start+k].upper()
+        if set(window) - set('ACGT'):
+            kmers.append(None)
+            continue
+        values = []
+        for strand in [window, revcomp(window)]:
+            value = 0
+            for base in strand:
+                value = value * 4 + 'ACGT'.index(base)
+            values.append(value)
+        kmers.append(min(values))
+    return kmers
+
+
+def test_parse_k():
+    """
+    Test the parse_k function
+
+    Function signature::
+
+        parse_k(value)
+    """
+    assert prefilter.parse_k('15') == 15
+    for value in ['0', '17', 'a']:
+        with pytest.raises(argparse.ArgumentTypeError):
+            prefilter.parse_k(value)
+
+
+def test_kmer_codes():
+    """
+    Test the kmer_codes function against a direct count (both strands)
+
+    Function signature::
+
+        kmer_codes(codes, k)
+    """
+    rng = random.Random(7)
+    seq = random_seq(rng, 200)
+    seq = seq[:50] + 'N' + seq[51:120].lower() + seq[120:]
+    for k in [1, 5, 15, 16]:
+        canonical, worst = prefilter.kmer_codes(prefilter.encode(seq), k)
+        expected = naive_kmers(seq, k)
+        assert len(canonical) == len(expected)
+        for value, bad, want in zip(canonical, worst, expected):
+            assert (bad > 3) == (want is None)
+            if want is not None:
+                assert value == want
+    assert len(prefilter.kmer_codes(prefilter.encode('ACGT'), 5)[0]) == 0
+
+
+def test_candidates(tmpdir):
+    """
+    Test the candidates function keeps every query that could hit
+
+    Function signature::
+
+        candidates(query_file, genome_index, k, tol, cov)
+    """
+    rng = random.Random(11)
+    genome = random_seq(rng, 20000)
+    genome_file = tmpdir.join('s1_genome.fa')
+    genome_file.write('>contig1\n%s\n>contig2\n%s\n' % (genome[:10000],
+                                                       genome[10000:]))
+    source = genome[2000:3000]
+    # 50 evenly spaced mismatches is identity 0.95, the worst case for k-mers
+    mutated = list(source)
+    for pos in range(10, 1000, 20):
+        mutated[pos] = COMPLEMENT[mutated[pos]]
+    mutated = ''.join(mutated)
+    # Identity 0.9 (no hit at 0.95 but could hit at 0.9)
+    worse = list(source)
+    for pos in range(5, 1000, 10):
+        worse[pos] = COMPLEMENT[worse[pos]]
+    queries = [('geneA', mutated), ('geneB', revcomp(mutated)),
+               ('geneC', random_seq(rng, 1000)), ('geneD', ''.join(worse)),
+               ('geneE', 'N' * 30), ('geneF', genome[9990:10010])]
+    query_file = tmpdir.join('queries.fa')
+    query_file.write(''.join(['>%i, %s, ann, org [c1]\n%s\n' % (
+        idx, name, seq) for idx, (name, seq) in enumerate(queries)]))
+    index = prefilter.genome_kmers(str(genome_file), 15)
+    keep = prefilter.candidates(str(query_file), index, 15, 0.95, 1.0)
+    # geneF spans the 2 contigs so no 15-mer of it is in the genome but at
+    # 20 bases the bound keeps it
+    assert keep.tolist() == [True, True, False, False, True, True]
+    # A lower cutoff needs a smaller k (random 9-mers are common enough to
+    # keep geneC too)
+    index = prefilter.genome_kmers(str(genome_file), 9)
+    keep = prefilter.candidates(str(query_file), index, 9, 0.9, 1.0)
+    assert keep.tolist() == [True] * 6
+    # A cutoff the bound can't use keeps everything
+    assert not prefilter.usable(15, 0.9)
+    assert prefilter.usable(15, 0.95)
+
+
+def test_load_index(tmpdir):
+    """
+    Test the load_index function caches the index until the genome changes
+
+    Function signature::
+
+        load_index(fasta_file, k, out_dir, cons_run=False)
+    """
+    tmpdir.mkdir('DBs')
+    genome_file = tmpdir.join('s1_genome.fa')
+    genome_file.write('>contig1\nACGTACGTTTGCA\n')
+    index = prefilter.load_index(str(genome_file), 5, str(tmpdir))
+    path = prefilter.index_path(str(genome_file), 5, str(tmpdir))
+    assert os.path.dirname(path) == str(tmpdir.join('DBs'))
+    assert os.path.basename(path).startswith('s1_genome.fa.')
+    assert (np.load(path)['kmers'] == index).all()
+    assert (index == np.unique(naive_kmers('ACGTACGTTTGCA', 5))).all()
+    # A changed genome (even one older than the index) is indexed again
+    mtime = os.path.getmtime(str(genome_file))
+    genome_file.write('>contig1\nGGGGG\n')
+    os.utime(str(genome_file), (mtime - 10,) * 2)
+    assert prefilter.load_index(str(genome_file), 5, str(tmpdir)).tolist() \
+        == naive_kmers('GGGGG', 5)
+
+
+def test_load_index_consensus(tmpdir):
+    """
+    Test an assembly & a consensus with the same name get their own index
+
+    Function signature::
+
+        load_index(fasta_file, k, out_dir, cons_run=False)
+    """
+    tmpdir.mkdir('DBs')
+    assembly = tmpdir.mkdir('assemblies').join('s1.fa')
+    assembly.write('>contig1\n%s\n' % ('A' * 40))
+    consensus = tmpdir.mkdir('stripped').join('s1.fa')
+    gene = random_seq(random.Random(5), 300)
+    consensus.write('>contig1\n%s\n' % (gene))
+    # The consensus is older than the assembly index (see strip_bases())
+    os.utime(str(consensus), (os.path.getmtime(str(assembly)) - 100,) * 2)
+    prefilter.load_index(str(assembly), 15, str(tmpdir))
+    index = prefilter.load_index(str(consensus), 15, str(tmpdir), True)
+    assert (index == np.unique(naive_kmers(gene, 15))).all()
+    query_file = tmpdir.join('queries.fa')
+    query_file.write('>1, geneA, ann, org [c1]\n%s\n' % (gene))
+    assert prefilter.candidates(str(query_file), index, 15, 0.95,
+                                1.0).tolist() == [True]
+    # Assembly & consensus of the same strain id, same file name
+    assert prefilter.index_path(str(assembly), 15, str(tmpdir)) != \
+        prefilter.index_path(str(consensus), 15, str(tmpdir), True)
+
+
+def test_write_queries(tmpdir):
+    """
+    Test the write_queries function
+
+    Function signature::
+
+        write_queries(query_file, keep, out_file)
+    """
+    query_file = tmpdir.join('queries.fa')
+    query_file.write('>1, geneA, ann, org [c1]\nACGT\n'
+                     '>2, geneB, ann, org [c1]\nTTTT\n'
+                     '>3, geneC, ann, org [c2]\nGGGG\n')
+    out_file = tmpdir.join('kept.fa')
+    prefilter.write_queries(str(query_file), [True, False, True],
+                            str(out_file))
+    assert out_file.read() == ('>1, geneA, ann, org [c1]\nACGT\n'
+                               '>3, geneC, ann, org [c2]\nGGGG\n')
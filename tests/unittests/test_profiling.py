@@ -0,0 +1,48 @@
+from context import profiling
+from context import pytest
+import argparse
+import json
+import pickle
+
+
+def test_recorder(tmpdir):
+    """
+    Test the Recorder records, summarises & reports stages
+
+    Function signature::
+
+        stage(args, name, genome=None)
+    """
+    args = argparse.Namespace(recorder=profiling.Recorder())
+    data = tmpdir.join("data.txt")
+    with profiling.stage(args, 'write', 's1'):
+        data.write('x' * 1000)
+    with profiling.stage(args, 'read', 's1'):
+        data.read()
+    with profiling.stage(args, 'read', 's2'):
+        data.read()
+    with pytest.raises(ValueError):
+        with profiling.stage(args, 'cluster'):
+            raise ValueError("failed stage")
+    records = args.recorder.records
+    assert [(r['stage'], r['genome']) for r in records] == \
+        [('write', 's1'), ('read', 's1'), ('read', 's2'), ('cluster', None)]
+    for record in records:
+        assert record['wall'] >= 0 and record['peak_rss_kb'] > 0
+    if records[0]['write_bytes'] is not None:
+        assert records[0]['write_bytes'] >= 1000
+        assert records[1]['read_bytes'] >= 1000
+    assert profiling.timings(records).keys() == ['write', 'read', 'cluster']
+    assert profiling.summarise(records, 'genome')['s1']['count'] == 2
+    assert profiling.summarise(records, 'stage')['read']['count'] == 2
+    # Pickles (i.e. to pool workers) empty
+    assert pickle.loads(pickle.dumps(args.recorder)).records == []
+    report = str(tmpdir.join(profiling.REPORT_NAME))
+    profiling.write_report(report, records)
+    with open(report) as fin:
+        loaded = json.load(fin)
+    assert len(loaded['stages']) == 4
+    assert sorted(loaded['genomes'].keys()) == ['s1', 's2']
+    # No recorder, no records
+    with profiling.stage(argparse.Namespace(), 'read'):
+        pass
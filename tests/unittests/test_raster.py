@@ -0,0 +1,43 @@
+from context import raster
+import numpy as np
+
+
+def test_downsample():
+    """
+    Test the block downsampling matches the mean of each pixel's cells
+
+    Function signature::
+
+        downsample(blocks, nrows, ncols, out_rows, out_cols)
+    """
+    rng = np.random.RandomState(5)
+    matrix = rng.rand(23, 17)
+    blocks = [matrix[start:start+4] for start in range(0, 23, 4)]
+    means, vmin, vmax = raster.downsample(iter(blocks), 23, 17, 7, 5)
+    rows = raster.bin_starts(23, 7).tolist() + [23]
+    cols = raster.bin_starts(17, 5).tolist() + [17]
+    for i in range(7):
+        for j in range(5):
+            expected = matrix[rows[i]:rows[i+1], cols[j]:cols[j+1]].mean()
+            assert np.allclose(means[i, j], expected)
+    assert (vmin, vmax) == (matrix.min(), matrix.max())
+    # No downsampling is the identity
+    means = raster.downsample(iter(blocks), 23, 17, 23, 17)[0]
+    assert np.allclose(means, matrix)
+
+
+def test_to_rgb():
+    """
+    Test the gray scale & class shading of the raster
+
+    Function signature::
+
+        to_rgb(means, vmin, vmax, shade_color, shade_alpha)
+    """
+    means = np.array([[-1.0, 1.0, 0.0]])
+    color, alpha = raster.column_shading([(1.0, 0.0, 0.0), None, None], 3, 3)
+    image = raster.to_rgb(means, -1.0, 1.0, color, alpha)
+    assert image.dtype == np.uint8
+    assert image[0, 0].tolist() == [26, 0, 0]
+    assert image[0, 1].tolist() == [255, 255, 255]
+    assert image[0, 2].tolist() == [128, 128, 128]
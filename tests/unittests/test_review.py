@@ -0,0 +1,81 @@
+from context import review
+from context import hitmatrix
+from context import pytest
+
+
+def test_record(tmpdir):
+    """
+    Test the record function writes the header once
+
+    Function signature::
+
+        record(path, strain_id, cons_run, entries)
+    """
+    path = str(tmpdir.join(review.REVIEW_NAME))
+    review.record(path, 's1', False, [])
+    assert not tmpdir.join(review.REVIEW_NAME).check()
+    review.record(path, 's1', False, [('geneA', 0.9, 100, 100, 90, 0)])
+    review.record(path, 's2', True, [('geneB', 0.8, 50, 50, 40, 1)])
+    lines = open(path).read().splitlines()
+    assert lines == ['\t'.join(review.FIELDS),
+                     's1\tassembly\tgeneA\t0.900000\t100\t100\t90\t0',
+                     's2\tconsensus\tgeneB\t0.800000\t50\t50\t40\t1']
+    # An empty file (i.e. created by a concurrent writer) gets the header
+    open(path, 'w').close()
+    review.record(path, 's1', False, [('geneA', 0.9, 100, 100, 90, 0)])
+    assert open(path).read().splitlines() == lines[:2]
+
+
+def test_read_decisions(tmpdir):
+    """
+    Test the read_decisions function
+
+    Function signature::
+
+        read_decisions(path)
+    """
+    header = '\t'.join(review.FIELDS + ['decision'])
+    decisions = tmpdir.join('decisions.tsv')
+    decisions.write('\n'.join([
+        header,
+        's1\tassembly\tgeneA\t0.9\t100\t100\t90\t0\ty',
+        's1\tassembly\tgeneB\t0.9\t100\t100\t90\t0\tn',
+        # A repeated header (i.e. files joined) & an undecided hit
+        '\t'.join(review.FIELDS),
+        's2\tconsensus\tgeneB\t0.8\t50\t50\t40\t1',
+        's3\tassembly\tgeneA\t0.9\t100\t100\t90\t0\tY', '']))
+    assert review.read_decisions(str(decisions)) == \
+        set([('s1', 'assembly', 'geneA'), ('s3', 'assembly', 'geneA')])
+    decisions.write('\t'.join(review.FIELDS) + '\n')
+    with pytest.raises(ValueError):
+        review.read_decisions(str(decisions))
+    decisions.write(header + '\ns1\tassembly\tgeneA\t0.9\t100\t100\t90\t0\t?')
+    with pytest.raises(ValueError):
+        review.read_decisions(str(decisions))
+
+
+def test_apply_decisions():
+    """
+    Test the apply_decisions function only sets the accepted cells
+
+    Function signature::
+
+        apply_decisions(matrix, strain_labels, query_list, accepted)
+    """
+    queries = ['gene%i' % (idx) for idx in range(10)]
+    labels = ['s1', 's2']
+    matrix = hitmatrix.HitMatrix(10, hitmatrix.pack_hits(
+        queries, [['gene0'], ['gene9']]))
+    accepted = set([('s1', 'assembly', 'gene9'),
+                    ('s2', 'assembly', 'gene9'),
+                    ('s1', 'consensus', 'gene1'),
+                    ('s3', 'assembly', 'gene1')])
+    updated, changed = review.apply_decisions(matrix, labels, queries,
+                                              accepted)
+    assert changed == 1
+    assert (updated.assembly == hitmatrix.pack_hits(
+        queries, [['gene0', 'gene9'], ['gene9']])).all()
+    assert updated.consensus is None
+    # The original matrix is unchanged
+    assert (matrix.assembly == hitmatrix.pack_hits(
+        queries, [['gene0'], ['gene9']])).all()
@@ -1,6 +1,15 @@
 from context import seqfindr
+from context import review
+from context import journal
+from context import blast
 from context import pytest
 import numpy as np
+import argparse
+import os
+import random
+import sys
+import subprocess
+import threading
 
 
 def test_strip_uninteresting():
@@ -40,6 +49,20 @@ def test_strip_uninteresting():
     assert nm.all() == np.array([(-1.0, -3), (-0.5, -6)]).all()
 
 
+def test_strip_uninteresting_values():
+    """
+    Test strip_uninteresting keeps exactly the informative columns
+    """
+    matrix = np.array([(0.5, -0.15, 0.5, 0.5), (0.5, 0.5, 0.5, -0.15)])
+    nm, newqc, newql = seqfindr.strip_uninteresting(matrix,
+                                                    ['a', 'a', 'b', 'b'],
+                                                    ['a1', 'a2', 'b1', 'b2'],
+                                                    None, False)
+    assert (nm == np.array([(-0.15, 0.5), (0.5, -0.15)])).all()
+    assert newqc == ['a', 'b']
+    assert newql == ['a2', 'b2']
+
+
 def test_check_singularity():
     """
     Test the check_singularity function
@@ -51,3 +74,628 @@ def test_check_singularity():
     matrix = np.array([(0.5, 0.5, 0.5), (0.5, 0.5, 0.5)])
     with pytest.raises(ValueError):
         seqfindr.check_singularity(matrix, None, False)
+
+
+def test_screen_genomes_parallel(monkeypatch):
+    """
+    Test the screen_genomes_parallel function
+
+    Function signature::
+
+        screen_genomes_parallel(in_files, args, cons_run)
+    """
+    def fake_screen(subject, args, cons_run):
+        if subject == 'bad_genome.fa':
+            raise Exception("makeblastdb died")
+        return subject.split('_')[0], [subject]
+
+    monkeypatch.setattr(seqfindr, 'screen_genome', fake_screen)
+    in_files = ['s1_genome.fa', 's2_genome.fa', 'bad_genome.fa',
+                's4_genome.fa']
+    args = argparse.Namespace(jobs=3)
+    results = seqfindr.screen_genomes_parallel(in_files, args, False)
+    assert results == [('s1', ['s1_genome.fa']), ('s2', ['s2_genome.fa']),
+                       None, ('s4', ['s4_genome.fa'])]
+
+
+def test_screen_genomes_pipelined(monkeypatch):
+    """
+    Test the screen_genomes_pipelined function skips failed genomes
+
+    Function signature::
+
+        screen_genomes_pipelined(in_files, args, cons_run)
+    """
+    def fake_build(subject, args, cons_run):
+        if subject == 'bad_genome.fa':
+            raise Exception("makeblastdb died")
+        return subject, subject.split('_')[0], 'DBs/' + subject
+
+    monkeypatch.setattr(seqfindr, 'build_genome_database', fake_build)
+    monkeypatch.setattr(seqfindr, 'search_genome',
+                        lambda built, args, cons_run: built)
+    monkeypatch.setattr(seqfindr, 'parse_genome',
+                        lambda searched, args, cons_run:
+                        (searched[1], [searched[2]]))
+    in_files = ['s1_genome.fa', 'bad_genome.fa', 's3_genome.fa']
+    args = argparse.Namespace(pipeline_depth=1)
+    results = seqfindr.screen_genomes_pipelined(in_files, args, False)
+    assert results == [('s1', ['DBs/s1_genome.fa']), None,
+                       ('s3', ['DBs/s3_genome.fa'])]
+
+
+def test_search_genome_prefilter(tmpdir, monkeypatch):
+    """
+    Test the search_genome function only searches the queries that can hit
+
+    Function signature::
+
+        search_genome(built, args, cons_run)
+    """
+    rng = random.Random(3)
+    genome = ''.join([rng.choice('ACGT') for _ in range(1000)])
+    genome_file = tmpdir.join("s1_genome.fa")
+    genome_file.write(">contig\n%s\n" % (genome))
+    query_file = tmpdir.join("queries.fa")
+    query_file.write(">1, geneA, ann, org [c1]\n%s\n"
+                     ">2, geneB, ann, org [c1]\n%s\n" % (
+                         genome[100:400], "T" * 300))
+    searched = []
+
+    def fake_run_BLAST(query, database, args, cons_run, out_dir=None):
+        searched.append(open(query).read())
+        return blast.results_file(query, database, args, cons_run, out_dir)
+
+    monkeypatch.setattr(blast, 'run_BLAST', fake_run_BLAST)
+    args = seqfindr.build_parser().parse_args([str(query_file),
+                                               str(tmpdir), '--prefilter'])
+    args.output = str(tmpdir.join("out"))
+    args.protein = False
+    for out in ["DBs", "BLAST_results"]:
+        tmpdir.join("out").join(out).ensure(dir=True)
+    database = str(tmpdir.join("out", "DBs", "s1_genome.fa"))
+    built = (str(genome_file), 's1', database)
+    _, _, results = seqfindr.search_genome(built, args, False)
+    assert searched == [">1, geneA, ann, org [c1]\n%s\n" %
+                        (genome[100:400])]
+    # The results keep the name of a search of every query
+    assert results == blast.results_file(str(query_file), database, args,
+                                         False, args.output)
+    # No query can hit so BLAST is not run
+    query_file.write(">2, geneB, ann, org [c1]\n%s\n" % ("T" * 300))
+    for outfmt in ['xml', 'tabular']:
+        args.outfmt = outfmt
+        _, _, results = seqfindr.search_genome(built, args, False)
+        assert len(searched) == 1
+        assert blast.parse_BLAST(results, 0.95, 1.0, 0) == []
+
+
+def test_screen_genomes_combined(tmpdir, monkeypatch):
+    """
+    Test the screen_genomes_combined function fails genomes without sequence
+
+    Function signature::
+
+        screen_genomes_combined(in_files, args, cons_run)
+    """
+    query_file = tmpdir.join("queries.fa")
+    query_file.write(">1, geneA, ann, org [c1]\nACGT\n")
+    lengths = {'s1': 100, 's2': 0, 's3': 50}
+    searched = []
+
+    def fake_parse(blast_xml, tol, cov, careful, strain_lengths, dbsize,
+                   evalue, entries=None):
+        searched.append(dbsize)
+        return {'s1': ['geneA']}
+
+    monkeypatch.setattr(seqfindr.blast, 'make_combined_BLAST_database',
+                        lambda in_files, name, db_cache, out_dir:
+                        ('db', [os.path.basename(f).split('_')[0]
+                                for f in in_files], lengths, 2))
+    monkeypatch.setattr(seqfindr.blast, 'run_BLAST',
+                        lambda *args, **kwargs: 'combined.xml')
+    monkeypatch.setattr(seqfindr.blast, 'parse_combined_BLAST', fake_parse)
+    args = seqfindr.build_parser().parse_args([str(query_file),
+                                               str(tmpdir)])
+    args.output = str(tmpdir)
+    args.combined_db = True
+    genomes = ['s1_genome.fa', 's2_genome.fa', 's3_genome.fa']
+    assert seqfindr.screen_genomes_combined(genomes, args, False) == \
+        [('s1', ['geneA']), None, ('s3', [])]
+    assert searched == [50]
+    # Nothing is searched without any sequence
+    assert seqfindr.screen_genomes_combined(genomes[1:2], args, False) == \
+        [None]
+    assert searched == [50]
+
+
+def test_screen_genomes_resume(tmpdir, monkeypatch):
+    """
+    Test the screen_genomes function resumes an interrupted run
+
+    Function signature::
+
+        screen_genomes(in_files, args, cons_run)
+    """
+    query_file = tmpdir.join("queries.fa")
+    query_file.write(">1, geneA, ann, org [c1]\nACGT\n")
+    genomes = []
+    for name in ['s1_genome.fa', 's2_genome.fa', 's3_genome.fa']:
+        genome = tmpdir.join(name)
+        genome.write(">contig\n%s\n" % (name))
+        genomes.append(str(genome))
+    parsed = []
+
+    def fake_parse(blast_xml, tol, cov, careful, review=None):
+        if blast_xml.startswith('s3') and not parsed.count(blast_xml):
+            parsed.append(blast_xml)
+            raise RuntimeError("Preempted")
+        parsed.append(blast_xml)
+        return ['geneA']
+
+    monkeypatch.setattr(seqfindr, 'build_genome_database',
+                        lambda subject, args, cons_run:
+                        (subject, os.path.basename(subject).split('_')[0],
+                         'db'))
+    monkeypatch.setattr(seqfindr, 'search_genome',
+                        lambda built, args, cons_run:
+                        (built[0], built[1], built[1] + '.xml'))
+    monkeypatch.setattr(seqfindr.blast, 'parse_BLAST', fake_parse)
+    monkeypatch.setattr(seqfindr.blast, 'blast_version', lambda: 'test')
+    args = seqfindr.build_parser().parse_args([str(query_file),
+                                               str(tmpdir)])
+    args.output = str(tmpdir)
+    args.pipeline_depth = 0
+    with pytest.raises(RuntimeError):
+        seqfindr.screen_genomes(genomes, args, False)
+    assert parsed == ['s1.xml', 's2.xml', 's3.xml']
+    # Only the unfinished genome is screened again
+    expected = [('s1', ['geneA']), ('s2', ['geneA']), ('s3', ['geneA'])]
+    assert seqfindr.screen_genomes(genomes, args, False) == expected
+    assert parsed[3:] == ['s3.xml']
+    # Not for a consensus run, changed queries or --no_resume
+    seqfindr.screen_genomes(genomes[:1], args, True)
+    assert parsed[4:] == ['s1.xml']
+    args.no_resume = True
+    assert seqfindr.screen_genomes(genomes, args, False) == expected
+    assert parsed[5:] == ['s1.xml', 's2.xml', 's3.xml']
+
+
+def test_session_rescreen(tmpdir, monkeypatch):
+    """
+    Test the Session class screens every genome again once a run finishes
+
+    Function signature::
+
+        Session.run()
+    """
+    query_file = tmpdir.join("queries.fa")
+    query_file.write(">1, geneA, ann, org [c1]\nACGT\n")
+    assemblies = tmpdir.mkdir("assemblies")
+    for name in ['s1_genome.fa', 's2_genome.fa']:
+        assemblies.join(name).write(">contig\nACGT\n")
+    parsed = []
+
+    def fake_parse(blast_xml, tol, cov, careful, review=None):
+        parsed.append(blast_xml)
+        return ['geneA']
+
+    monkeypatch.setattr(seqfindr, 'build_genome_database',
+                        lambda subject, args, cons_run:
+                        (subject, os.path.basename(subject).split('_')[0],
+                         'db'))
+    monkeypatch.setattr(seqfindr, 'search_genome',
+                        lambda built, args, cons_run:
+                        (built[0], built[1], built[1] + '.xml'))
+    monkeypatch.setattr(seqfindr.blast, 'parse_BLAST', fake_parse)
+    monkeypatch.setattr(seqfindr.blast, 'blast_version', lambda: 'test')
+    session = seqfindr.Session.create(str(query_file), str(assemblies),
+                                      str(tmpdir.join("out")),
+                                      pipeline_depth=0)
+    for run in range(2):
+        assert session.run().matrix.shape == (2, 1)
+        assert sorted(parsed[run*2:]) == ['s1.xml', 's2.xml']
+
+
+def test_do_run_failed(tmpdir, monkeypatch):
+    """
+    Test the do_run function stops on failed genomes unless --skip_failed
+
+    Function signature::
+
+        do_run(args, data_path, vfs_list, cons_run)
+    """
+    query_file = tmpdir.join("queries.fa")
+    query_file.write(">1, geneA, ann, org [c1]\nACGT\n")
+    assemblies = tmpdir.mkdir("assemblies")
+    for name in ['s1_genome.fa', 's2_genome.fa']:
+        assemblies.join(name).write(">contig\nACGT\n")
+    monkeypatch.setattr(seqfindr, 'screen_genomes',
+                        lambda in_files, args, cons_run:
+                        [('s1', ['geneA']), None])
+    args = seqfindr.build_parser().parse_args([str(query_file),
+                                               str(assemblies)])
+    args.output = str(tmpdir)
+    with pytest.raises(SystemExit):
+        seqfindr.do_run(args, str(assemblies), ['geneA'], False)
+    args.skip_failed = True
+    _, ylab = seqfindr.do_run(args, str(assemblies), ['geneA'], False)
+    assert ylab == ['s1']
+    # Nothing is written when no genome was screened
+    monkeypatch.setattr(seqfindr, 'screen_genomes',
+                        lambda in_files, args, cons_run: [None, None])
+    session = seqfindr.Session(args)
+    with pytest.raises(SystemExit):
+        session.run()
+    assert not tmpdir.join('matrix_store').check()
+
+
+def test_screen_genomes_incremental(tmpdir, monkeypatch):
+    """
+    Test the screen_genomes_incremental function
+
+    Function signature::
+
+        screen_genomes_incremental(in_files, args, cons_run)
+    """
+    tmpdir.mkdir("DBs")
+    monkeypatch.chdir(tmpdir)
+    query_file = tmpdir.join("queries.fa")
+    query_file.write(">1, geneA, ann, org [c1]\nACGT\n"
+                     ">2, geneB, ann, org [c1]\nTTTT\n")
+    genomes = []
+    for name in ['s1_genome.fa', 's2_genome.fa']:
+        genome = tmpdir.join(name)
+        genome.write(">contig\n%s\n" % (name))
+        genomes.append(str(genome))
+    searched = []
+
+    def fake_screen(in_files, args, cons_run):
+        queries = [l.split(',')[1].strip() for l in
+                   open(args.seqs_of_interest) if l.startswith('>')]
+        searched.append((in_files, queries))
+        return [(f.split('/')[-1].split('_')[0], queries) for f in in_files]
+
+    monkeypatch.setattr(seqfindr, 'screen_genomes', fake_screen)
+    monkeypatch.setattr(seqfindr.blast, 'blast_version', lambda: 'test')
+    args = argparse.Namespace(manifest=str(tmpdir.join("manifest.json")),
+                              seqs_of_interest=str(query_file), reftype=None,
+                              tblastx=False, evalue=0.0001, short=False,
+                              tol=0.95, cov=1.0, careful=0,
+                              output=str(tmpdir))
+    results = seqfindr.screen_genomes_incremental(genomes[:1], args, False)
+    assert results == [('s1', ['geneA', 'geneB'])]
+    # Only the new genome is searched
+    results = seqfindr.screen_genomes_incremental(genomes, args, False)
+    assert results == [('s1', ['geneA', 'geneB']), ('s2', ['geneA', 'geneB'])]
+    assert searched[-1] == ([genomes[1]], ['geneA', 'geneB'])
+    # Only the new query is searched
+    query_file.write(">3, geneC, ann, org [c1]\nGGGG\n", mode='a')
+    results = seqfindr.screen_genomes_incremental(genomes, args, False)
+    assert results == [('s1', ['geneA', 'geneB', 'geneC']),
+                       ('s2', ['geneA', 'geneB', 'geneC'])]
+    assert searched[-1] == (genomes, ['geneC'])
+    assert len(searched) == 3
+    # Genomes screened without --review are screened again with it (their
+    # hits to inspect must reach the review file)
+    args.careful = 0.2
+    seqfindr.screen_genomes_incremental(genomes, args, False)
+    args.review = True
+    seqfindr.screen_genomes_incremental(genomes, args, False)
+    assert searched[-1] == (genomes, ['geneA', 'geneB', 'geneC'])
+    assert len(searched) == 5
+
+
+def test_join_matrix_rows():
+    """
+    Test the join_matrix_rows function
+
+    Function signature::
+
+        join_matrix_rows(ass_mat, ass_labels, cons_mat, cons_labels)
+    """
+    ass = np.array([[0.0, 0.5], [0.5, 0.5], [0.0, 0.0]])
+    cons = np.array([[1.0, 1.0], [2.0, 2.0], [3.0, 3.0]])
+    ass_j, cons_j, labels, no_cons, no_ass = seqfindr.join_matrix_rows(
+        ass, ['s1', 's2', 's3'], cons, ['s3', 's4', 's1'])
+    assert labels == ['s1', 's3']
+    assert (ass_j == np.array([[0.0, 0.5], [0.0, 0.0]])).all()
+    assert (cons_j == np.array([[3.0, 3.0], [1.0, 1.0]])).all()
+    assert no_cons == ['s2']
+    assert no_ass == ['s4']
+    # The 2D list version
+    old_ass, old_cons = seqfindr.match_matrix_rows(
+        [['s1', 0.0, 0.5], ['s2', 0.5, 0.5], ['s3', 0.0, 0.0]],
+        [['s3', 1.0, 1.0], ['s4', 2.0, 2.0], ['s1', 3.0, 3.0]])
+    assert old_ass == [[0.0, 0.5], [0.0, 0.0]]
+    assert old_cons == [[3.0, 3.0], [1.0, 1.0]]
+    assert seqfindr.match_matrix_rows([['s1', 0.0]], []) == ([], [])
+
+
+def test_build_matrix_row():
+    """
+    Test the build_matrix_row function
+
+    Function signature::
+
+        build_matrix_row(all_vfs, accepted_hits, score=None)
+    """
+    all_vfs = ['a', 'b', 'c', 'd']
+    assert seqfindr.build_matrix_row(all_vfs, ['c', 'a', 'x']) == \
+        [0.0, 0.5, 0.0, 0.5]
+    assert seqfindr.build_matrix_row(all_vfs, ['b', 'b'], -0.15) == \
+        [0.5, -0.15, 0.5, 0.5]
+    assert seqfindr.build_matrix_row(all_vfs, []) == [0.5] * 4
+    assert seqfindr.strip_id_from_matrix([['s1', 0.0], ['s2', 0.5]]) == \
+        [[0.0], [0.5]]
+
+
+def test_session(tmpdir, monkeypatch):
+    """
+    Test the Session class
+
+    Function signature::
+
+        Session.create(seqs_of_interest, assembly_dir, output_dir, **options)
+    """
+    query_file = tmpdir.join("queries.fa")
+    query_file.write(">1, geneA, ann, org [c1]\nACGT\n"
+                     ">2, geneB, ann, org [c1]\nTTTT\n"
+                     ">3, geneC, ann, org [c2]\nGGGG\n")
+    assemblies = tmpdir.mkdir("assemblies")
+    for name in ['s1_genome.fa', 's2_genome.fa', 's3_genome.fa']:
+        assemblies.join(name).write(">contig\nACGT\n")
+    found = {'s1': ['geneA'], 's2': ['geneA', 'geneC'], 's3': ['geneB']}
+
+    def fake_screen(in_files, args, cons_run):
+        assert args.output.startswith(str(tmpdir))
+        return [(os.path.basename(f).split('_')[0],
+                 found[os.path.basename(f).split('_')[0]])
+                for f in sorted(in_files)]
+
+    monkeypatch.setattr(seqfindr, 'screen_genomes', fake_screen)
+    with pytest.raises(TypeError):
+        seqfindr.Session.create(str(query_file), str(assemblies),
+                                str(tmpdir.join("out")), not_an_option=1)
+    cwd = os.getcwd()
+    results = {}
+
+    def run(name):
+        session = seqfindr.Session.create(str(query_file), str(assemblies),
+                                          str(tmpdir.join(name)),
+                                          no_dendrogram=True,
+                                          large_render=True)
+        result = session.run()
+        session.write(result)
+        results[name] = result
+
+    threads = [threading.Thread(target=run, args=(name,))
+               for name in ['out1', 'out2']]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert os.getcwd() == cwd
+    for name in ['out1', 'out2']:
+        result = results[name]
+        assert result.matrix.shape == (3, 3)
+        assert sorted(result.strain_labels) == ['s1', 's2', 's3']
+        assert result.query_list == ['geneA', 'geneB', 'geneC']
+        assert result.query_classes == ['c1', 'c1', 'c2']
+        assert 'screen_assemblies' in result.timings
+        scores = dict(zip(result.strain_labels, result.matrix.scores()))
+        assert list(scores['s2']) == [-0.15, 0.5, -0.15]
+        for out in ['matrix.csv', 'results.png', 'matrix_store', 'DBs']:
+            assert tmpdir.join(name, out).check()
+        assert not tmpdir.join(name, 'dendrogram.png').check()
+
+
+def test_merge(tmpdir, monkeypatch):
+    """
+    Test the merged shards of a run match a single run
+
+    Function signature::
+
+        merge(store_paths, output_dir)
+    """
+    query_file = tmpdir.join("queries.fa")
+    query_file.write(">1, geneA, ann, org [c1]\nACGT\n"
+                     ">2, geneB, ann, org [c1]\nTTTT\n"
+                     ">3, geneC, ann, org [c2]\nGGGG\n")
+    assemblies = tmpdir.mkdir("assemblies")
+    found = {'s1': ['geneA'], 's2': ['geneA', 'geneC'], 's3': ['geneB'],
+             's4': ['geneA'], 's5': ['geneB', 'geneC']}
+    for strain in found:
+        assemblies.join(strain + "_genome.fa").write(">contig\nACGT\n")
+
+    def fake_screen(in_files, args, cons_run):
+        return [(os.path.basename(f).split('_')[0],
+                 found[os.path.basename(f).split('_')[0]]) for f in in_files]
+
+    monkeypatch.setattr(seqfindr, 'screen_genomes', fake_screen)
+
+    def run(name, **options):
+        session = seqfindr.Session.create(str(query_file), str(assemblies),
+                                          str(tmpdir.join(name)),
+                                          no_dendrogram=True,
+                                          large_render=True, **options)
+        result = session.run()
+        session.write(result)
+        return result
+
+    single = run('single')
+    shards = [run('shard%i' % (idx), shard=(idx, 2)) for idx in [1, 2]]
+    assert sum([len(result.strain_labels) for result in shards]) == 5
+    assert not tmpdir.join('shard1', 'results.png').check()
+    merged = seqfindr.merge([str(tmpdir.join('shard2')),
+                             str(tmpdir.join('shard1'))],
+                            str(tmpdir.join('merged')))
+    assert list(merged.strain_labels) == list(single.strain_labels)
+    assert (merged.matrix.scores() == single.matrix.scores()).all()
+    for out in ['matrix.csv', 'results.png', 'matrix_store']:
+        assert tmpdir.join('merged', out).check()
+
+
+def test_strip_bases(tmpdir):
+    """
+    Test the strip_bases function
+
+    Function signature::
+
+        strip_bases(args)
+    """
+    import gzip
+    cons = tmpdir.mkdir("cons")
+    for name in ['s1_cons.fa', 's2_cons.fa', 's3_cons.fa']:
+        cons.join(name).write(">contig\nNNACGTACGTNN\n")
+    with gzip.open(str(cons.join('s4_cons.fa.gz')), 'wb') as fout:
+        fout.write(">contig\nNNTTTTNN\n")
+    query_file = tmpdir.join("queries.fa")
+    query_file.write(">1, geneA, ann, org [c1]\nNNACGTNN\n")
+    out = tmpdir.mkdir("out")
+
+    def strip(jobs):
+        args = argparse.Namespace(cons=str(cons), output=str(out), strip=2,
+                                  seqs_of_interest=str(query_file),
+                                  jobs=jobs)
+        return seqfindr.strip_bases(args)
+
+    args = strip(2)
+    assert args.cons == str(out.join("stripped"))
+    assert args.seqs_of_interest == str(out.join("queries_trimmed.fa"))
+    assert sorted(os.listdir(args.cons)) == [
+        '.strip_state.json', 's1_cons.fa', 's2_cons.fa', 's3_cons.fa',
+        's4_cons.fa']
+    assert out.join("stripped", "s1_cons.fa").read() == ">contig\nACGTACGT\n"
+    assert out.join("stripped", "s4_cons.fa").read() == ">contig\nTTTT\n"
+    assert out.join("queries_trimmed.fa").read() == \
+        ">1, geneA, ann, org [c1]\nACGT\n"
+    # Up to date outputs are kept, changed inputs redone & stale removed
+    out.join("stripped", "s1_cons.fa").write("kept")
+    cons.join("s2_cons.fa").write(">contig\nNNGGGGGGNN\n")
+    cons.join("s3_cons.fa").remove()
+    strip(1)
+    assert out.join("stripped", "s1_cons.fa").read() == "kept"
+    assert out.join("stripped", "s2_cons.fa").read() == ">contig\nGGGGGG\n"
+    assert not out.join("stripped", "s3_cons.fa").check()
+
+
+def test_lazy_imports():
+    """
+    Test importing SeqFindr & printing the help skip the heavy dependencies
+
+    matplotlib, scipy & Biopython must only be imported by the stages that
+    need them (see tests/benchmarks/bench_startup.py for timings)
+    """
+    package = os.path.abspath(os.path.join(os.path.dirname(__file__),
+                                           '..', '..'))
+    code = ("import sys; sys.path.insert(0, %r); "
+            "from SeqFindr import seqfindr, vfdb_to_seqfindr, "
+            "seqfindr_replot; "
+            "print(' '.join(sorted(set(m.split('.')[0] for m in sys.modules "
+            "if sys.modules[m]) & set(['matplotlib', 'scipy', 'Bio']))))"
+            % (package))
+    out = subprocess.check_output([sys.executable, '-c', code])
+    assert out.strip() == ''
+    env = dict(os.environ, PYTHONPATH=package)
+    out = subprocess.check_output([sys.executable, '-v',
+                                   os.path.join(package, 'SeqFindr',
+                                                'seqfindr.py'), '--help'],
+                                  stderr=subprocess.STDOUT, env=env)
+    for module in ['matplotlib', 'scipy', 'Bio']:
+        assert 'import %s ' % (module) not in out
+
+
+def test_start_review(tmpdir, monkeypatch):
+    """
+    Test the start_review function only keeps the review file when resuming
+
+    Function signature::
+
+        start_review(args)
+    """
+    query_file = tmpdir.join("queries.fa")
+    query_file.write(">1, geneA, ann, org [c1]\nACGT\n")
+    genome = tmpdir.join("s1_genome.fa")
+    genome.write(">contig\nACGT\n")
+    monkeypatch.setattr(seqfindr.blast, 'blast_version', lambda: 'test')
+    args = seqfindr.build_parser().parse_args([str(query_file),
+                                               str(tmpdir)])
+    args.output = str(tmpdir)
+    args.careful, args.review = 0.2, True
+    path = tmpdir.join(review.REVIEW_NAME)
+    jrnl_path = str(tmpdir.join(journal.JOURNAL_NAME))
+    # The journal of a run with other cut-offs
+    args.tol = 0.9
+    journal.Journal(jrnl_path, journal.run_key(
+        args, 'test')).record(str(genome), False, 's1', [])
+    args.tol = 0.95
+    path.write("review")
+    seqfindr.start_review(args)
+    assert not path.check()
+    # An interrupted run of the same command
+    jrnl = journal.Journal(jrnl_path, journal.run_key(args, 'test'))
+    jrnl.record(str(genome), False, 's1', [])
+    path.write("review")
+    seqfindr.start_review(args)
+    assert path.check()
+    # A finished run
+    jrnl.complete()
+    seqfindr.start_review(args)
+    assert not path.check()
+
+
+def test_apply_review(tmpdir, monkeypatch):
+    """
+    Test the decisions of a --review run give the accepted hits
+
+    Function signature::
+
+        apply_review(store_path, decisions_file, output_dir)
+    """
+    query_file = tmpdir.join("queries.fa")
+    query_file.write(">1, geneA, ann, org [c1]\nACGT\n"
+                     ">2, geneB, ann, org [c1]\nTTTT\n"
+                     ">3, geneC, ann, org [c2]\nGGGG\n")
+    assemblies = tmpdir.mkdir("assemblies")
+    found = {'s1': ['geneA'], 's2': ['geneA', 'geneC'], 's3': ['geneB']}
+    borderline = {'s1': ['geneB', 'geneC'], 's3': ['geneA']}
+    for strain in found:
+        assemblies.join(strain + "_genome.fa").write(">contig\nACGT\n")
+
+    def fake_screen(in_files, args, cons_run):
+        results = []
+        for fasta_file in in_files:
+            strain_id = os.path.basename(fasta_file).split('_')[0]
+            seqfindr.record_review(args, strain_id, cons_run, [
+                (name, 0.9, 100, 100, 90, 0)
+                for name in borderline.get(strain_id, [])])
+            results.append((strain_id, found[strain_id]))
+        return results
+
+    monkeypatch.setattr(seqfindr, 'screen_genomes', fake_screen)
+    session = seqfindr.Session.create(str(query_file), str(assemblies),
+                                      str(tmpdir.join('run')),
+                                      no_dendrogram=True, large_render=True,
+                                      careful=0.2, review=True)
+    session.write(session.run())
+    lines = tmpdir.join('run', review.REVIEW_NAME).read().splitlines()
+    assert len(lines) == 4
+    decisions = tmpdir.join('decisions.tsv')
+    decisions.write('\n'.join([lines[0] + '\tdecision'] +
+                              [line + '\t' + ('y' if 'geneC' in line else 'n')
+                               for line in lines[1:]]))
+    result = seqfindr.apply_review(str(tmpdir.join('run')), str(decisions),
+                                   str(tmpdir.join('reviewed')))
+    rows = dict(zip(result.strain_labels, result.matrix.scores().tolist()))
+    found['s1'].append('geneC')
+    monkeypatch.setattr(seqfindr, 'screen_genomes', lambda in_files, args,
+                        cons_run: [(os.path.basename(f).split('_')[0],
+                                    found[os.path.basename(f).split('_')[0]])
+                                   for f in in_files])
+    expected = seqfindr.Session.create(str(query_file), str(assemblies),
+                                       str(tmpdir.join('expected')),
+                                       no_dendrogram=True).run()
+    assert rows == dict(zip(expected.strain_labels,
+                            expected.matrix.scores().tolist()))
+    assert tmpdir.join('reviewed', 'results.png').check()
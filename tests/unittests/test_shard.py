@@ -0,0 +1,69 @@
+from context import shard
+from context import store
+from context import hitmatrix
+from context import pytest
+import argparse
+import numpy as np
+
+
+def test_parse_shard():
+    """
+    Test the parse_shard function
+
+    Function signature::
+
+        parse_shard(value)
+    """
+    assert shard.parse_shard('2/8') == (2, 8)
+    assert shard.parse_shard('1/1') == (1, 1)
+    for value in ['0/4', '5/4', '1/0', '2', 'a/b']:
+        with pytest.raises(argparse.ArgumentTypeError):
+            shard.parse_shard(value)
+
+
+def test_select():
+    """
+    Test the select function splits genomes independent of the input order
+
+    Function signature::
+
+        select(in_files, shard)
+    """
+    in_files = ['/d/s%i_asm.fa' % (idx) for idx in [5, 2, 9, 1, 7, 3, 8]]
+    shards = [shard.select(in_files, (idx, 3)) for idx in [1, 2, 3]]
+    assert sorted(sum(shards, [])) == sorted(in_files)
+    assert shards[0] == ['/d/s5_asm.fa', '/d/s9_asm.fa', '/d/s1_asm.fa']
+    assert shard.select(in_files[::-1], (1, 3)) == shards[0][::-1]
+
+
+def test_merge_stores(tmpdir):
+    """
+    Test the merge_stores function restores the single run row order
+
+    Function signature::
+
+        merge_stores(paths)
+    """
+    order = ['s1', 's2', 's3', 's4']
+    queries = ['geneA', 'geneB']
+    hits = {'s1': ['geneA'], 's2': [], 's3': ['geneB'], 's4': ['geneA']}
+    paths = []
+    for idx, labels in [(1, ['s3', 's1']), (2, ['s4', 's2'])]:
+        matrix = hitmatrix.HitMatrix(2, hitmatrix.pack_hits(
+            queries, [hits[label] for label in labels]))
+        params = shard.shard_params({'tol': 0.95}, (idx, 2), order)
+        path = str(tmpdir.join('shard%i' % (idx)))
+        store.save_matrix(path, matrix, labels, queries, ['c1', 'c1'],
+                          params)
+        paths.append(path)
+    matrix, labels, query_list, classes, params = \
+        shard.merge_stores(paths[::-1])
+    assert labels == order
+    assert query_list == queries
+    assert params == {'tol': 0.95}
+    expected = hitmatrix.pack_hits(queries, [hits[label] for label in order])
+    assert np.array_equal(matrix.assembly, expected)
+    with pytest.raises(ValueError):
+        shard.merge_stores(paths[:1])
+    with pytest.raises(ValueError):
+        shard.merge_stores([paths[0], paths[0]])
@@ -0,0 +1,38 @@
+from context import store
+from context import hitmatrix
+import argparse
+import numpy as np
+
+
+def test_save_load_matrix(tmpdir):
+    """
+    Test a stored matrix loads back (memory-mapped) with its labels
+
+    Function signature::
+
+        save_matrix(path, matrix, strain_labels, query_list, query_classes,
+                    params)
+    """
+    ass = np.packbits(np.random.RandomState(1).rand(3, 10) < 0.5, axis=1)
+    cons = np.packbits(np.random.RandomState(2).rand(3, 10) < 0.5, axis=1)
+    matrix = hitmatrix.HitMatrix(10, ass, cons)
+    args = argparse.Namespace(tol=0.95, cons='/data/cons', func=len)
+    params = store.run_params(args)
+    assert params == {'tol': 0.95, 'cons': '/data/cons'}
+    path = str(tmpdir.join(store.STORE_NAME))
+    labels, queries = ['s1', 's2', 's3'], ['q%i' % i for i in range(10)]
+    classes = ['Toxin'] * 4 + ['Fe transporter'] * 6
+    store.save_matrix(path, matrix, labels, queries, classes, params)
+    # Saving again replaces the store
+    store.save_matrix(path, matrix, labels, queries, classes, params)
+    loaded, l_labels, l_queries, l_classes, l_params = \
+        store.load_matrix(path)
+    assert isinstance(loaded.assembly, np.memmap)
+    assert (loaded.scores() == matrix.scores()).all()
+    assert (l_labels, l_queries, l_classes) == (labels, queries, classes)
+    assert l_params == params
+    single = hitmatrix.HitMatrix(10, ass)
+    store.save_matrix(path, single, labels, queries, classes, params)
+    loaded = store.load_matrix(path, mmap=False)[0]
+    assert loaded.consensus is None
+    assert (loaded.scores() == single.scores()).all()
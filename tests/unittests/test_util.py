@@ -1,5 +1,6 @@
 from context import util
 from context import pytest
+import os
 
 
 def test_del_from_list():
@@ -44,3 +45,150 @@ def test_del_from_list():
     del_me = [10]
     ret = util.del_from_list(test5, del_me)
     assert ret == [0, 1, 2, 3, 4, 5, 6, 7, 8, 9]
+
+
+def test_read_query_database(tmpdir):
+    """
+    Test the read_query_database & get_query_database functions
+
+    Function signature::
+
+        read_query_database(database_file)
+    """
+    db = tmpdir.join("queries.fa")
+    db.write(">1, geneA, ann, org [c1]\nACGTRYKM\nacgtn-NNNN\n"
+             ">2, geneB, ann, org [c1]\n\nTTTT\n"
+             ">3, geneC, ann, org [c2]\nGGGG\n")
+    database = util.read_query_database(str(db))
+    assert database.query_list == ['geneA', 'geneB', 'geneC']
+    assert database.query_classes == ['c1', 'c1', 'c2']
+    assert database.duplicates == []
+    assert database.grouped
+    assert not database.protein
+    # Cached until the file changes
+    cached = util.get_query_database(str(db))
+    assert util.get_query_database(str(db)) is cached
+    db.write(">1, geneA, ann, org [c1]\nMKLVE\n"
+             ">2, geneB, ann, org [c2]\nACGT\n"
+             ">3, geneA, ann, org [c1]\nACGT\n"
+             ">4, geneA, ann, org [c1]\nACGT\n")
+    database = util.get_query_database(str(db))
+    assert database is not cached
+    assert database.duplicates == ['geneA']
+    assert not database.grouped
+    assert database.protein
+    with pytest.raises(SystemExit):
+        util.check_database(str(db))
+    # Badly formatted
+    db.write(">1, geneA ann, org [c1]\nACGT\n")
+    with pytest.raises(Exception):
+        util.read_query_database(str(db))
+    db.write("ACGT\n")
+    with pytest.raises(Exception):
+        util.read_query_database(str(db))
+    # Read straight from a compressed database
+    import gzip
+    compressed = str(tmpdir.join("queries.fa.gz"))
+    with gzip.open(compressed, 'wb') as fout:
+        fout.write(">1, geneA, ann, org [c1]\nMKLVE\n")
+    database = util.read_query_database(compressed)
+    assert database.query_list == ['geneA']
+    assert database.protein
+
+
+def test_is_protein_line(tmpdir):
+    """
+    Test the is_protein_line function
+
+    Function signature::
+
+        is_protein_line(line)
+    """
+    assert not util.is_protein_line("ACGTURYSWKMBDHVN-acgtn\n")
+    assert util.is_protein_line("ACGTLACGT\n")
+    assert util.is_protein_line("MKVLE*\n")
+    db = tmpdir.join("seqs.fa")
+    db.write(">1, n1, ann, org [c1]\nNNRYACGT\n>2, n2, ann, org [c1]\nacgt\n")
+    assert not util.read_query_database(str(db)).protein
+    db.write(">1, n1, ann, org [c1]\nACGT\nACGF\n>2, n2, ann, org [c1]\n"
+             "ACGT\n")
+    assert util.read_query_database(str(db)).protein
+
+
+def test_is_protein(tmpdir):
+    """
+    Test the is_protein function
+
+    Function signature::
+
+        is_protein(fasta_file)
+    """
+    fasta = tmpdir.join("seqs.fa")
+    fasta.write(">n1\nNNRYACGT\n>n2\nacgt\n")
+    assert util.is_protein(str(fasta)) == -1
+    fasta.write(">p1\nACGT\nACGF\n>n1\nACGT\n>p2\nMKVLE\nPQ\n")
+    assert util.is_protein(str(fasta)) == 1
+
+
+def test_trim_fasta_file(tmpdir):
+    """
+    Test the trim_fasta_file function (plain & gzip input)
+
+    Function signature::
+
+        trim_fasta_file(fasta_file, out_file, strip)
+    """
+    import gzip
+    seq = 'AAAA' + 'C' * 120 + 'GGGG'
+    text = ">r1 desc\n%s\n%s\n>r2\nACGTACGT\n" % (seq[:70], seq[70:])
+    plain = tmpdir.join("s1.fa")
+    plain.write(text)
+    with gzip.open(str(tmpdir.join("s2.fa.gz")), 'wb') as fout:
+        fout.write(text)
+    tmpdir.join("notes.txt").write("x")
+    assert sorted(util.get_fasta_files(str(tmpdir), compressed=False)) == \
+        [str(plain)]
+    assert sorted(util.get_fasta_files(str(tmpdir))) == \
+        [str(plain), str(tmpdir.join("s2.fa.gz"))]
+    expected = ">r1 desc\n%s\n%s\n>r2\n" % ('C' * 60, 'C' * 60)
+    for name in ["s1.fa", "s2.fa.gz"]:
+        out = str(tmpdir.join("out.fa"))
+        util.trim_fasta_file(str(tmpdir.join(name)), out, 4)
+        assert open(out).read() == expected
+    util.trim_fasta_file(str(plain), out, 0)
+    assert open(out).read() == ">r1 desc\n%s\n%s\n%s\n>r2\nACGTACGT\n" % (
+        seq[:60], seq[60:120], seq[120:])
+
+
+def test_init_output_dirs(tmpdir):
+    """
+    Test the init_output_dirs function creates the make_output_dirs layout
+
+    Function signature::
+
+        init_output_dirs(output_dir)
+    """
+    cwd = os.getcwd()
+    out = tmpdir.join("out")
+    assert util.make_output_dirs(str(out)) == str(out)
+    assert sorted(os.listdir(str(out))) == ['BLAST_results', 'DBs']
+    try:
+        assert util.init_output_dirs(str(tmpdir.join("chdir"))) == cwd
+        assert os.getcwd() == str(tmpdir.join("chdir"))
+        assert sorted(os.listdir('.')) == ['BLAST_results', 'DBs']
+    finally:
+        os.chdir(cwd)
+
+
+def test_get_fasta_files(tmpdir):
+    """
+    Test the get_fasta_files function (plain & compressed copy)
+
+    Function signature::
+
+        get_fasta_files(data_path, compressed=True)
+    """
+    for name in ["s1.fa", "s1.fa.gz", "s2.fna.gz", "s3.fas"]:
+        tmpdir.join(name).write("")
+    assert sorted(util.get_fasta_files(str(tmpdir))) == \
+        [str(tmpdir.join(name)) for name in ["s1.fa", "s2.fna.gz", "s3.fas"]]